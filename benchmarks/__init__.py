@@ -0,0 +1,6 @@
+"""
+Benchmarks for the web-dsl compiler pipeline.
+
+Run a benchmark as a module from the repository root, e.g.:
+    python -m benchmarks.bench_model_index
+"""
@@ -0,0 +1,58 @@
+"""
+Measures how build_model scales with the size of the model.
+With a single indexing pass in model_proc, the time per model object should
+stay roughly constant across the sweep (i.e. build time grows linearly).
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+
+from web_dsl.language import build_model, get_metamodel
+from web_dsl.model_index import ModelIndex
+
+from .synthetic import synthesize_model
+
+
+def time_build(model_path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            model = build_model(model_path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return model, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Build the metamodel up front so it does not skew the first measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_metamodel()
+
+    print(f"{'scale':>6} {'objects':>9} {'build (s)':>10} {'us/object':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for scale in args.scales:
+            model_path = synthesize_model(
+                f"{tmp_dir}/scale{scale}",
+                entities=10 * scale,
+                components=40 * scale,
+                screens=5 * scale,
+            )
+            model, elapsed = time_build(model_path, args.repeat)
+            objects = len(ModelIndex.from_model(model))
+            print(
+                f"{scale:>6} {objects:>9} {elapsed:>10.3f} "
+                f"{elapsed / objects * 1e6:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Measures the compiler pipeline (parse, model processing, validation and
+generation) and the peak RSS across a sweep of synthetic model sizes.
+
+Every size is measured in a fresh interpreter, so the peak RSS of a size is
+not inflated by the sizes before it. The results can be written as JSON and
+compared against a stored baseline, e.g.:
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+METRICS = ("parse", "model_proc", "validate", "generate", "total", "peak_rss_mb")
+
+
+def model_sizes(scale, args):
+    return {
+        "entities": 10 * scale,
+        "components": 40 * scale,
+        "screens": 5 * scale,
+        "files": args.files,
+        "nesting": args.nesting,
+        "conditions": args.conditions,
+        "repetitions": args.repetitions,
+    }
+
+
+def phase_wall(stats, name):
+    """Total wall time of every phase called name in a profile tree."""
+    if stats.name == name:
+        return stats.wall
+    return sum(phase_wall(child, name) for child in stats.children.values())
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def measure(sizes, repeat):
+    """Generates a synthetic model of the given sizes, keeps the best run."""
+    from web_dsl.generate import generate
+    from web_dsl.language import build_model, get_metamodel
+    from web_dsl.model_index import ModelIndex
+    from web_dsl.profiling import Profiler
+
+    from .synthetic import synthesize_model
+
+    # Build the metamodel up front so it does not skew the first measurement
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_metamodel()
+
+    best = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path = synthesize_model(os.path.join(tmp_dir, "model"), **sizes)
+        for run in range(repeat):
+            # Memory tracing would distort the timings, RSS is measured instead
+            profiler = Profiler(trace_memory=False)
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()), profiler:
+                generate(
+                    model_path,
+                    os.path.join(tmp_dir, f"gen{run}"),
+                    use_cache=False,
+                    jobs=1,
+                )
+            total = time.perf_counter() - start
+            root = profiler.root
+            model_proc = phase_wall(root, "model_proc")
+            timings = {
+                "parse": phase_wall(root, "parse") - model_proc,
+                "model_proc": model_proc,
+                "validate": phase_wall(root, "validate"),
+                "generate": total - phase_wall(root, "build model"),
+                "total": total,
+            }
+            for name, seconds in timings.items():
+                best[name] = min(best.get(name, seconds), seconds)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            objects = len(ModelIndex.from_model(build_model(model_path)))
+
+    result = {name: round(seconds, 4) for name, seconds in best.items()}
+    result["peak_rss_mb"] = peak_rss_mb()
+    result["objects"] = objects
+    return result
+
+
+def format_value(value):
+    if value is None:
+        return f"{'-':>11}"
+    if isinstance(value, int):
+        return f"{value:>11}"
+    return f"{value:>11.3f}"
+
+
+def measure_in_subprocess(sizes, repeat):
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_pipeline",
+            "--measure",
+            json.dumps(sizes),
+            "--repeat",
+            str(repeat),
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every metric relative to the baseline result of the
+    same sizes. Returns the number of metrics that got slower (or bigger) by
+    more than tolerance.
+    """
+    baseline_results = {
+        json.dumps(r["sizes"], sort_keys=True): r for r in baseline["results"]
+    }
+    regressions = 0
+    print(f"\ncompared to baseline (tolerance {tolerance:.0%}):")
+    for result in results:
+        key = json.dumps(result["sizes"], sort_keys=True)
+        base = baseline_results.get(key)
+        if base is None:
+            print(f"{result['scale']:>6}  no baseline for these sizes")
+            continue
+        changes = []
+        for metric in METRICS:
+            new, old = result.get(metric), base.get(metric)
+            if not new or not old:
+                continue
+            ratio = new / old
+            flag = ""
+            if ratio > 1 + tolerance:
+                flag = " REGRESSION"
+                regressions += 1
+            changes.append(f"{metric} {ratio - 1:+.0%}{flag}")
+        print(f"{result['scale']:>6}  " + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--files", type=int, default=1)
+    parser.add_argument("--nesting", type=int, default=2)
+    parser.add_argument("--conditions", type=int, default=2)
+    parser.add_argument("--repetitions", type=int, default=2)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Child process of a sweep: measure one size and report it as JSON
+        print(json.dumps(measure(json.loads(args.measure), args.repeat)))
+        return
+
+    header = ("scale", "objects", *METRICS)
+    print(" ".join(f"{h:>11}" for h in header))
+    results = []
+    for scale in args.scales:
+        sizes = model_sizes(scale, args)
+        result = {"scale": scale, "sizes": sizes}
+        result.update(measure_in_subprocess(sizes, args.repeat))
+        results.append(result)
+        print(" ".join(format_value(result.get(h)) for h in header))
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
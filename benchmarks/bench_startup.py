@@ -0,0 +1,62 @@
+"""
+Measures the startup cost of the webdsl CLI.
+Every sample runs in a fresh interpreter, so nothing is shared between runs.
+The import overhead of `web_dsl.cli.cli` (everything `webdsl --help` and
+`webdsl validate` pay before doing any work) should stay below the target.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+CLI_MODULE = "web_dsl.cli.cli"
+
+
+def import_time_ms(module):
+    """Cumulative import time of module as reported by -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    for line in reversed(result.stderr.splitlines()):
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) / 1e3
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def help_wall_ms():
+    """Wall time of a complete `webdsl --help` run."""
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", f"from {CLI_MODULE} import main; main()", "--help"],
+        capture_output=True,
+        check=True,
+    )
+    return (time.perf_counter() - start) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--target-ms", type=float, default=150.0)
+    args = parser.parse_args()
+
+    imports = [import_time_ms(CLI_MODULE) for _ in range(args.repeat)]
+    helps = [help_wall_ms() for _ in range(args.repeat)]
+    import_ms = statistics.median(imports)
+
+    print(f"import {CLI_MODULE}: {import_ms:8.1f} ms (median)")
+    print(f"webdsl --help:        {statistics.median(helps):8.1f} ms (median)")
+    status = "OK" if import_ms <= args.target_ms else "OVER TARGET"
+    print(f"target:               {args.target_ms:8.1f} ms -> {status}")
+    if import_ms > args.target_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import os
+import textwrap
+
+WEBPAGE_HEADER = """Webpage Synthetic
+    author: "web-dsl benchmarks"
+    version: "1.0"
+    description: "Synthetic model used for benchmarking"
+    navbar: Screen0
+
+    API backendAPI
+        host: "0.0.0.0"
+        port: 8321
+    end
+"""
+
+FOOTER = "end\n"
+
+
+def _rest_api():
+    return """
+    RESTApi SyntheticAPI
+        host: "http://localhost:9000"
+    end
+"""
+
+
+def _endpoint(i):
+    return f"""
+    RESTEndpoint Endpoint{i}
+        connection: SyntheticAPI
+        path: "/items/{i}"
+    end
+"""
+
+
+def _entity(i):
+    return f"""
+    Entity Entity{i}
+        source: Endpoint{i}
+        attributes:
+            - value: float
+            - label: str
+            - items: list
+    end
+"""
+
+
+def _overloading_entity(i):
+    return f"""
+    Entity Entity{i}Live overloads Entity{i}
+        interval: 1000
+    end
+"""
+
+
+def _component(i, entity):
+    return f"""
+    Component Component{i}
+        entity: Entity{entity}
+        type: Gauge
+            value: this.value
+            description: "Component {i}"
+    end
+"""
+
+
+def _nested(lines, depth):
+    """Wraps lines in depth - 1 nested row/col pairs."""
+    for _ in range(depth - 1):
+        lines = ["row", "    col", *("        " + line for line in lines)]
+        lines += ["    endcol", "endrow"]
+    return lines
+
+
+def _screen(s, component_ids, entities, nesting=1, conditions=1, repetitions=1):
+    body = _nested([f"use Component{c}" for c in component_ids], nesting)
+    row = ["row", "    col", *("        " + line for line in body), "    endcol"]
+    for c in range(conditions):
+        entity = entities[(s + c) % len(entities)]
+        row += [
+            f"    if Entity{entity}.value > {10 + c}",
+            f"        use Component{component_ids[c % len(component_ids)]}",
+        ]
+    for r in range(repetitions):
+        entity = entities[(s + r) % len(entities)]
+        row += [f"    for item in Entity{entity}.items", "        use Text with item"]
+    row.append("endrow")
+    elements = textwrap.indent("\n".join(row), " " * 8)
+    return f"""
+    Screen Screen{s}
+        title: "Screen {s}"
+        url: "/screen{s}"
+
+{elements}
+    end
+"""
+
+
+def _split(parts, files):
+    """Splits parts into `files` contiguous chunks of about the same size."""
+    size, extra = divmod(len(parts), files)
+    chunks = []
+    start = 0
+    for f in range(files):
+        end = start + size + (1 if f < extra else 0)
+        chunks.append(parts[start:end])
+        start = end
+    return chunks
+
+
+def synthesize_model(
+    directory,
+    entities=10,
+    components=20,
+    screens=5,
+    overloads=0,
+    files=1,
+    nesting=1,
+    conditions=1,
+    repetitions=1,
+):
+    """
+    Writes a synthetic model to directory and returns the path of its main
+    file. Components are spread over the entities and the screens
+    round-robin. The first `overloads` entities are overloaded by an
+    `Entity<i>Live`. Every screen nests its components in `nesting` levels
+    of rows/columns, followed by `conditions` conditions and `repetitions`
+    repetitions.
+
+    With files > 1, the elements are split over main.wdsl and part<n>.wdsl
+    files, where every file imports the next one. Elements are ordered so
+    that they only reference elements of the same or a later file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    entity_ids = list(range(entities))
+    screen_parts = []
+    for s in range(screens):
+        component_ids = list(range(s, components, screens)) or [0]
+        screen_parts.append(
+            _screen(s, component_ids, entity_ids, nesting, conditions, repetitions)
+        )
+    component_parts = [_component(i, i % entities) for i in range(components)]
+    # An overloading entity follows the entity it overloads, in the same file
+    entity_parts = [
+        _entity(i) + (_overloading_entity(i) if i < overloads else "")
+        for i in entity_ids
+    ]
+    connection_parts = [_endpoint(i) for i in entity_ids]
+
+    if files <= 1:
+        parts = [WEBPAGE_HEADER, _rest_api(), *connection_parts, *entity_parts]
+        parts += [*component_parts, *screen_parts, FOOTER]
+        return _write(directory, "main.wdsl", "".join(parts))
+
+    # Ordered so that every element only references later elements
+    parts = [*screen_parts, *component_parts, *entity_parts, *connection_parts]
+    parts.append(_rest_api())
+    file_names = ["main.wdsl"] + [f"part{n}.wdsl" for n in range(1, files)]
+    for n, chunk in enumerate(_split(parts, files)):
+        imports = f"import {file_names[n + 1]}\n" if n + 1 < files else ""
+        if n == 0:
+            body = WEBPAGE_HEADER + "".join(chunk) + FOOTER
+        else:
+            body = textwrap.dedent("".join(chunk))
+        _write(directory, file_names[n], imports + body)
+    return os.path.join(directory, file_names[0])
+
+
+def _write(directory, file_name, content):
+    path = os.path.join(directory, file_name)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
@@ -2,7 +2,9 @@
 # -*- coding: utf-8 -*-
 import sys
 import os
+import subprocess
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 THIS_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -42,7 +44,23 @@ if sys.argv[-1].startswith("publish"):
     sys.exit()
 
 
+class BuildPyCommand(build_py):
+    """Precompiles the Jinja2 templates into the built package."""
+
+    def run(self):
+        super().run()
+        target = os.path.join(self.build_lib, "web_dsl", "templates", "compiled")
+        script = (
+            "import sys; from web_dsl.templating import compile_templates; "
+            "compile_templates(sys.argv[1])"
+        )
+        result = subprocess.run([sys.executable, "-c", script, target], cwd=THIS_DIR)
+        if result.returncode != 0:
+            print("Could not precompile the templates, they are compiled at runtime.")
+
+
 setup(
+    cmdclass={"build_py": BuildPyCommand},
     keywords="webdsl, domain-specific language, web application, web development",
     name="webdsl",
     packages=find_packages(include=["web_dsl", "web_dsl.*"]),
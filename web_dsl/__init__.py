@@ -8,4 +8,12 @@ __version__ = "0.1.0"
 
 from .language import web_dsl_language, get_metamodel
 from .generate import generate
-from .m2m.openapi_to_webdsl import transform_openapi_to_webdsl
+
+
+def __getattr__(name):
+    # The transformation pulls in fastapi and yaml, so it is imported on demand
+    if name == "transform_openapi_to_webdsl":
+        from .m2m.openapi_to_webdsl import transform_openapi_to_webdsl
+
+        return transform_openapi_to_webdsl
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -4,9 +4,14 @@ from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
-from .database import init_db
-from .config import TMP_DIR
-from .routers import validation, generation, deployment, transformations
+from .database import init_db, db_pool
+from .config import TMP_DIR, TARBALL_STORE_DIR, TARBALL_STORE_TTL
+from .janitor import janitor
+from .workers import worker_pool
+from .utils import close_ssh_connections
+from .jobs import job_queue
+from .deployments import deployment_queue
+from .routers import validation, generation, jobs, deployment, transformations
 
 load_dotenv()
 ROOT_PATH = os.getenv("ROOT_PATH", "")
@@ -18,9 +23,23 @@ async def lifespan(app: FastAPI):
     await init_db()
     os.makedirs(TMP_DIR, exist_ok=True)
     print("Application startup: Database initialized")
+    # Files left by a previous run expire like new ones
+    janitor.adopt(TMP_DIR, skip=[TARBALL_STORE_DIR])
+    janitor.adopt(TARBALL_STORE_DIR, ttl=TARBALL_STORE_TTL)
+    janitor.start()
+    await worker_pool.start()
+    print(f"Application startup: {worker_pool.processes} workers started")
+    await job_queue.start()
+    await deployment_queue.start()
     yield
-    # Code to run on shutdown (e.g., close a global connection pool if you had one)
+    # Code to run on shutdown
     print("Application shutdown: Cleaning up...")
+    await deployment_queue.stop()
+    close_ssh_connections()
+    await job_queue.stop()
+    await janitor.stop()
+    worker_pool.shutdown()
+    await db_pool.close()
 
 
 app = FastAPI(lifespan=lifespan, root_path=ROOT_PATH)
@@ -35,5 +54,6 @@ app.add_middleware(
 
 app.include_router(validation.router)
 app.include_router(generation.router)
+app.include_router(jobs.router)
 app.include_router(deployment.router)
 app.include_router(transformations.router)
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from fastapi.security import APIKeyHeader
 from fastapi import HTTPException, status, Security
 from dotenv import load_dotenv
@@ -10,12 +11,58 @@ API_KEY = os.getenv("API_KEY", "API_KEY")
 api_keys = [API_KEY]
 api_key_header = APIKeyHeader(name="X-API-Key")
 CLEANUP_THRESHOLD = 60 * 15  # 15m in seconds
+# Total size of the temporary files before the oldest are removed early, and
+# seconds between two sweeps of the janitor
+TMP_DIR_QUOTA_MB = float(os.getenv("TMP_DIR_QUOTA_MB", "1024"))
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", "30"))
 VM_MACHINE_IP = os.getenv("VM_MACHINE_IP", "")
 VM_MACHINE_USER = os.getenv("VM_MACHINE_USER", "")
 VM_MACHINE_SSH_PORT = os.getenv("VM_MACHINE_SSH_PORT", "22")
 # SSH_KEY_PATH = "/root/.ssh/id_ed25519"  # Path to the private key in the container
 SSH_KEY_PATH = os.getenv("VM_MACHINE_SSH_KEY_PATH")
 VM_MACHINE_DOMAIN = os.getenv("VM_MACHINE_DOMAIN", "")
+# Worker processes for validation, generation and transformations, jobs that
+# may wait for a worker before new ones get 429, and the seconds a job may run
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+WORKER_QUEUE_LIMIT = int(os.getenv("WORKER_QUEUE_LIMIT", "16"))
+WORKER_JOB_TIMEOUT = float(os.getenv("WORKER_JOB_TIMEOUT", "120"))
+# Validation outcomes kept in memory, and where and for how many seconds
+# generated archives are kept for identical models
+VALIDATION_CACHE_SIZE = int(os.getenv("VALIDATION_CACHE_SIZE", "256"))
+TARBALL_STORE_DIR = os.getenv("TARBALL_STORE_DIR", os.path.join(TMP_DIR, "tarballs"))
+TARBALL_STORE_TTL = float(os.getenv("TARBALL_STORE_TTL", CLEANUP_THRESHOLD))
+# Generation jobs: dispatchers feeding them to the worker pool, seconds between
+# checks for jobs submitted by other API processes, and where and for how many
+# seconds the archives of finished jobs are kept
+JOB_DISPATCHERS = int(os.getenv("JOB_DISPATCHERS", WORKER_PROCESSES))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_ARTIFACT_DIR = os.getenv("JOB_ARTIFACT_DIR", "./job_artifacts/")
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 60 * 60 * 24))  # 1 day
+# Seconds an API process holds a claimed job or deployment without renewing
+# it, after which other processes consider it stopped and queue it again
+CLAIM_LEASE = float(os.getenv("CLAIM_LEASE", "60"))
+# Deployments run at the same time, attempts of a deployment that fails on the
+# VM, and seconds before the first retry, doubled for every further one
+DEPLOYMENT_WORKERS = int(os.getenv("DEPLOYMENT_WORKERS", "2"))
+DEPLOYMENT_MAX_ATTEMPTS = int(os.getenv("DEPLOYMENT_MAX_ATTEMPTS", "3"))
+DEPLOYMENT_RETRY_BACKOFF = float(os.getenv("DEPLOYMENT_RETRY_BACKOFF", "30"))
+# Content-addressed store of deployed files on the VM, so that files already
+# uploaded by a previous deployment are not sent again, and days its files
+# are kept after they were uploaded
+REMOTE_STORE_DIR = os.getenv("REMOTE_STORE_DIR", "/tmp/webdsl-store")
+REMOTE_STORE_RETENTION_DAYS = int(os.getenv("REMOTE_STORE_RETENTION_DAYS", "30"))
+# Commands to the VM share SSH_CONTROL_CONNECTIONS persistent connections,
+# closed after SSH_CONTROL_PERSIST idle seconds (0 connects for every
+# command), and checked with a keepalive every SSH_KEEPALIVE_INTERVAL seconds
+SSH_CONTROL_DIR = os.getenv(
+    "SSH_CONTROL_DIR", os.path.join(tempfile.gettempdir(), "webdsl-ssh")
+)
+SSH_CONTROL_CONNECTIONS = int(os.getenv("SSH_CONTROL_CONNECTIONS", "4"))
+SSH_CONTROL_PERSIST = int(os.getenv("SSH_CONTROL_PERSIST", "600"))
+SSH_KEEPALIVE_INTERVAL = int(os.getenv("SSH_KEEPALIVE_INTERVAL", "15"))
+# Connections to the API database, and seconds a write waits for another one
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", "5"))
 
 
 def get_api_key(api_key_header: str = Security(api_key_header)) -> str:
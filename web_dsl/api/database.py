@@ -1,22 +1,96 @@
 import aiosqlite
+import asyncio
+from contextlib import asynccontextmanager
 from datetime import datetime
+import json
 import os
-from typing import List, Optional
+from typing import Dict, List, Optional
+
+from .config import DB_BUSY_TIMEOUT, DB_POOL_SIZE
 
 DATABASE_FILE = "deployments.db"  # Store in current dir
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATABASE_URL = os.path.join(BASE_DIR, DATABASE_FILE)
 
 
+class ConnectionPool:
+    """
+    A fixed set of long-lived connections to the database, lent to one
+    request or task at a time. Opened on first use, closed on shutdown.
+
+    Connections use WAL, so reads never wait for a write, and wait up to
+    busy_timeout seconds for the lock of another writer instead of failing.
+    sqlite3 keeps the prepared statements of a connection, so they are
+    reused for as long as the pool lives.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, busy_timeout=DB_BUSY_TIMEOUT):
+        self.size = size
+        self.busy_timeout = busy_timeout
+        self._connections = []
+        self._idle = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(DATABASE_URL, timeout=self.busy_timeout)
+        conn.row_factory = aiosqlite.Row
+        await conn.execute("PRAGMA journal_mode = WAL")
+        # Durable across crashes of the API in WAL mode, syncs less often
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    async def open(self):
+        async with self._lock:
+            if self._idle is not None:
+                return
+            idle = asyncio.Queue()
+            for _ in range(self.size):
+                conn = await self._connect()
+                self._connections.append(conn)
+                idle.put_nowait(conn)
+            self._idle = idle
+
+    async def close(self):
+        async with self._lock:
+            connections, self._connections = self._connections, []
+            self._idle = None
+            for conn in connections:
+                await conn.close()
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Lends a connection, waiting for one if all of them are in use."""
+        if self._idle is None:
+            await self.open()
+        idle = self._idle
+        conn = await idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                await conn.rollback()
+            idle.put_nowait(conn)
+
+
+db_pool = ConnectionPool()
+
+
 async def get_db_connection():
-    conn = await aiosqlite.connect(DATABASE_URL)
-    conn.row_factory = aiosqlite.Row
-    return conn
+    async with db_pool.acquire() as conn:
+        yield conn
+
+
+async def _add_columns(db, table, columns):
+    """Adds the (name, definition) columns that a table from an older version lacks."""
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        existing = {row["name"] for row in await cursor.fetchall()}
+    for name, definition in columns:
+        if name not in existing:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
 
 
 async def init_db():
-    # Use 'async with' for connection management
-    async with aiosqlite.connect(DATABASE_URL) as db:
+    async with db_pool.acquire() as db:
         await db.execute(
             """
         CREATE TABLE IF NOT EXISTS deployments (
@@ -38,24 +112,90 @@ async def init_db():
         )
         """
         )
+        # updated_at is set by every update, the trigger that used to set it
+        # again doubled the writes
+        await db.execute("DROP TRIGGER IF EXISTS update_deployments_updated_at")
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_user_id ON deployments (user_id)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_status ON deployments (status)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_is_public ON deployments (is_public)"
+        )
+        # Listings are sorted by creation
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_user_id_created_at "
+            "ON deployments (user_id, created_at)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_created_at ON deployments (created_at)"
+        )
         await db.execute(
             """
-        CREATE TRIGGER IF NOT EXISTS update_deployments_updated_at
-        AFTER UPDATE ON deployments
-        FOR EACH ROW
-        BEGIN
-            UPDATE deployments SET updated_at = CURRENT_TIMESTAMP WHERE id = OLD.id;
-        END;
+        CREATE TABLE IF NOT EXISTS generation_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_uid TEXT UNIQUE NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            priority INTEGER NOT NULL DEFAULT 0,
+            model_key TEXT NOT NULL,
+            main_filename TEXT NOT NULL,
+            model_files TEXT NOT NULL,
+            artifact_path TEXT,
+            error_message TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            claimed_by TEXT,
+            lease_expires_at TIMESTAMP
+        )
         """
         )
+        await _add_columns(
+            db,
+            "generation_jobs",
+            [("claimed_by", "TEXT"), ("lease_expires_at", "TIMESTAMP")],
+        )
         await db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_user_id ON deployments (user_id)"
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_queue "
+            "ON generation_jobs (status, priority DESC, id)"
         )
         await db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_status ON deployments (status)"
+            "CREATE INDEX IF NOT EXISTS idx_generation_jobs_finished_at "
+            "ON generation_jobs (finished_at)"
         )
         await db.execute(
-            "CREATE INDEX IF NOT EXISTS idx_is_public ON deployments (is_public)"
+            """
+        CREATE TABLE IF NOT EXISTS deployment_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deployment_uid TEXT UNIQUE NOT NULL,
+            user_id TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'queued',
+            main_filename TEXT NOT NULL,
+            model_files TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            claimed_by TEXT,
+            lease_expires_at TIMESTAMP
+        )
+        """
+        )
+        await _add_columns(
+            db,
+            "deployment_queue",
+            [("claimed_by", "TEXT"), ("lease_expires_at", "TIMESTAMP")],
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deployment_queue_next "
+            "ON deployment_queue (status, next_attempt_at)"
+        )
+        await db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_deployment_queue_user "
+            "ON deployment_queue (user_id, status)"
         )
         await db.commit()
     print(f"Database initialized at {DATABASE_URL}")
@@ -69,10 +209,12 @@ async def db_create_deployment_record(
     deployment_uid: str,
     user_id: str,
     is_public: bool,
-    model_dir_local: str,
+    model_dir_local: Optional[str],
     gen_dir_local: str,
     remote_dir_vm: str,
     docker_project_name: str,
+    app_username: Optional[str] = None,
+    app_password: Optional[str] = None,
 ) -> int:  # Returns lastrowid
     now = datetime.now()
     async with conn.cursor() as cursor:
@@ -80,8 +222,9 @@ async def db_create_deployment_record(
             """
             INSERT INTO deployments (deployment_uid, user_id, is_public, status,
                                      model_dir_local, gen_dir_local, remote_dir_vm,
-                                     docker_project_name, created_at, updated_at)
-            VALUES (?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?)
+                                     docker_project_name, app_username,
+                                     app_password, created_at, updated_at)
+            VALUES (?, ?, ?, 'pending', ?, ?, ?, ?, ?, ?, ?, ?)
         """,
             (
                 deployment_uid,
@@ -91,6 +234,8 @@ async def db_create_deployment_record(
                 gen_dir_local,
                 remote_dir_vm,
                 docker_project_name,
+                app_username,
+                app_password,
                 now,
                 now,
             ),
@@ -180,3 +325,306 @@ async def db_delete_deployment_by_uid(
         "DELETE FROM deployments WHERE deployment_uid = ?", (deployment_uid,)
     )
     await conn.commit()
+
+
+# ======= Deployment Queue ========
+
+
+async def db_enqueue_deployment(
+    conn: aiosqlite.Connection,
+    deployment_uid: str,
+    user_id: str,
+    main_filename: str,
+    model_files: Dict[str, str],
+) -> None:
+    now = datetime.now()
+    await conn.execute(
+        """
+        INSERT INTO deployment_queue (deployment_uid, user_id, status, main_filename,
+                                      model_files, next_attempt_at,
+                                      created_at, updated_at)
+        VALUES (?, ?, 'queued', ?, ?, ?, ?, ?)
+    """,
+        (
+            deployment_uid,
+            user_id,
+            main_filename,
+            json.dumps(model_files),
+            now,
+            now,
+            now,
+        ),
+    )
+    await conn.commit()
+
+
+async def db_claim_next_deployment(
+    conn: aiosqlite.Connection, owner: str, lease_expires_at: datetime
+) -> Optional[aiosqlite.Row]:
+    """
+    Marks the next queued deployment that is due as running, claimed by
+    owner until lease_expires_at, counts the attempt and returns it, None if
+    no deployment is due. Users with fewer running deployments go first, then
+    the oldest deployment. A deployment claimed by another worker in the
+    meantime is skipped.
+    """
+    while True:
+        now = datetime.now()
+        async with conn.execute(
+            """
+            SELECT * FROM deployment_queue AS q
+            WHERE status = 'queued' AND next_attempt_at <= ?
+            ORDER BY (SELECT COUNT(*) FROM deployment_queue AS r
+                      WHERE r.user_id = q.user_id AND r.status = 'running'), id
+            LIMIT 1
+        """,
+            (now,),
+        ) as cursor:
+            deployment = await cursor.fetchone()
+        if deployment is None:
+            return None
+        async with conn.execute(
+            "UPDATE deployment_queue SET status = 'running', "
+            "attempts = attempts + 1, claimed_by = ?, lease_expires_at = ?, "
+            "updated_at = ? WHERE id = ? AND status = 'queued'",
+            (owner, lease_expires_at, now, deployment["id"]),
+        ) as cursor:
+            claimed = cursor.rowcount == 1
+        await conn.commit()
+        if claimed:
+            return deployment
+
+
+async def db_retry_deployment(
+    conn: aiosqlite.Connection,
+    deployment_uid: str,
+    next_attempt_at: datetime,
+    count_attempt: bool = True,
+) -> None:
+    """
+    Queues a claimed deployment again, without count_attempt the attempt
+    counted by its claim is taken back.
+    """
+    query = "UPDATE deployment_queue SET status = 'queued', next_attempt_at = ?, "
+    if not count_attempt:
+        query += "attempts = attempts - 1, "
+    query += "updated_at = ? WHERE deployment_uid = ?"
+    await conn.execute(query, (next_attempt_at, datetime.now(), deployment_uid))
+    await conn.commit()
+
+
+async def db_renew_deployment_claim(
+    conn: aiosqlite.Connection,
+    deployment_uid: str,
+    owner: str,
+    lease_expires_at: datetime,
+) -> bool:
+    """Extends the claim of owner on a running deployment, False if it lost it."""
+    async with conn.execute(
+        "UPDATE deployment_queue SET lease_expires_at = ? "
+        "WHERE deployment_uid = ? AND status = 'running' AND claimed_by = ?",
+        (lease_expires_at, deployment_uid, owner),
+    ) as cursor:
+        renewed = cursor.rowcount == 1
+    await conn.commit()
+    return renewed
+
+
+async def db_requeue_running_deployments(
+    conn: aiosqlite.Connection, owner: Optional[str] = None
+) -> int:
+    """
+    Puts running deployments whose claim expired back in the queue, and with
+    owner also those claimed by owner, i.e. by an earlier run of the process.
+    """
+    now = datetime.now()
+    async with conn.execute(
+        "UPDATE deployment_queue SET status = 'queued', claimed_by = NULL, "
+        "lease_expires_at = NULL, updated_at = ? "
+        "WHERE status = 'running' AND (claimed_by = ? "
+        "OR lease_expires_at IS NULL OR lease_expires_at < ?)",
+        (now, owner, now),
+    ) as cursor:
+        requeued = cursor.rowcount
+    await conn.commit()
+    return requeued
+
+
+async def db_dequeue_deployment(
+    conn: aiosqlite.Connection, deployment_uid: str, queued_only: bool = False
+) -> bool:
+    """
+    Removes a deployment from the queue, with queued_only only if it has not
+    started yet. Returns whether it was removed.
+    """
+    query = "DELETE FROM deployment_queue WHERE deployment_uid = ?"
+    if queued_only:
+        query += " AND status = 'queued'"
+    async with conn.execute(query, (deployment_uid,)) as cursor:
+        removed = cursor.rowcount == 1
+    await conn.commit()
+    return removed
+
+
+# ======= Generation Jobs ========
+
+
+async def db_create_generation_job(
+    conn: aiosqlite.Connection,
+    job_uid: str,
+    model_key: str,
+    main_filename: str,
+    model_files: Dict[str, str],
+    priority: int = 0,
+) -> int:  # Returns lastrowid
+    now = datetime.now()
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            """
+            INSERT INTO generation_jobs (job_uid, status, priority, model_key,
+                                         main_filename, model_files,
+                                         created_at, updated_at)
+            VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                job_uid,
+                priority,
+                model_key,
+                main_filename,
+                json.dumps(model_files),
+                now,
+                now,
+            ),
+        )
+        await conn.commit()
+        return cursor.lastrowid
+
+
+async def db_claim_next_generation_job(
+    conn: aiosqlite.Connection, owner: str, lease_expires_at: datetime
+) -> Optional[aiosqlite.Row]:
+    """
+    Marks the queued job with the highest priority (the oldest among equals)
+    as running, claimed by owner until lease_expires_at, and returns it, None
+    if no job is queued. Safe to call from several dispatchers and processes:
+    a job claimed by another one in the meantime is skipped.
+    """
+    while True:
+        async with conn.execute(
+            "SELECT * FROM generation_jobs WHERE status = 'queued' "
+            "ORDER BY priority DESC, id LIMIT 1"
+        ) as cursor:
+            job = await cursor.fetchone()
+        if job is None:
+            return None
+        now = datetime.now()
+        async with conn.execute(
+            "UPDATE generation_jobs SET status = 'running', started_at = ?, "
+            "claimed_by = ?, lease_expires_at = ?, updated_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (now, owner, lease_expires_at, now, job["id"]),
+        ) as cursor:
+            claimed = cursor.rowcount == 1
+        await conn.commit()
+        if claimed:
+            return job
+
+
+async def db_update_generation_job_status(
+    conn: aiosqlite.Connection,
+    job_uid: str,
+    status: str,
+    artifact_path: Optional[str] = None,
+    error_message: Optional[str] = None,
+):
+    now = datetime.now()
+    query_parts = ["status = ?", "updated_at = ?"]
+    params = [status, now]
+
+    if status in ("done", "failed"):
+        query_parts.append("finished_at = ?")
+        params.append(now)
+    if artifact_path is not None:
+        query_parts.append("artifact_path = ?")
+        params.append(artifact_path)
+    if error_message is not None:
+        query_parts.append("error_message = ?")
+        params.append(error_message)
+
+    query = f"UPDATE generation_jobs SET {', '.join(query_parts)} WHERE job_uid = ?"
+    params.append(job_uid)
+
+    await conn.execute(query, tuple(params))
+    await conn.commit()
+
+
+async def db_renew_generation_job_claim(
+    conn: aiosqlite.Connection,
+    job_uid: str,
+    owner: str,
+    lease_expires_at: datetime,
+) -> bool:
+    """Extends the claim of owner on a running job, False if it lost the claim."""
+    async with conn.execute(
+        "UPDATE generation_jobs SET lease_expires_at = ? "
+        "WHERE job_uid = ? AND status = 'running' AND claimed_by = ?",
+        (lease_expires_at, job_uid, owner),
+    ) as cursor:
+        renewed = cursor.rowcount == 1
+    await conn.commit()
+    return renewed
+
+
+async def db_requeue_running_generation_jobs(
+    conn: aiosqlite.Connection, owner: Optional[str] = None
+) -> int:
+    """
+    Puts running jobs whose claim expired back in the queue, and with owner
+    also those claimed by owner, i.e. by an earlier run of the same process.
+    """
+    now = datetime.now()
+    async with conn.execute(
+        "UPDATE generation_jobs SET status = 'queued', started_at = NULL, "
+        "claimed_by = NULL, lease_expires_at = NULL, updated_at = ? "
+        "WHERE status = 'running' AND (claimed_by = ? "
+        "OR lease_expires_at IS NULL OR lease_expires_at < ?)",
+        (now, owner, now),
+    ) as cursor:
+        requeued = cursor.rowcount
+    await conn.commit()
+    return requeued
+
+
+async def db_get_generation_job_by_uid(
+    conn: aiosqlite.Connection, job_uid: str
+) -> Optional[aiosqlite.Row]:
+    async with conn.execute(
+        "SELECT * FROM generation_jobs WHERE job_uid = ?", (job_uid,)
+    ) as cursor:
+        return await cursor.fetchone()
+
+
+async def db_get_queue_position(conn: aiosqlite.Connection, job) -> int:
+    """Returns the number of queued jobs that run before a queued job."""
+    async with conn.execute(
+        "SELECT COUNT(*) FROM generation_jobs WHERE status = 'queued' "
+        "AND (priority > ? OR (priority = ? AND id < ?))",
+        (job["priority"], job["priority"], job["id"]),
+    ) as cursor:
+        return (await cursor.fetchone())[0]
+
+
+async def db_get_finished_generation_jobs(
+    conn: aiosqlite.Connection, finished_before: datetime
+) -> List[aiosqlite.Row]:
+    async with conn.execute(
+        "SELECT * FROM generation_jobs WHERE finished_at < ?", (finished_before,)
+    ) as cursor:
+        return await cursor.fetchall()
+
+
+async def db_delete_generation_job_by_uid(
+    conn: aiosqlite.Connection, job_uid: str
+) -> None:
+    await conn.execute("DELETE FROM generation_jobs WHERE job_uid = ?", (job_uid,))
+    await conn.commit()
@@ -0,0 +1,280 @@
+import asyncio
+import functools
+import json
+import traceback
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+
+from web_dsl.generate import generate
+from web_dsl.output import DirectoryOutput
+
+from .config import (
+    CLAIM_LEASE,
+    DEPLOYMENT_MAX_ATTEMPTS,
+    DEPLOYMENT_RETRY_BACKOFF,
+    DEPLOYMENT_WORKERS,
+    JOB_POLL_INTERVAL,
+    VM_MACHINE_IP,
+    VM_MACHINE_USER,
+)
+from .database import (
+    db_claim_next_deployment,
+    db_dequeue_deployment,
+    db_get_deployment_by_uid,
+    db_pool,
+    db_renew_deployment_claim,
+    db_requeue_running_deployments,
+    db_retry_deployment,
+    db_update_deployment_status,
+)
+from .janitor import janitor
+from .jobs import claim_owner, renewing_claim
+from .transfer import SSHTransport, TransferError, upload_tree
+from .utils import (
+    CapturedSSHResult,
+    postprocess_generation_for_deployment,
+    run_remote_ssh_command_capture,
+)
+from .workers import worker_pool
+
+
+class DeploymentError(Exception):
+    """A step of a deployment failed, retry tells if trying again may help."""
+
+    def __init__(self, message, retry=False):
+        super().__init__(message)
+        self.retry = retry
+
+
+def generate_deployment_job(model_path, gen_path, files):
+    """Worker job that generates the application of a deployment."""
+    output = DirectoryOutput(gen_path, incremental=False)
+    return generate(model_path, gen_path, jobs=1, output=output, files=files)
+
+
+async def deploy(deployment, main_filename, files, transport=None):
+    """
+    Generates the application of a deployment record from its model files,
+    uploads it to the VM through transport (see upload_tree) and starts it.
+    Returns the URL of the application.
+
+    The generated application is pinned while the deployment uses it, and
+    expires from the end of the deployment, so retries can reuse it.
+    """
+    gen_dir_local = deployment["gen_dir_local"]
+    with janitor.pinned(gen_dir_local):
+        try:
+            return await _deploy(deployment, main_filename, files, transport)
+        finally:
+            janitor.track(gen_dir_local)
+
+
+async def _deploy(deployment, main_filename, files, transport):
+    uid = deployment["deployment_uid"]
+    remote_dir_vm = deployment["remote_dir_vm"]
+    docker_project_name = deployment["docker_project_name"]
+
+    generated_app_path = await worker_pool.run(
+        generate_deployment_job, main_filename, deployment["gen_dir_local"], files
+    )
+    await run_in_threadpool(
+        postprocess_generation_for_deployment,
+        generation_dir=generated_app_path,
+        uid=uid,
+        VM_MACHINE_IP=VM_MACHINE_IP,
+        VM_MACHINE_USER=VM_MACHINE_USER,
+        username=deployment["app_username"],
+        password=deployment["app_password"],
+        public_deployment=bool(deployment["is_public"]),
+    )
+
+    try:
+        stats = await run_in_threadpool(
+            upload_tree, generated_app_path, remote_dir_vm, transport
+        )
+    except TransferError as e:
+        raise DeploymentError(str(e), retry=True)
+    print(f"Uploaded {uid}: sent {stats.sent} of {stats.files} files")
+
+    deploy_cmd = (
+        f"cd {remote_dir_vm} && docker compose -p {docker_project_name} up --build -d"
+    )
+    ssh_deploy_res: CapturedSSHResult = await run_in_threadpool(
+        run_remote_ssh_command_capture, deploy_cmd, timeout=300
+    )
+    if ssh_deploy_res.returncode != 0:
+        logs_cmd = (
+            f"cd {remote_dir_vm} && docker compose -p {docker_project_name} "
+            "logs --tail=50"
+        )
+        logs_res: CapturedSSHResult = await run_in_threadpool(
+            run_remote_ssh_command_capture, logs_cmd, timeout=30
+        )
+        raise DeploymentError(
+            f"Compose fail! Code:{ssh_deploy_res.returncode}. "
+            f"Err:{ssh_deploy_res.stderr}. Out:{ssh_deploy_res.stdout}. "
+            f"Logs:{logs_res.stdout} {logs_res.stderr}",
+            retry=True,
+        )
+
+    return f"http://{VM_MACHINE_IP}/apps/{uid}/"
+
+
+class DeploymentQueue:
+    """
+    Runs the deployments queued in the database, at most `workers` at a
+    time so that a burst of deployments does not overload the VM or the
+    API. Users with fewer running deployments go first.
+
+    A deployment that fails on the VM is tried again after retry_backoff
+    seconds, doubled for every further attempt, up to max_attempts times.
+    Errors of the model fail it right away.
+
+    Like generation jobs, a deployment is claimed for `lease` seconds and
+    the claim renewed while it runs. Deployments of a stopped API process
+    are queued again once their claim expires, or on start by the same
+    process.
+    """
+
+    def __init__(
+        self,
+        workers=DEPLOYMENT_WORKERS,
+        max_attempts=DEPLOYMENT_MAX_ATTEMPTS,
+        retry_backoff=DEPLOYMENT_RETRY_BACKOFF,
+        poll_interval=JOB_POLL_INTERVAL,
+        transport=None,
+        lease=CLAIM_LEASE,
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.poll_interval = poll_interval
+        self.transport = transport or SSHTransport()
+        self.lease = lease
+        self.owner = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        self.owner = claim_owner()
+        await self._requeue_interrupted(self.owner)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._requeue_expired()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Tells the workers that a deployment was queued."""
+        self._wakeup.set()
+
+    async def _requeue_interrupted(self, owner=None):
+        async with db_pool.acquire() as conn:
+            requeued = await db_requeue_running_deployments(conn, owner)
+        if requeued:
+            print(f"Requeued {requeued} interrupted deployments")
+            self.notify()
+
+    async def _requeue_expired(self):
+        # Deployments of API processes that stopped without coming back
+        while True:
+            await asyncio.sleep(self.lease)
+            try:
+                await self._requeue_interrupted()
+            except Exception:
+                traceback.print_exc()
+
+    async def _renew_claim(self, uid, lease_expires_at):
+        async with db_pool.acquire() as conn:
+            await db_renew_deployment_claim(conn, uid, self.owner, lease_expires_at)
+
+    async def _work(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                lease_expires_at = datetime.now() + timedelta(seconds=self.lease)
+                async with db_pool.acquire() as conn:
+                    queued = await db_claim_next_deployment(
+                        conn, self.owner, lease_expires_at
+                    )
+                if queued is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(queued)
+            except Exception:
+                # E.g. the database is locked, the worker must go on
+                traceback.print_exc()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _run(self, queued):
+        uid = queued["deployment_uid"]
+        attempt = queued["attempts"] + 1
+        async with db_pool.acquire() as conn:
+            deployment = await db_get_deployment_by_uid(conn, uid)
+            if deployment is None or deployment["status"] != "pending":
+                # Killed or removed while it was queued
+                await db_dequeue_deployment(conn, uid)
+                return
+
+        renew = functools.partial(self._renew_claim, uid)
+        try:
+            async with renewing_claim(renew, self.lease):
+                url = await deploy(
+                    deployment,
+                    queued["main_filename"],
+                    json.loads(queued["model_files"]),
+                    self.transport,
+                )
+        except Exception as e:
+            if isinstance(e, HTTPException) and e.status_code == 429:
+                # The worker pool is busy with requests, try again later
+                # without counting an attempt
+                async with db_pool.acquire() as conn:
+                    await db_retry_deployment(
+                        conn, uid, datetime.now(), count_attempt=False
+                    )
+                await asyncio.sleep(self.poll_interval)
+                return
+            if isinstance(e, DeploymentError):
+                error, retry = str(e), e.retry
+            elif isinstance(e, HTTPException):
+                # The generation timed out
+                error, retry = e.detail, False
+            else:
+                traceback.print_exc()
+                error, retry = f"Deploy fail in background: {e}", False
+
+            async with db_pool.acquire() as conn:
+                if retry and attempt < self.max_attempts:
+                    delay = self.retry_backoff * 2 ** (attempt - 1)
+                    await db_retry_deployment(
+                        conn, uid, datetime.now() + timedelta(seconds=delay)
+                    )
+                    await db_update_deployment_status(
+                        conn,
+                        uid,
+                        "pending",
+                        error_message=f"Attempt {attempt} failed, retrying in "
+                        f"{delay:g}s. {error}",
+                    )
+                else:
+                    await db_dequeue_deployment(conn, uid)
+                    await db_update_deployment_status(
+                        conn, uid, "failed", error_message=error
+                    )
+            return
+
+        async with db_pool.acquire() as conn:
+            await db_dequeue_deployment(conn, uid)
+            await db_update_deployment_status(conn, uid, "running", url=url)
+
+
+deployment_queue = DeploymentQueue()
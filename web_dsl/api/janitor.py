@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import heapq
+import itertools
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi.responses import FileResponse
+
+from .config import CLEANUP_THRESHOLD, JANITOR_INTERVAL, TMP_DIR_QUOTA_MB
+
+
+def _disk_usage(path):
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+    except OSError:
+        return 0
+
+
+def _remove(path):
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        print(f"Error cleaning up {path}: {e}")
+
+
+class TempJanitor:
+    """
+    Removes the temporary files and directories of the API once they
+    expire. Every one of them is registered with track() when it is created,
+    in an index ordered by expiry, so the janitor never scans TMP_DIR and
+    requests only pay for the registration.
+
+    A background task sweeps the index every `interval` seconds: it measures
+    the newly tracked entries, removes the expired ones, and removes the
+    entries closest to expiry (the oldest, for a common TTL) while the
+    tracked entries take more than quota_mb.
+
+    Paths in use (e.g. an archive being sent or a directory being uploaded)
+    are pinned, and the janitor leaves them until they are unpinned. Pinning
+    never waits for the janitor: an entry is renamed out of the way under the
+    lock that pins take before it is deleted, so a path pinned once that
+    happened no longer exists, and one pinned before is not removed.
+    """
+
+    def __init__(
+        self,
+        ttl=CLEANUP_THRESHOLD,
+        quota_mb=TMP_DIR_QUOTA_MB,
+        interval=JANITOR_INTERVAL,
+    ):
+        self.ttl = ttl
+        self.quota = quota_mb * 2**20
+        self.interval = interval
+        self.total_size = 0
+        self._heap = []  # (expires_at, seq, path)
+        self._entries = {}  # path -> [seq, size], size is None until measured
+        self._unmeasured = []
+        self._pins = collections.Counter()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._task = None
+
+    def track(self, path, ttl=None, created_at=None):
+        """
+        Registers a file or directory that expires ttl seconds (by default
+        the janitor's TTL) after created_at (by default now). Tracking a path
+        again replaces its previous expiry, and has it measured again.
+        """
+        created_at = time.time() if created_at is None else created_at
+        expires_at = created_at + (self.ttl if ttl is None else ttl)
+        path = os.path.abspath(path)
+        with self._lock:
+            seq = next(self._counter)
+            previous = self._entries.get(path)
+            self._entries[path] = [seq, None]
+            if previous is None or previous[1] is not None:
+                # Not waiting for its measurement yet
+                self._unmeasured.append(path)
+            if previous is not None and previous[1] is not None:
+                self.total_size -= previous[1]
+            heapq.heappush(self._heap, (expires_at, seq, path))
+
+    def pin(self, path):
+        """
+        Keeps the janitor from removing path until unpin(path), pins of a
+        path are counted. A path may be pinned before it is tracked. The path
+        exists after pin() only if the janitor has not removed it.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            self._pins[path] += 1
+
+    def unpin(self, path):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._pins[path] -= 1
+            if self._pins[path] <= 0:
+                del self._pins[path]
+
+    @contextmanager
+    def pinned(self, path):
+        """Pins path for the duration of the block."""
+        self.pin(path)
+        try:
+            yield
+        finally:
+            self.unpin(path)
+
+    def adopt(self, directory, ttl=None, skip=()):
+        """
+        Tracks the entries that already exist in directory (e.g. left by a
+        previous run of the API), by their modification time.
+        """
+        skip = {os.path.abspath(path) for path in skip}
+        try:
+            entries = list(os.scandir(directory))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            if os.path.abspath(entry.path) in skip:
+                continue
+            try:
+                mtime = entry.stat(follow_symlinks=False).st_mtime
+            except OSError:
+                continue
+            self.track(entry.path, ttl=ttl, created_at=mtime)
+
+    def sweep(self, now=None):
+        """Removes expired entries and enforces the quota, returns the count."""
+        now = time.time() if now is None else now
+        with self._lock:
+            unmeasured, self._unmeasured = self._unmeasured, []
+        for path in unmeasured:
+            size = _disk_usage(path)
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry[1] is None:
+                    entry[1] = size
+                    self.total_size += size
+
+        removed = 0
+        in_use = []
+        while True:
+            with self._lock:
+                if not self._heap:
+                    break
+                expires_at, seq, path = self._heap[0]
+                entry = self._entries.get(path)
+                if entry is None or entry[0] != seq:
+                    # Replaced by a later track() of the same path
+                    heapq.heappop(self._heap)
+                    continue
+                if expires_at > now and self.total_size <= self.quota:
+                    break
+                heapq.heappop(self._heap)
+                if path in self._pins:
+                    # Looked at again by the next sweep
+                    in_use.append((expires_at, seq, path))
+                    continue
+                del self._entries[path]
+                self.total_size -= entry[1] or 0
+                # Renaming is atomic, deleting a directory takes a while
+                trash = os.path.join(
+                    os.path.dirname(path), f".{os.path.basename(path)}.removing"
+                )
+                try:
+                    os.rename(path, trash)
+                except FileNotFoundError:
+                    continue
+                except OSError:
+                    trash = path
+            _remove(trash)
+            removed += 1
+        with self._lock:
+            for item in in_use:
+                heapq.heappush(self._heap, item)
+        return removed
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            removed = await asyncio.to_thread(self.sweep)
+            if removed:
+                print(f"Janitor removed {removed} temporary files")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+class PinnedFileResponse(FileResponse):
+    """Sends a file pinned for the response, and unpins it once sent."""
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            janitor.unpin(self.path)
+
+
+janitor = TempJanitor()
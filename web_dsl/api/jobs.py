@@ -0,0 +1,232 @@
+import asyncio
+import functools
+import json
+import os
+import socket
+import traceback
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+
+from web_dsl.generate import generate
+from web_dsl.output import TarOutput
+
+from .config import (
+    CLAIM_LEASE,
+    JOB_ARTIFACT_DIR,
+    JOB_DISPATCHERS,
+    JOB_POLL_INTERVAL,
+    JOB_RETENTION,
+)
+from .database import (
+    db_claim_next_generation_job,
+    db_delete_generation_job_by_uid,
+    db_get_finished_generation_jobs,
+    db_renew_generation_job_claim,
+    db_requeue_running_generation_jobs,
+    db_pool,
+    db_update_generation_job_status,
+)
+from .result_cache import archive_name
+from .workers import worker_pool
+
+# Statuses of jobs that will not change any more
+FINISHED_STATUSES = ("done", "failed")
+
+
+def generate_archive_file_job(model_path, files, arcname, archive_path):
+    """
+    Worker job that generates the project of a model, built from memory out
+    of files, into a .tar.gz file. The file only appears once complete.
+    """
+    tmp_path = f"{archive_path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            generate(
+                model_path,
+                arcname,
+                jobs=1,
+                output=TarOutput(arcname, f),
+                files=files,
+            )
+        os.replace(tmp_path, archive_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def claim_owner():
+    """
+    Names this API process in the claims it holds. Process ids are unique on
+    a host, so claims of this name that the process does not hold were left
+    by an earlier run of it (e.g. in a restarted container).
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@asynccontextmanager
+async def renewing_claim(renew, lease=CLAIM_LEASE):
+    """
+    Calls renew(lease_expires_at) every third of the lease while the block
+    runs, so that the claim it extends does not expire.
+    """
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(lease / 3)
+            try:
+                await renew(datetime.now() + timedelta(seconds=lease))
+            except Exception:
+                traceback.print_exc()
+
+    task = asyncio.create_task(heartbeat())
+    try:
+        yield
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+class GenerationJobQueue:
+    """
+    Runs the generation jobs stored in the database on the worker pool, in
+    order of priority and then of submission, and removes finished jobs and
+    their archives after the retention period.
+
+    Every dispatcher runs one job at a time. Jobs submitted through this
+    process wake the dispatchers up right away (see notify()), jobs of other
+    API processes sharing the database are picked up by polling.
+
+    A dispatcher claims its job for `lease` seconds and renews the claim
+    while the job runs. Jobs of a stopped API process are queued again once
+    their claim expires, or on start by the same process.
+    """
+
+    def __init__(
+        self,
+        dispatchers=JOB_DISPATCHERS,
+        artifact_dir=JOB_ARTIFACT_DIR,
+        retention=JOB_RETENTION,
+        poll_interval=JOB_POLL_INTERVAL,
+        lease=CLAIM_LEASE,
+    ):
+        self.dispatchers = dispatchers
+        self.artifact_dir = artifact_dir
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.owner = None
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+
+    async def start(self):
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        self.owner = claim_owner()
+        await self._requeue_interrupted(self.owner)
+        self._tasks = [
+            asyncio.create_task(self._dispatch()) for _ in range(self.dispatchers)
+        ]
+        self._tasks.append(asyncio.create_task(self._clean_up()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Tells the dispatchers that a job was submitted."""
+        self._wakeup.set()
+
+    def artifact_path(self, job_uid):
+        return os.path.join(self.artifact_dir, f"{job_uid}.tar.gz")
+
+    async def _requeue_interrupted(self, owner=None):
+        async with db_pool.acquire() as conn:
+            requeued = await db_requeue_running_generation_jobs(conn, owner)
+        if requeued:
+            print(f"Requeued {requeued} interrupted generation jobs")
+
+    async def _renew_claim(self, job_uid, lease_expires_at):
+        async with db_pool.acquire() as conn:
+            await db_renew_generation_job_claim(
+                conn, job_uid, self.owner, lease_expires_at
+            )
+
+    async def _dispatch(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                lease_expires_at = datetime.now() + timedelta(seconds=self.lease)
+                async with db_pool.acquire() as conn:
+                    job = await db_claim_next_generation_job(
+                        conn, self.owner, lease_expires_at
+                    )
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run(job)
+            except Exception:
+                # E.g. the database is locked, the dispatcher must go on
+                traceback.print_exc()
+                await asyncio.sleep(self.poll_interval)
+
+    async def _update_status(self, job_uid, status, **fields):
+        async with db_pool.acquire() as conn:
+            await db_update_generation_job_status(conn, job_uid, status, **fields)
+
+    async def _run(self, job):
+        job_uid = job["job_uid"]
+        archive_path = self.artifact_path(job_uid)
+        renew = functools.partial(self._renew_claim, job_uid)
+        try:
+            async with renewing_claim(renew, self.lease):
+                await worker_pool.run(
+                    generate_archive_file_job,
+                    job["main_filename"],
+                    json.loads(job["model_files"]),
+                    f"gen-{archive_name(job['model_key'])}",
+                    archive_path,
+                )
+        except HTTPException as e:
+            if e.status_code == 429:
+                # The pool is busy with requests, try again later
+                await self._update_status(job_uid, "queued")
+                await asyncio.sleep(self.poll_interval)
+                return
+            await self._update_status(job_uid, "failed", error_message=e.detail)
+        except Exception as e:
+            traceback.print_exc()
+            await self._update_status(
+                job_uid, "failed", error_message=f"Transformation error: {e}"
+            )
+        else:
+            await self._update_status(job_uid, "done", artifact_path=archive_path)
+
+    async def _clean_up(self):
+        while True:
+            try:
+                # Jobs of API processes that stopped without coming back
+                await self._requeue_interrupted()
+                finished_before = datetime.now() - timedelta(seconds=self.retention)
+                async with db_pool.acquire() as conn:
+                    for job in await db_get_finished_generation_jobs(
+                        conn, finished_before
+                    ):
+                        if job["artifact_path"]:
+                            try:
+                                os.remove(job["artifact_path"])
+                            except OSError:
+                                pass
+                        await db_delete_generation_job_by_uid(conn, job["job_uid"])
+            except Exception:
+                traceback.print_exc()
+            await asyncio.sleep(min(self.retention, self.lease, 60))
+
+
+job_queue = GenerationJobQueue()
@@ -53,6 +53,32 @@ def format_deployment_response(db_row):
     )
 
 
+class GenerationJobResponse(BaseModel):
+    job_uid: str
+    status: str  # queued, running, done or failed
+    priority: int
+    queue_position: Optional[int] = None  # Queued jobs that run first
+    error_message: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+def format_generation_job_response(db_row, queue_position=None):
+    if db_row is None:
+        return None
+    return GenerationJobResponse(
+        job_uid=db_row["job_uid"],
+        status=db_row["status"],
+        priority=db_row["priority"],
+        queue_position=queue_position,
+        error_message=db_row["error_message"],
+        created_at=db_row["created_at"],
+        started_at=db_row["started_at"],
+        finished_at=db_row["finished_at"],
+    )
+
+
 class UserIDBody(BaseModel):
     user_id: str
 
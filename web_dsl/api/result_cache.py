@@ -0,0 +1,123 @@
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+
+from .config import TARBALL_STORE_DIR, TARBALL_STORE_TTL, VALIDATION_CACHE_SIZE
+from .janitor import janitor
+
+
+def model_key(files, main_filename=None):
+    """
+    Returns the SHA-256 of a submitted model, given as a dict of file name to
+    text, and the name of its main file.
+    """
+    parts = [main_filename or ""]
+    for name, text in sorted(files.items()):
+        parts += [name, text]
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8")
+        # Length-prefixed, so that different splits never hash the same
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def archive_name(key):
+    """Name of the generated archive of a model, derived from its key."""
+    return key[:8]
+
+
+class ValidationCache:
+    """
+    Bounded LRU of validation outcomes by model key. An outcome is either
+    the result of a successful validation or the detail of its error.
+    """
+
+    def __init__(self, maxsize=VALIDATION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._outcomes = OrderedDict()
+
+    def get(self, key):
+        """Returns the (result, error) of a model, None if it is not cached."""
+        outcome = self._outcomes.get(key)
+        if outcome is not None:
+            self._outcomes.move_to_end(key)
+        return outcome
+
+    def put(self, key, result=None, error=None):
+        self._outcomes[key] = (result, error)
+        self._outcomes.move_to_end(key)
+        while len(self._outcomes) > self.maxsize:
+            self._outcomes.popitem(last=False)
+
+
+class _ArchiveWriter:
+    """
+    Writes an archive into a temporary file of the store, which becomes the
+    stored archive once it is complete.
+    """
+
+    def __init__(self, store, key):
+        os.makedirs(store.directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=store.directory, suffix=".part")
+        self.file = os.fdopen(fd, "wb")
+        self.path = store.path(key)
+        self.ttl = store.ttl
+
+    def tee(self, chunks):
+        """Yields the chunks, storing the archive if all of them were read."""
+        complete = False
+        try:
+            for chunk in chunks:
+                self.file.write(chunk)
+                yield chunk
+            complete = True
+        finally:
+            self.file.close()
+            if complete:
+                os.replace(self.tmp_path, self.path)
+                janitor.track(self.path, ttl=self.ttl)
+            else:
+                os.remove(self.tmp_path)
+
+
+class TarballStore:
+    """
+    Content-addressed store of generated archives, as <key>.tar.gz files in
+    directory. An archive is reused for ttl seconds after it was generated,
+    then the janitor removes it.
+    """
+
+    def __init__(self, directory=TARBALL_STORE_DIR, ttl=TARBALL_STORE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.tar.gz")
+
+    def get(self, key):
+        """
+        Returns the path of the archive of a model, None if not stored. The
+        archive is pinned (see TempJanitor.pin()) until the caller unpins it,
+        e.g. by sending it with a PinnedFileResponse.
+        """
+        path = self.path(key)
+        janitor.pin(path)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        if mtime is None or mtime < time.time() - self.ttl:
+            janitor.unpin(path)
+            return None
+        return path
+
+    def writer(self, key):
+        return _ArchiveWriter(self, key)
+
+
+validation_cache = ValidationCache()
+tarball_store = TarballStore()
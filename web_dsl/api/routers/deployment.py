@@ -1,12 +1,10 @@
 import os
 import io
 import traceback
-import subprocess
-from typing import List, Optional
+from typing import Dict, List, Optional
 from fastapi import (
     UploadFile,
     HTTPException,
-    BackgroundTasks,
     File,
     Security,
     Form,
@@ -20,8 +18,6 @@ import aiosqlite
 
 from ..utils import (
     get_unique_id,
-    save_upload_file,
-    postprocess_generation_for_deployment,
     run_remote_ssh_command_capture,
     generate_credentials,
     CapturedSSHResult,
@@ -29,22 +25,20 @@ from ..utils import (
 from ..database import (
     get_db_connection,
     db_create_deployment_record,
+    db_enqueue_deployment,
+    db_dequeue_deployment,
     db_update_deployment_status,
     db_get_deployment_by_uid,
     db_get_deployments_by_user_id,
     db_get_public_deployments,
     db_get_all_deployments,
 )
-from web_dsl.generate import generate
 from ..config import (
     get_api_key,
     TMP_DIR,
-    VM_MACHINE_IP,
-    VM_MACHINE_USER,
-    VM_MACHINE_SSH_PORT,
-    SSH_KEY_PATH,
     VM_MACHINE_DOMAIN
 )
+from ..deployments import deployment_queue
 from ..models import (
     DeploymentDetailResponse,
     UserIDBody,  # May not be needed if user_id is in path or query
@@ -55,118 +49,25 @@ from ..models import (
     # DeploymentCreateBody,  # New model for creation
     # StartDeploymentBody,  # New model for start action requiring user_id
 )
+from .generation import read_model_files
 
 router = APIRouter(prefix="/deploy")
 
-async def run_deployment(
+async def queue_deployment(
     conn: aiosqlite.Connection,
-    uid: str,
-    model_str: str,
-    model_dir_local: str,
-    gen_dir_local: str,
-    remote_dir_vm: str,
-    docker_project_name: str,
+    user_id: str,
     is_public: bool,
-    app_username: str,
-    app_password: str,
+    main_filename: str,
+    files: Dict[str, str],
 ):
     """
-    This function contains the long-running deployment logic and will be run as a background task.
+    Records a pending deployment of a model and queues it for the
+    deployment workers, which generate it and start it on the VM.
     """
-    try:
-        main_model_path = os.path.join(model_dir_local, f"model-{uid}.wdsl")
-
-        with open(main_model_path, "w", encoding="utf-8") as f:
-            f.write(model_str)
-
-        generated_app_path = await run_in_threadpool(
-            generate, main_model_path, gen_dir_local
-        )
-
-        await run_in_threadpool(
-            postprocess_generation_for_deployment,
-            generation_dir=generated_app_path,
-            uid=uid,
-            VM_MACHINE_IP=VM_MACHINE_IP,
-            VM_MACHINE_USER=VM_MACHINE_USER,
-            username=app_username,
-            password=app_password,
-            public_deployment=is_public,
-        )
-
-        mkdir_result: CapturedSSHResult = await run_in_threadpool(
-            run_remote_ssh_command_capture, f"mkdir -p {remote_dir_vm}"
-        )
-        if mkdir_result.returncode != 0:
-            err_msg = f"Mkdir fail. Code:{mkdir_result.returncode}. Err:{mkdir_result.stderr}"
-            await db_update_deployment_status(conn, uid, "failed", error_message=err_msg)
-            return
-
-        scp_cmd_list = [
-            "scp", "-P", str(VM_MACHINE_SSH_PORT),
-            "-o", "StrictHostKeyChecking=no", "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "BatchMode=yes", "-o", "LogLevel=ERROR",
-            "-i", SSH_KEY_PATH, "-r",
-            f"{generated_app_path}/.", f"{VM_MACHINE_USER}@{VM_MACHINE_IP}:{remote_dir_vm}/",
-        ]
-        scp_res = await run_in_threadpool(
-            subprocess.run, scp_cmd_list, check=False,
-            capture_output=True, text=True, timeout=120,
-        )
-        if scp_res.returncode != 0:
-            err_msg = f"SCP fail. Code:{scp_res.returncode}. Err:{scp_res.stderr}"
-            await db_update_deployment_status(conn, uid, "failed", error_message=err_msg)
-            return
-
-        deploy_cmd = f"cd {remote_dir_vm} && docker compose -p {docker_project_name} up --build -d"
-        ssh_deploy_res: CapturedSSHResult = await run_in_threadpool(
-            run_remote_ssh_command_capture, deploy_cmd, timeout=300
-        )
-
-        if ssh_deploy_res.returncode != 0:
-            logs_cmd = f"cd {remote_dir_vm} && docker compose -p {docker_project_name} logs --tail=50"
-            logs_res: CapturedSSHResult = await run_in_threadpool(
-                run_remote_ssh_command_capture, logs_cmd, timeout=30
-            )
-            err_detail = (
-                f"Compose fail! Code:{ssh_deploy_res.returncode}. Err:{ssh_deploy_res.stderr}. "
-                f"Out:{ssh_deploy_res.stdout}. Logs:{logs_res.stdout} {logs_res.stderr}"
-            )
-            await db_update_deployment_status(conn, uid, "failed", error_message=err_detail)
-            return
-
-        dep_url = f"http://{VM_MACHINE_IP}/apps/{uid}/"
-        await db_update_deployment_status(
-            conn, uid, "running", url=dep_url,
-            app_username=app_username, app_password=app_password,
-        )
-
-    except Exception as e:
-        traceback.print_exc()
-        err_msg = f"Deploy fail in background: {str(e)}"
-        await db_update_deployment_status(conn, uid, "failed", error_message=err_msg)
-
-
-@router.post(
-    "",
-    status_code=202,  # Use 202 Accepted for background tasks
-    tags=["Deployments - Lifecycle"],
-)
-async def create_new_deployment(
-    background_tasks: BackgroundTasks,
-    api_key: str = Security(get_api_key),
-    deployment: DeploymentStringModel = Body(...),
-    conn: aiosqlite.Connection = Depends(get_db_connection),
-):
     uid = get_unique_id()
-    model_dir_local = os.path.join(TMP_DIR, f"models-{uid}")
     gen_dir_local = os.path.join(TMP_DIR, f"gen-{uid}")
     remote_dir_vm = f"/tmp/webapp-{uid}"
     docker_project_name = f"webapp-{uid}"
-    is_public = deployment.is_public
-
-    await run_in_threadpool(os.makedirs, model_dir_local, exist_ok=True)
-    await run_in_threadpool(os.makedirs, gen_dir_local, exist_ok=True)
 
     # 1. Generate credentials immediately
     app_username, app_password = generate_credentials(public=is_public)
@@ -175,29 +76,20 @@ async def create_new_deployment(
     await db_create_deployment_record(
         conn=conn,
         deployment_uid=uid,
-        user_id=deployment.user_id,
+        user_id=user_id,
         is_public=is_public,
-        model_dir_local=model_dir_local,
-        gen_dir_local=gen_dir_local,
-        remote_dir_vm=remote_dir_vm,
-        docker_project_name=docker_project_name,
-    )
-
-    # 3. Add the long-running deployment process as a background task
-    background_tasks.add_task(
-        run_deployment,
-        conn=conn,
-        uid=uid,
-        model_str=deployment.model_str,
-        model_dir_local=model_dir_local,
+        model_dir_local=None,  # Models are generated from memory
         gen_dir_local=gen_dir_local,
         remote_dir_vm=remote_dir_vm,
         docker_project_name=docker_project_name,
-        is_public=is_public,
         app_username=app_username,
         app_password=app_password,
     )
 
+    # 3. Queue the long-running deployment process
+    await db_enqueue_deployment(conn, uid, user_id, main_filename, files)
+    deployment_queue.notify()
+
     # 4. Immediately return the response to the client
     return {
         "deployment_uid": uid,
@@ -205,16 +97,34 @@ async def create_new_deployment(
         "username": app_username,
         "password": app_password,
         "url": f"https://{VM_MACHINE_DOMAIN}/apps/{uid}/",
-        "message": "Deployment has been initiated and is running in the background.",
+        "message": "Deployment has been queued and will run in the background.",
     }
 
+
+@router.post(
+    "",
+    status_code=202,  # Use 202 Accepted for queued deployments
+    tags=["Deployments - Lifecycle"],
+)
+async def create_new_deployment(
+    api_key: str = Security(get_api_key),
+    deployment: DeploymentStringModel = Body(...),
+    conn: aiosqlite.Connection = Depends(get_db_connection),
+):
+    return await queue_deployment(
+        conn,
+        deployment.user_id,
+        deployment.is_public,
+        "model.wdsl",
+        {"model.wdsl": deployment.model_str},
+    )
+
 @router.post(
     "/file",
-    status_code=201,
+    status_code=202,
     tags=["Deployments - Lifecycle"],
 )
 async def create_new_deployment_file(
-    background_tasks: BackgroundTasks,
     api_key: str = Security(get_api_key),
     user_id: str = Form(...),
     is_public: bool = Form(False),
@@ -222,154 +132,8 @@ async def create_new_deployment_file(
     main_filename: Optional[str] = Form(None),
     conn: aiosqlite.Connection = Depends(get_db_connection),
 ):
-    uid = get_unique_id()
-    model_dir_local = os.path.join(TMP_DIR, f"models-{uid}")
-    gen_dir_local = os.path.join(TMP_DIR, f"gen-{uid}")
-    remote_dir_vm = f"/tmp/webapp-{uid}"
-    docker_project_name = f"webapp-{uid}"
-
-    await run_in_threadpool(os.makedirs, model_dir_local, exist_ok=True)
-    await run_in_threadpool(os.makedirs, gen_dir_local, exist_ok=True)
-
-    await db_create_deployment_record(
-        conn,
-        uid,
-        user_id,
-        is_public,
-        model_dir_local,
-        gen_dir_local,
-        remote_dir_vm,
-        docker_project_name,
-    )
-
-    model_paths = {}
-    for model_file in model_files:
-        dest_path = os.path.join(model_dir_local, model_file.filename)
-        await run_in_threadpool(save_upload_file, model_file, dest_path)
-        model_paths[model_file.filename] = dest_path
-
-    if len(model_files) == 1 and not main_filename:
-        main_model_path = next(iter(model_paths.values()))
-    elif main_filename and main_filename in model_paths:
-        main_model_path = model_paths[main_filename]
-    else:
-        await db_update_deployment_status(
-            conn, uid, "failed", error_message="Main file not specified or ambiguous."
-        )
-        raise HTTPException(
-            status_code=400, detail="Main file not specified or ambiguous."
-        )
-
-    try:
-        generated_app_path = await run_in_threadpool(
-            generate, main_model_path, gen_dir_local
-        )
-        app_username, app_password = await run_in_threadpool(
-            postprocess_generation_for_deployment,
-            generation_dir=generated_app_path,
-            uid=uid,
-            VM_MACHINE_IP=VM_MACHINE_IP,
-            VM_MACHINE_USER=VM_MACHINE_USER,
-            public_deployment=is_public,
-        )
-
-        mkdir_result: CapturedSSHResult = await run_in_threadpool(
-            run_remote_ssh_command_capture, f"mkdir -p {remote_dir_vm}"
-        )
-        if mkdir_result.returncode != 0:
-            err_msg = (
-                f"Mkdir fail. Code:{mkdir_result.returncode}. Err:{mkdir_result.stderr}"
-            )
-            await db_update_deployment_status(
-                conn, uid, "failed", error_message=err_msg
-            )
-            raise HTTPException(
-                status_code=500, detail=f"Deploy fail: SCP setup. {err_msg}"
-            )
-
-        scp_cmd_list = [
-            "scp",
-            "-P",
-            str(VM_MACHINE_SSH_PORT),
-            "-o",
-            "StrictHostKeyChecking=no",
-            "-o",
-            "UserKnownHostsFile=/dev/null",
-            "-o",
-            "BatchMode=yes",
-            "-o",
-            "LogLevel=ERROR",
-            "-i",
-            SSH_KEY_PATH,
-            "-r",
-            f"{generated_app_path}/.",
-            f"{VM_MACHINE_USER}@{VM_MACHINE_IP}:{remote_dir_vm}/",
-        ]
-        scp_res = await run_in_threadpool(
-            subprocess.run,
-            scp_cmd_list,
-            check=False,
-            capture_output=True,
-            text=True,
-            timeout=120,
-        )
-        if scp_res.returncode != 0:
-            err_msg = f"SCP fail. Code:{scp_res.returncode}. Err:{scp_res.stderr}"
-            await db_update_deployment_status(
-                conn, uid, "failed", error_message=err_msg
-            )
-            raise HTTPException(status_code=500, detail=f"Deploy fail: SCP. {err_msg}")
-
-        deploy_cmd = f"cd {remote_dir_vm} && docker compose -p {docker_project_name} up --build -d"
-        ssh_deploy_res: CapturedSSHResult = await run_in_threadpool(
-            run_remote_ssh_command_capture, deploy_cmd, timeout=300
-        )
-
-        if ssh_deploy_res.returncode != 0:
-            logs_cmd = f"cd {remote_dir_vm} && docker compose -p {docker_project_name} logs --tail=50"
-            logs_res: CapturedSSHResult = await run_in_threadpool(
-                run_remote_ssh_command_capture, logs_cmd, timeout=30
-            )
-            err_detail = (
-                f"Compose fail! Code:{ssh_deploy_res.returncode}. Err:{ssh_deploy_res.stderr}. "
-                f"Out:{ssh_deploy_res.stdout}. Logs:{logs_res.stdout} {logs_res.stderr}"
-            )
-            await db_update_deployment_status(
-                conn, uid, "failed", error_message=err_detail
-            )
-            raise HTTPException(
-                status_code=500, detail=f"Deploy fail: Remote exec. {err_detail}"
-            )
-
-        dep_url = f"http://{VM_MACHINE_IP}/apps/{uid}/"
-        await db_update_deployment_status(
-            conn,
-            uid,
-            "running",
-            url=dep_url,
-            app_username=app_username,
-            app_password=app_password,
-        )
-
-        # Return the full deployment details
-        created_deployment = await db_get_deployment_by_uid(conn, uid)
-        # background_tasks.add_task(cleanup_local_dirs, [model_dir_local, gen_dir_local])
-        return {
-            "id": created_deployment["id"],
-            "deployment_uid": created_deployment["deployment_uid"],
-            "status": created_deployment["status"],
-            "username": created_deployment["app_username"],
-            "password": created_deployment["app_password"],
-            "url": created_deployment["url"],
-            "created_at": created_deployment["created_at"],
-        }
-    except HTTPException:
-        raise
-    except Exception as e:
-        traceback.print_exc()
-        err_msg = f"Deploy fail: {str(e)}"
-        await db_update_deployment_status(conn, uid, "failed", error_message=err_msg)
-        raise HTTPException(status_code=500, detail=err_msg)
+    main_filename, contents = read_model_files(model_files, main_filename)
+    return await queue_deployment(conn, user_id, is_public, main_filename, contents)
 
 
 @router.get(
@@ -448,6 +212,9 @@ async def _perform_kill_logic(
         raise HTTPException(status_code=403, detail="User not authorized to kill.")
     if deployment["status"] == "killed":
         return f"Deployment {deployment_uid} already killed."
+    if await db_dequeue_deployment(conn, deployment_uid, queued_only=True):
+        await db_update_deployment_status(conn, deployment_uid, "killed")
+        return f"Deployment {deployment_uid} removed from the queue."
     if not deployment["docker_project_name"] or not deployment["remote_dir_vm"]:
         await db_update_deployment_status(
             conn, deployment_uid, "killed", error_message="Kill: Missing Docker info."
@@ -1,49 +1,120 @@
-import os
+import json
 import traceback
 from typing import List
-from ..config import get_api_key, TMP_DIR, CLEANUP_THRESHOLD
+from ..config import get_api_key
 from fastapi import (
     APIRouter,
     UploadFile,
     HTTPException,
-    BackgroundTasks,
     File,
     Security,
     Body,
     Form,
 )
-from fastapi.responses import FileResponse
-from ..utils import (
-    cleanup_old_generations,
-    get_unique_id,
-    make_tarball,
-    save_text_to_file,
-    save_upload_file,
-)
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from ..janitor import PinnedFileResponse
+from ..utils import read_upload_file
 from ..models import TransformationModel
-from web_dsl.generate import generate
+from ..result_cache import archive_name, model_key, tarball_store
+from ..streaming import GenerationStream
+from ..workers import JobTimeout, job_timeout_error, worker_pool
 
 router = APIRouter(tags=["Generation"])
 
+# Response header that carries the JSON profile when profile=true
+PROFILE_HEADER = "X-WebDSL-Profile"
+
+
+def profile_headers(profile):
+    if profile is None:
+        return None
+    return {PROFILE_HEADER: json.dumps(profile, separators=(",", ":"))}
+
+
+def stored_tarball_response(path, key):
+    """Responds with a stored archive of an identical model."""
+    return PinnedFileResponse(
+        path,
+        status_code=201,
+        media_type="application/x-tar",
+        filename=f"{archive_name(key)}.tar.gz",
+    )
+
+
+async def tarball_response(model_path, files, key, profile=False):
+    """
+    Responds with the generated project of a model as gen-{name}/ in
+    {name}.tar.gz, where name is derived from the model key. The project is
+    generated on the worker pool and the archive streamed while it is
+    generated, and stored for later requests of the same model. With
+    profile=true, the archive is received completely first so the profile
+    can be sent in a header, and is not stored.
+    """
+    name = archive_name(key)
+    arcname = f"gen-{name}"
+    headers = {"Content-Disposition": f'attachment; filename="{name}.tar.gz"'}
+    stream = GenerationStream(worker_pool, model_path, files, arcname, profile)
+    try:
+        if profile:
+            archive, job_profile = await run_in_threadpool(stream.read_all)
+            headers.update(profile_headers(job_profile))
+            return Response(
+                archive,
+                status_code=201,
+                media_type="application/x-tar",
+                headers=headers,
+            )
+        first_chunk = await run_in_threadpool(stream.first_chunk)
+    except JobTimeout:
+        stream.cancel()
+        raise job_timeout_error(worker_pool.timeout)
+    except BaseException:
+        stream.cancel()
+        raise
+
+    writer = tarball_store.writer(key)
+    return StreamingResponse(
+        writer.tee(stream.iter_chunks(first_chunk)),
+        status_code=201,
+        media_type="application/x-tar",
+        headers=headers,
+    )
+
+
+def read_model_files(model_files, main_filename=None):
+    """
+    Returns the name of the main file and the text of every uploaded model
+    file. main_filename is only required with more than one file.
+    """
+    contents = {
+        model_file.filename: read_upload_file(model_file) for model_file in model_files
+    }
+    if len(model_files) == 1:
+        main_filename = next(iter(contents))
+    elif not main_filename or main_filename not in contents:
+        raise HTTPException(
+            status_code=400, detail="Main file not specified or not found."
+        )
+    return main_filename, contents
+
 
 @router.post("/generate", status_code=201)
 async def generate_from_model(
-    gen_model: TransformationModel = Body(...), api_key: str = Security(get_api_key)
+    gen_model: TransformationModel = Body(...),
+    profile: bool = False,
+    api_key: str = Security(get_api_key),
 ):
-    uid = get_unique_id()
-    model_path = os.path.join(TMP_DIR, f"model-{uid}.wdsl")
-    gen_dir = os.path.join(TMP_DIR, f"gen-{uid}")
-    os.makedirs(gen_dir, exist_ok=True)
-    save_text_to_file(gen_model.model, model_path)
-    tarball_path = os.path.join(TMP_DIR, f"{uid}.tar.gz")
+    files = {"model.wdsl": gen_model.model}
+    key = model_key(files, "model.wdsl")
+    stored = None if profile else tarball_store.get(key)
+    if stored is not None:
+        return stored_tarball_response(stored, key)
+
     try:
-        out_dir = generate(model_path, gen_dir)
-        make_tarball(tarball_path, out_dir)
-        return FileResponse(
-            tarball_path,
-            filename=os.path.basename(tarball_path),
-            media_type="application/x-tar",
-        )
+        return await tarball_response("model.wdsl", files, key, profile)
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
@@ -53,46 +124,20 @@ async def generate_from_model(
 async def generate_from_files(
     model_files: List[UploadFile] = File(...),
     main_filename: str = Form(None),  # Optional
-    background_tasks: BackgroundTasks = BackgroundTasks(),
+    profile: bool = False,
     api_key: str = Security(get_api_key),
 ):
-    uid = get_unique_id()
-    model_dir = os.path.join(TMP_DIR, f"models-{uid}")
-    gen_dir = os.path.join(TMP_DIR, f"gen-{uid}")
-    os.makedirs(model_dir, exist_ok=True)
-    os.makedirs(gen_dir, exist_ok=True)
-    background_tasks.add_task(cleanup_old_generations, TMP_DIR, CLEANUP_THRESHOLD)
-
-    model_paths = {}
-
     try:
-        # Save files and keep track of names
-        for model_file in model_files:
-            dest_path = os.path.join(model_dir, model_file.filename)
-            save_upload_file(model_file, dest_path)
-            model_paths[model_file.filename] = dest_path
-
-        # Determine the main file
-        if len(model_files) == 1:
-            main_model_path = next(iter(model_paths.values()))
-        elif main_filename and main_filename in model_paths:
-            main_model_path = model_paths[main_filename]
-        else:
-            raise HTTPException(
-                status_code=400, detail="Main file not specified or not found."
-            )
-
-        out_dir = generate(main_model_path, gen_dir)
+        main_filename, contents = read_model_files(model_files, main_filename)
+        key = model_key(contents, main_filename)
+        stored = None if profile else tarball_store.get(key)
+        if stored is not None:
+            return stored_tarball_response(stored, key)
 
-        tarball_path = os.path.join(TMP_DIR, f"{uid}.tar.gz")
-        make_tarball(tarball_path, out_dir)
-
-        return FileResponse(
-            tarball_path,
-            filename=os.path.basename(tarball_path),
-            media_type="application/x-tar",
-        )
+        return await tarball_response(main_filename, contents, key, profile)
 
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
@@ -0,0 +1,146 @@
+import asyncio
+import os
+from typing import List
+
+import aiosqlite
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    File,
+    Form,
+    HTTPException,
+    Path,
+    Security,
+    UploadFile,
+)
+from fastapi.responses import FileResponse, StreamingResponse
+
+from ..config import JOB_POLL_INTERVAL, get_api_key
+from ..database import (
+    db_create_generation_job,
+    db_get_generation_job_by_uid,
+    db_get_queue_position,
+    db_pool,
+    get_db_connection,
+)
+from ..jobs import FINISHED_STATUSES, job_queue
+from ..models import (
+    GenerationJobResponse,
+    TransformationModel,
+    format_generation_job_response,
+)
+from ..result_cache import archive_name, model_key
+from ..utils import get_unique_id
+from .generation import read_model_files
+
+router = APIRouter(prefix="/generate/jobs", tags=["Generation Jobs"])
+
+
+async def job_response(conn, job):
+    queue_position = None
+    if job["status"] == "queued":
+        queue_position = await db_get_queue_position(conn, job)
+    return format_generation_job_response(job, queue_position)
+
+
+async def get_job_or_404(conn, job_uid):
+    job = await db_get_generation_job_by_uid(conn, job_uid)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job
+
+
+async def submit_job(conn, main_filename, files, priority):
+    job_uid = get_unique_id()
+    await db_create_generation_job(
+        conn, job_uid, model_key(files, main_filename), main_filename, files, priority
+    )
+    job_queue.notify()
+    return await job_response(conn, await get_job_or_404(conn, job_uid))
+
+
+@router.post("", status_code=202, response_model=GenerationJobResponse)
+async def submit_generation_job(
+    gen_model: TransformationModel = Body(...),
+    priority: int = 0,
+    api_key: str = Security(get_api_key),
+    conn: aiosqlite.Connection = Depends(get_db_connection),
+):
+    return await submit_job(
+        conn, "model.wdsl", {"model.wdsl": gen_model.model}, priority
+    )
+
+
+@router.post("/file", status_code=202, response_model=GenerationJobResponse)
+async def submit_generation_job_file(
+    model_files: List[UploadFile] = File(...),
+    main_filename: str = Form(None),  # Optional
+    priority: int = Form(0),
+    api_key: str = Security(get_api_key),
+    conn: aiosqlite.Connection = Depends(get_db_connection),
+):
+    main_filename, contents = read_model_files(model_files, main_filename)
+    return await submit_job(conn, main_filename, contents, priority)
+
+
+@router.get("/{job_uid}", response_model=GenerationJobResponse)
+async def get_generation_job(
+    job_uid: str = Path(..., description="The UID of the generation job"),
+    api_key: str = Security(get_api_key),
+    conn: aiosqlite.Connection = Depends(get_db_connection),
+):
+    return await job_response(conn, await get_job_or_404(conn, job_uid))
+
+
+@router.get("/{job_uid}/events")
+async def subscribe_generation_job(
+    job_uid: str = Path(..., description="The UID of the generation job"),
+    api_key: str = Security(get_api_key),
+):
+    """
+    Streams the status of a job as server-sent events, one whenever it
+    changes, until the job is finished. A connection to the database is
+    only held while reading the job, not for the whole stream.
+    """
+    async with db_pool.acquire() as conn:
+        await get_job_or_404(conn, job_uid)
+
+    async def events():
+        last_event = None
+        while True:
+            async with db_pool.acquire() as conn:
+                job = await db_get_generation_job_by_uid(conn, job_uid)
+                if job is None:
+                    return
+                event = (await job_response(conn, job)).model_dump_json()
+            if event != last_event:
+                yield f"event: status\ndata: {event}\n\n"
+                last_event = event
+            if job["status"] in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@router.get("/{job_uid}/artifact")
+async def download_generation_job_artifact(
+    job_uid: str = Path(..., description="The UID of the generation job"),
+    api_key: str = Security(get_api_key),
+    conn: aiosqlite.Connection = Depends(get_db_connection),
+):
+    job = await get_job_or_404(conn, job_uid)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=job["error_message"])
+    if job["status"] != "done":
+        raise HTTPException(
+            status_code=409, detail=f"Generation job is {job['status']}"
+        )
+    if not job["artifact_path"] or not os.path.exists(job["artifact_path"]):
+        raise HTTPException(status_code=404, detail="Generation job artifact expired")
+    return FileResponse(
+        job["artifact_path"],
+        media_type="application/x-tar",
+        filename=f"{archive_name(job['model_key'])}.tar.gz",
+    )
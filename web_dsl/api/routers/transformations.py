@@ -1,7 +1,6 @@
 import os
 import traceback
 from fastapi import UploadFile, HTTPException, File, Security, APIRouter
-from fastapi.responses import FileResponse
 from ..utils import (
     get_unique_id,
     save_text_to_file,
@@ -11,7 +10,9 @@ from web_dsl.m2m.openapi_to_webdsl import transform_openapi_to_webdsl
 from web_dsl.m2m.goaldsl_to_webdsl import transform_goaldsl_to_webdsl
 from web_dsl.m2m.asyncapi_to_webdsl import transform_asyncapi_to_webdsl
 from ..config import get_api_key, TMP_DIR
+from ..janitor import PinnedFileResponse, janitor
 from ..models import TransformationModel
+from ..workers import worker_pool
 
 
 router = APIRouter(tags=["Transformations"])
@@ -22,15 +23,21 @@ async def generate_openapi_from_text(input_model: TransformationModel, api_key:
     openapi_path = os.path.join(TMP_DIR, f"openapi-{uid}.yaml")
 
     save_text_to_file(input_model.model, openapi_path)
+    janitor.pin(openapi_path)
+    janitor.track(openapi_path)
     resp = {}
     try:
-        web_dsl_model = transform_openapi_to_webdsl(openapi_path)
+        web_dsl_model = await worker_pool.run(transform_openapi_to_webdsl, openapi_path)
         resp["message"] = "Transformation successful"
         resp["model_str"] = web_dsl_model
         return resp
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
+    finally:
+        janitor.unpin(openapi_path)
 
 
 @router.post("/transformations/m2m/openapi/file")
@@ -42,19 +49,27 @@ async def generate_from_model(
     web_dsl_path = os.path.join(TMP_DIR, f"webdsl-{uid}.wdsl")
 
     save_upload_file(openapi_model, openapi_path)
+    janitor.pin(openapi_path)
+    janitor.track(openapi_path)
 
     try:
-        web_dsl_model = transform_openapi_to_webdsl(openapi_path)
+        web_dsl_model = await worker_pool.run(transform_openapi_to_webdsl, openapi_path)
         save_text_to_file(web_dsl_model, web_dsl_path)
+        janitor.pin(web_dsl_path)
+        janitor.track(web_dsl_path)
         print(f"Generated WDSL model: {web_dsl_path}")
-        return FileResponse(
+        return PinnedFileResponse(
             path=web_dsl_path,
             filename=os.path.basename(web_dsl_path),
             media_type="text/plain",  # Use correct MIME type
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
+    finally:
+        janitor.unpin(openapi_path)
 
 @router.post("/transformations/m2m/goaldsl")
 async def generate_goaldsl_from_text(input_model: TransformationModel, api_key: str = Security(get_api_key)):
@@ -62,15 +77,21 @@ async def generate_goaldsl_from_text(input_model: TransformationModel, api_key:
     goaldsl_path = os.path.join(TMP_DIR, f"goaldsl-{uid}.goal")
 
     save_text_to_file(input_model.model, goaldsl_path)
+    janitor.pin(goaldsl_path)
+    janitor.track(goaldsl_path)
     resp = {}
     try:
-        web_dsl_model = transform_goaldsl_to_webdsl(goaldsl_path)
+        web_dsl_model = await worker_pool.run(transform_goaldsl_to_webdsl, goaldsl_path)
         resp["message"] = "Transformation successful"
         resp["model_str"] = web_dsl_model
         return resp
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
+    finally:
+        janitor.unpin(goaldsl_path)
 
 @router.post("/transformations/m2m/goaldsl/file")
 async def generate_from_model(
@@ -81,19 +102,27 @@ async def generate_from_model(
     web_dsl_path = os.path.join(TMP_DIR, f"webdsl-{uid}.wdsl")
 
     save_upload_file(goaldsl_model, goaldsl_path)
+    janitor.pin(goaldsl_path)
+    janitor.track(goaldsl_path)
 
     try:
-        web_dsl_model = transform_goaldsl_to_webdsl(goaldsl_path)
+        web_dsl_model = await worker_pool.run(transform_goaldsl_to_webdsl, goaldsl_path)
         save_text_to_file(web_dsl_model, web_dsl_path)
+        janitor.pin(web_dsl_path)
+        janitor.track(web_dsl_path)
         print(f"Generated WDSL model: {web_dsl_path}")
-        return FileResponse(
+        return PinnedFileResponse(
             path=web_dsl_path,
             filename=os.path.basename(web_dsl_path),
             media_type="text/plain",  # Use correct MIME type
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
+    finally:
+        janitor.unpin(goaldsl_path)
 
 
 @router.post("/transformations/m2m/asyncapi/file")
@@ -105,16 +134,24 @@ async def generate_from_model(
     web_dsl_path = os.path.join(TMP_DIR, f"webdsl-{uid}.wdsl")
 
     save_upload_file(asyncapi_model, asyncapi_path)
+    janitor.pin(asyncapi_path)
+    janitor.track(asyncapi_path)
 
     try:
-        web_dsl_model = transform_asyncapi_to_webdsl(asyncapi_path)
+        web_dsl_model = await worker_pool.run(transform_asyncapi_to_webdsl, asyncapi_path)
         save_text_to_file(web_dsl_model, web_dsl_path)
+        janitor.pin(web_dsl_path)
+        janitor.track(web_dsl_path)
         print(f"Generated WDSL model: {web_dsl_path}")
-        return FileResponse(
+        return PinnedFileResponse(
             path=web_dsl_path,
             filename=os.path.basename(web_dsl_path),
             media_type="text/plain",  # Use correct MIME type
         )
+    except HTTPException:
+        raise
     except Exception as e:
         traceback.print_exc()
         raise HTTPException(status_code=400, detail=f"Transformation error: {e}")
+    finally:
+        janitor.unpin(asyncapi_path)
@@ -1,38 +1,110 @@
 from fastapi import APIRouter, UploadFile, HTTPException, File, Security
 from ..models import ValidationModel
-from ..utils import get_unique_id, save_text_to_file, save_upload_file
+from ..utils import read_upload_file
 from web_dsl.language import build_model
-import os
+from web_dsl.profiling import Profiler
 import traceback
-from ..config import get_api_key, TMP_DIR
+from ..config import get_api_key
+from ..workers import worker_pool
+from ..result_cache import model_key, validation_cache
 
 router = APIRouter(tags=["Validation"])
 
 
+class ModelError(Exception):
+    """The model is invalid, validating it again fails the same way."""
+
+
+def _build_and_profile(filename, files, profile):
+    if not profile:
+        build_model(filename, files=files)
+        return {"status": 200, "message": "Model validation success"}
+    with Profiler() as profiler:
+        build_model(filename, files=files)
+    return {
+        "status": 200,
+        "message": "Model validation success",
+        "profile": profiler.to_dict(),
+    }
+
+
+def run_validation(filename, files, profile=False):
+    # The model is built from memory, so what it raises (a missing import
+    # included) depends on the model alone. Other OS errors and running out
+    # of memory are conditions of the worker.
+    try:
+        return _build_and_profile(filename, files, profile)
+    except FileNotFoundError as e:
+        raise ModelError(str(e)) from None
+    except (OSError, MemoryError):
+        raise
+    except Exception as e:
+        raise ModelError(str(e)) from None
+
+
+def cached_validation(key):
+    """Returns the cached result of a model, or raises its cached error."""
+    outcome = validation_cache.get(key)
+    if outcome is None:
+        return None
+    result, error = outcome
+    if error is not None:
+        raise HTTPException(status_code=400, detail=error)
+    return dict(result)
+
+
+async def validate_and_cache(key, filename, files, profile):
+    try:
+        result = await worker_pool.run(run_validation, filename, files, profile)
+    except ModelError as e:
+        error = f"Validation error: {e}"
+        validation_cache.put(key, error=error)
+        raise HTTPException(status_code=400, detail=error)
+    except HTTPException:
+        raise
+    except Exception as e:
+        # The pool broke or the worker failed, the model may well be valid
+        traceback.print_exc()
+        raise HTTPException(status_code=503, detail=f"Validation unavailable: {e}")
+    # A profile describes one run, only the outcome is cached
+    outcome = {name: value for name, value in result.items() if name != "profile"}
+    validation_cache.put(key, result=outcome)
+    return result
+
+
 @router.post("/validate", tags=["Validation"], status_code=201)
-async def validate_model(model: ValidationModel, api_key: str = Security(get_api_key)):
+async def validate_model(
+    model: ValidationModel,
+    profile: bool = False,
+    api_key: str = Security(get_api_key),
+):
     if not model.model:
         raise HTTPException(status_code=404, detail="Empty model content")
-    uid = get_unique_id()
-    file_path = os.path.join(TMP_DIR, f"model_for_validation-{uid}.wdsl")
-    save_text_to_file(model.model, file_path)
-    try:
-        build_model(file_path)
-        return {"status": 200, "message": "Model validation success"}
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Validation error: {e}")
+    files = {"model.wdsl": model.model}
+    key = model_key(files, "model.wdsl")
+    if not profile:
+        result = cached_validation(key)
+        if result is not None:
+            return result
+    return await validate_and_cache(key, "model.wdsl", files, profile)
 
 
 @router.post("/validate/file", tags=["Validation"], status_code=201)
 async def validate_model_file(
-    file: UploadFile = File(...), api_key: str = Security(get_api_key)
+    file: UploadFile = File(...),
+    profile: bool = False,
+    api_key: str = Security(get_api_key),
 ):
-    uid = get_unique_id()
-    file_path = os.path.join(TMP_DIR, f"model_for_validation-{uid}.wdsl")
-    save_upload_file(file, file_path)
+    filename = file.filename or "model.wdsl"
+    files = {filename: read_upload_file(file)}
+    key = model_key(files, filename)
+    if not profile:
+        result = cached_validation(key)
+        if result is not None:
+            return result
     try:
-        build_model(file_path)
-        return {"status": 200, "message": "Model validation success"}
-    except Exception as e:
-        traceback.print_exc()
-        raise HTTPException(status_code=400, detail=f"Validation error: {e}")
+        return await validate_and_cache(key, filename, files, profile)
+    except HTTPException as e:
+        if e.status_code == 400:
+            traceback.print_exc()
+        raise
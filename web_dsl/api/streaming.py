@@ -0,0 +1,110 @@
+import multiprocessing
+from contextlib import nullcontext
+
+from web_dsl.generate import generate
+from web_dsl.output import TarOutput
+from web_dsl.profiling import Profiler
+
+from .workers import JobHTTPError
+
+# Seconds between two checks whether a job that sends no chunks has ended
+POLL_INTERVAL = 0.1
+
+
+class _ConnectionWriter:
+    """File object that sends everything written to it over a connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.aborted = False
+
+    def write(self, data):
+        # Once the reader went away, further writes (e.g. when the abandoned
+        # tar stream is garbage collected) are discarded
+        if not self.aborted:
+            try:
+                self.conn.send_bytes(data)
+            except OSError:
+                self.aborted = True
+                raise
+        return len(data)
+
+
+def generate_archive_job(model_path, files, arcname, conn, profile=False):
+    """
+    Worker job that generates the project of a model, built from memory out
+    of files, straight into a gzipped tar stream whose chunks are sent over
+    conn as they are compressed. Returns the profile of the generation when
+    profile is set.
+    """
+    profiler = Profiler() if profile else None
+    with conn, profiler or nullcontext():
+        output = TarOutput(arcname, _ConnectionWriter(conn))
+        generate(model_path, arcname, jobs=1, output=output, files=files)
+    return profiler.to_dict() if profiler else None
+
+
+class GenerationStream:
+    """
+    Generates the project of a model on the worker pool and receives the
+    chunks of its .tar.gz archive through a pipe. The model is given as the
+    name of its main file and the text of its files, nothing is written to
+    disk.
+
+    The archive members are stored under arcname. first_chunk() raises the
+    error of a generation that fails before the archive starts (e.g. an
+    invalid model). An error after that aborts the iteration, which
+    truncates the archive. The reads block, so they belong in a thread.
+    """
+
+    def __init__(self, pool, model_path, files, arcname, profile=False):
+        self._conn, send_conn = multiprocessing.Pipe(duplex=False)
+        self.future = pool.submit(
+            generate_archive_job, model_path, files, arcname, send_conn, profile
+        )
+        # The worker writes to its own copy of the pipe, once the job ended
+        # ours is closed as well so that reading reaches the end
+        self.future.add_done_callback(lambda future: send_conn.close())
+
+    def _next(self):
+        """Returns the next chunk, or None once the archive is complete."""
+        while not self._conn.closed:
+            if self._conn.poll(POLL_INTERVAL):
+                try:
+                    return self._conn.recv_bytes()
+                except EOFError:
+                    break
+            elif self.future.done() and not self._conn.poll():
+                break
+        # Raises the error of the job, if any
+        try:
+            self.future.result()
+        except JobHTTPError as e:
+            raise e.to_http_exception() from None
+        return None
+
+    def first_chunk(self):
+        """Blocks until the archive starts, returns None for an empty one."""
+        return self._next()
+
+    def iter_chunks(self, first_chunk):
+        """Yields first_chunk and the rest of the archive."""
+        try:
+            chunk = first_chunk
+            while chunk is not None:
+                yield chunk
+                chunk = self._next()
+        finally:
+            self.cancel()
+
+    def read_all(self):
+        """Returns the whole archive and the result of the job."""
+        chunks = list(self.iter_chunks(self.first_chunk()))
+        return b"".join(chunks), self.future.result()
+
+    def cancel(self):
+        """
+        Stops a generation whose archive is no longer read: its next write
+        fails with a broken pipe.
+        """
+        self._conn.close()
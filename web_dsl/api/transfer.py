@@ -0,0 +1,296 @@
+import hashlib
+import io
+import os
+import shlex
+import stat
+import subprocess
+import tarfile
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+
+from .config import (
+    REMOTE_STORE_DIR,
+    REMOTE_STORE_RETENTION_DAYS,
+    VM_MACHINE_IP,
+    VM_MACHINE_USER,
+)
+from .models import CapturedSSHResult
+from .utils import ssh_base_args
+
+# Receives the upload: unpacks the objects the store lacked into it, then
+# copies the files of the manifest out of the store into the destination.
+# Prints the digests of the files it could not copy because their object
+# left the store since the lookup (see the retention at the end).
+_RECEIVE_SCRIPT = """
+set -e
+store={store}
+dest={dest}
+incoming="$store/.incoming-$$"
+trap 'rm -rf "$incoming"' EXIT
+mkdir -p "$incoming" "$dest"
+tar -xzf - -C "$incoming"
+for object in "$incoming"/objects/*; do
+    if [ -e "$object" ]; then mv -f "$object" "$store/"; fi
+done
+cd "$dest"
+tr '\\n' '\\0' < "$incoming/dirs" | xargs -0 -r mkdir -p --
+while read -r digest path; do
+    if ! cp -- "$store/$digest" "$path" 2>/dev/null; then
+        # Fails again with the error, unless the object left the store
+        if [ -e "$store/$digest" ]; then
+            cp -- "$store/$digest" "$path"
+        else
+            echo "$digest"
+        fi
+    fi
+done < "$incoming/manifest"
+while read -r path; do
+    if [ -e "$path" ]; then chmod +x -- "$path"; fi
+done < "$incoming/executables"
+find "$store" -maxdepth 1 -type f -mtime +{retention_days} -delete
+"""
+
+# Prints the digests read from stdin that are not in the store, and touches
+# the others so that the retention of the store counts from their last use
+_MISSING_SCRIPT = """
+set -e
+mkdir -p {store}
+cd {store}
+hits=""
+while read -r digest; do
+    if [ -e "$digest" ]; then hits="$hits $digest"; else echo "$digest"; fi
+done
+if [ -n "$hits" ]; then touch -c -- $hits; fi
+"""
+
+
+class TransferError(Exception):
+    pass
+
+
+class TransferStats(NamedTuple):
+    files: int  # Files in the uploaded tree
+    sent: int  # Files whose content was sent
+    bytes_sent: int  # Size of the content that was sent
+
+
+def _run(args, feed=None, timeout=60):
+    """
+    Runs a command, writing its stdin with feed(stream) if given, and
+    returns its CapturedSSHResult. Output goes to temporary files, so a
+    chatty command cannot block while its input is written.
+    """
+    with tempfile.TemporaryFile() as out, tempfile.TemporaryFile() as err:
+        try:
+            process = subprocess.Popen(
+                args,
+                stdin=subprocess.PIPE if feed else subprocess.DEVNULL,
+                stdout=out,
+                stderr=err,
+            )
+        except FileNotFoundError:
+            return CapturedSSHResult(
+                returncode=-2,
+                stdout="",
+                stderr=f"Command not found: {args[0]}",
+                args=args,
+            )
+        try:
+            if feed:
+                try:
+                    feed(process.stdin)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass  # The command failed, its stderr tells why
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+            return CapturedSSHResult(
+                returncode=-1,
+                stdout="",
+                stderr=f"Command timed out after {timeout} seconds.",
+                args=args,
+            )
+        out.seek(0)
+        err.seek(0)
+        return CapturedSSHResult(
+            returncode=process.returncode,
+            stdout=out.read().decode("utf-8", "replace").strip(),
+            stderr=err.read().decode("utf-8", "replace").strip(),
+            args=args,
+        )
+
+
+class Transport(ABC):
+    """
+    Runs the shell scripts of a transfer on the machine that receives it,
+    given the paths they use on the VM.
+    """
+
+    def path(self, remote_path):
+        """Returns the path on the receiving machine of a path on the VM."""
+        return remote_path
+
+    @abstractmethod
+    def command(self, script):
+        """Returns the arguments of the command that runs script."""
+
+    def run(self, script, feed=None, timeout=60):
+        return _run(self.command(script), feed=feed, timeout=timeout)
+
+
+class SSHTransport(Transport):
+    """Runs the scripts on the VM, over one SSH connection each."""
+
+    def command(self, script):
+        return ["ssh", *ssh_base_args(), f"{VM_MACHINE_USER}@{VM_MACHINE_IP}", script]
+
+
+class LocalTransport(Transport):
+    """
+    Runs the scripts locally, with the paths of the VM under root, e.g. to
+    test transfers without a VM.
+    """
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def path(self, remote_path):
+        return os.path.join(self.root, remote_path.lstrip("/"))
+
+    def command(self, script):
+        return ["sh", "-c", script]
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def tree_manifest(local_dir):
+    """
+    Returns the subdirectories of a directory, parents first, and its files,
+    as (relative path, SHA-256, size, executable) tuples.
+    """
+    dirs, entries = [], []
+    for root, subdirs, files in os.walk(local_dir):
+        subdirs.sort()
+        if root != local_dir:
+            dirs.append(os.path.relpath(root, local_dir).replace(os.sep, "/"))
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            entries.append(
+                (
+                    os.path.relpath(path, local_dir).replace(os.sep, "/"),
+                    file_digest(path),
+                    st.st_size,
+                    bool(st.st_mode & stat.S_IXUSR),
+                )
+            )
+    return dirs, entries
+
+
+def _add_file(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mode = 0o644  # Executables are marked by the upload, not the store
+    info.mtime = time.time()  # Retention in the store counts from the upload
+    tar.addfile(info, fileobj)
+
+
+def _add_text(tar, name, lines):
+    data = "".join(f"{line}\n" for line in lines).encode("utf-8")
+    _add_file(tar, name, io.BytesIO(data), len(data))
+
+
+def _send(transport, store, dest, local_dir, dirs, entries, missing, timeout):
+    """
+    Sends the content of the entries whose digest is missing from the store,
+    and has the receiving side copy every entry into dest. Returns the sent
+    {digest: (path, size)} and the digests it could not copy.
+    """
+    sources = {}
+    for path, digest, size, _ in entries:
+        if digest in missing:
+            sources.setdefault(digest, (os.path.join(local_dir, path), size))
+
+    def write_upload(stdin):
+        with tarfile.open(fileobj=stdin, mode="w|gz") as tar:
+            for digest, (source, size) in sources.items():
+                with open(source, "rb") as f:
+                    _add_file(tar, f"objects/{digest}", f, size)
+            _add_text(tar, "dirs", dirs)
+            _add_text(tar, "manifest", (f"{d} {path}" for path, d, _, _ in entries))
+            _add_text(tar, "executables", (p for p, _, _, x in entries if x))
+
+    result = transport.run(
+        _RECEIVE_SCRIPT.format(
+            store=store, dest=dest, retention_days=REMOTE_STORE_RETENTION_DAYS
+        ),
+        feed=write_upload,
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise TransferError(
+            f"Upload fail. Code:{result.returncode}. Err:{result.stderr}"
+        )
+    return sources, set(result.stdout.split()) & {d for _, d, _, _ in entries}
+
+
+def upload_tree(
+    local_dir,
+    remote_dir,
+    transport=None,
+    store_dir=REMOTE_STORE_DIR,
+    timeout=120,
+):
+    """
+    Uploads the files of local_dir to remote_dir on the VM. The VM keeps the
+    content of uploaded files in store_dir by SHA-256, and only files whose
+    content is not there yet are sent, in a single tar stream. Content that
+    leaves the store between the lookup and the copy (e.g. to the retention
+    run by a concurrent upload) is sent in a second stream. Returns the
+    TransferStats, raises TransferError if the upload fails.
+    """
+    transport = transport or SSHTransport()
+    dirs, entries = tree_manifest(local_dir)
+    if any("\n" in path for path in dirs + [path for path, _, _, _ in entries]):
+        raise TransferError("File names with line breaks cannot be uploaded")
+    store = shlex.quote(transport.path(store_dir))
+    dest = shlex.quote(transport.path(remote_dir))
+
+    digests = sorted({digest for _, digest, _, _ in entries})
+    result = transport.run(
+        _MISSING_SCRIPT.format(store=store),
+        feed=lambda stdin: stdin.write("".join(f"{d}\n" for d in digests).encode()),
+        timeout=timeout,
+    )
+    if result.returncode != 0:
+        raise TransferError(
+            f"Store lookup fail. Code:{result.returncode}. Err:{result.stderr}"
+        )
+    missing = set(result.stdout.split()) & set(digests)
+
+    sent, gone = _send(
+        transport, store, dest, local_dir, dirs, entries, missing, timeout
+    )
+    if gone:
+        entries_gone = [entry for entry in entries if entry[1] in gone]
+        resent, gone = _send(
+            transport, store, dest, local_dir, [], entries_gone, gone, timeout
+        )
+        sent.update(resent)
+        if gone:
+            raise TransferError(f"Upload fail. {len(gone)} files left the store")
+    return TransferStats(
+        files=len(entries),
+        sent=len(sent),
+        bytes_sent=sum(size for _, size in sent.values()),
+    )
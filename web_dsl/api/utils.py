@@ -1,7 +1,5 @@
 import yaml
-import time
 import os
-import shutil
 import uuid
 import base64
 import tarfile
@@ -9,10 +7,18 @@ import re
 import secrets
 import subprocess
 import json
+import itertools
+import shutil
 from fastapi import UploadFile
 from .config import VM_MACHINE_IP, VM_MACHINE_USER, VM_MACHINE_SSH_PORT, SSH_KEY_PATH, VM_MACHINE_DOMAIN
+from .config import (
+    SSH_CONTROL_DIR,
+    SSH_CONTROL_CONNECTIONS,
+    SSH_CONTROL_PERSIST,
+    SSH_KEEPALIVE_INTERVAL,
+)
 from .models import CapturedSSHResult
-from typing import List
+from typing import List, Optional
 
 
 def inject_traefik_labels_and_network(
@@ -127,8 +133,7 @@ def inject_traefik_labels_and_network(
             svc_config.pop("labels", None)
 
     # Write back out
-    with open(compose_path, "w") as f:
-        yaml.dump(compose, f, sort_keys=False)
+    replace_text_file(compose_path, yaml.dump(compose, sort_keys=False))
 
 def generate_credentials(public: bool = False):
     """
@@ -141,22 +146,6 @@ def generate_credentials(public: bool = False):
     return username, password
 
 
-def cleanup_old_generations(TMP_DIR, CLEANUP_THRESHOLD):
-    now = time.time()
-    for entry in os.listdir(TMP_DIR):
-        path = os.path.join(TMP_DIR, entry)
-        # Check if the file/directory is older than our threshold.
-        if os.path.getmtime(path) < now - CLEANUP_THRESHOLD:
-            try:
-                if os.path.isfile(path):
-                    os.remove(path)
-                elif os.path.isdir(path):
-                    shutil.rmtree(path)
-                print(f"Deleted old generation: {path}")
-            except Exception as e:
-                print(f"Error cleaning up {path}: {e}")
-
-
 def get_unique_id() -> str:
     return uuid.uuid4().hex[:8]
 
@@ -171,9 +160,30 @@ def save_text_to_file(text: str, file_path: str, mode: str = "w") -> None:
         f.write(text)
 
 
+def replace_text_file(file_path: str, text: str) -> None:
+    """
+    Writes text to a new file that then replaces file_path. Generated files
+    may be hardlinks into the installed base project (see WEBDSL_BASE_COPY),
+    which writing through them would change as well.
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf8") as f:
+            f.write(text)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def read_upload_file(file: UploadFile) -> str:
+    return file.file.read().decode("utf8")
+
+
 def save_upload_file(file: UploadFile, file_path: str) -> None:
-    content = file.file.read().decode("utf8")
-    save_text_to_file(content, file_path)
+    save_text_to_file(read_upload_file(file), file_path)
 
 
 def save_base64_to_file(encoded_str: str, file_path: str) -> None:
@@ -182,8 +192,17 @@ def save_base64_to_file(encoded_str: str, file_path: str) -> None:
         f.write(decoded)
 
 
-def _run_ssh_command_base(command_parts, timeout):
-    base_ssh_args = [
+_ssh_connection_slots = itertools.count()
+
+
+def ssh_base_args(slot: Optional[int] = None) -> List[str]:
+    """
+    Options of the ssh commands to the VM. Commands take the persistent
+    connections in turn (see ControlMaster in ssh_config(5)), or the one of
+    slot: the first command of a connection opens it, later ones only open
+    a session on it, and a connection that died is opened again.
+    """
+    args = [
         "-p",
         str(VM_MACHINE_SSH_PORT),
         "-o",
@@ -192,10 +211,43 @@ def _run_ssh_command_base(command_parts, timeout):
         "UserKnownHostsFile=/dev/null",
         "-o",
         "BatchMode=yes",
+        "-o",
+        f"ServerAliveInterval={SSH_KEEPALIVE_INTERVAL}",
+        "-o",
+        "ServerAliveCountMax=3",
         "-i",
         SSH_KEY_PATH,
     ]
-    full_command = command_parts[:1] + base_ssh_args + command_parts[1:]
+    if SSH_CONTROL_PERSIST > 0:
+        if slot is None:
+            slot = next(_ssh_connection_slots) % SSH_CONTROL_CONNECTIONS
+        os.makedirs(SSH_CONTROL_DIR, mode=0o700, exist_ok=True)
+        args += [
+            "-o",
+            "ControlMaster=auto",
+            "-o",
+            f"ControlPath={os.path.join(SSH_CONTROL_DIR, f'%C-{slot}')}",
+            "-o",
+            f"ControlPersist={SSH_CONTROL_PERSIST}",
+        ]
+    return args
+
+
+def close_ssh_connections() -> None:
+    """Closes the persistent SSH connections to the VM that are open."""
+    if SSH_CONTROL_PERSIST <= 0 or not VM_MACHINE_IP:
+        return
+    for slot in range(SSH_CONTROL_CONNECTIONS):
+        subprocess.run(
+            ["ssh", *ssh_base_args(slot), "-O", "exit", f"{VM_MACHINE_USER}@{VM_MACHINE_IP}"],
+            capture_output=True,
+            check=False,
+            timeout=10,
+        )
+
+
+def _run_ssh_command_base(command_parts, timeout):
+    full_command = command_parts[:1] + ssh_base_args() + command_parts[1:]
     print(f"Executing: {' '.join(full_command)}")
 
     process = subprocess.Popen(
@@ -224,20 +276,7 @@ def run_remote_ssh_command(command_to_execute, timeout=60):
 def _run_ssh_command_base_capture(
     command_parts: List[str], timeout: int
 ) -> CapturedSSHResult:
-    base_ssh_args = [
-        "-p",
-        str(VM_MACHINE_SSH_PORT),
-        "-o",
-        "StrictHostKeyChecking=no",
-        "-o",
-        "UserKnownHostsFile=/dev/null",
-        "-o",
-        "BatchMode=yes",
-        "-i",
-        SSH_KEY_PATH,
-    ]
-
-    full_command = command_parts[:1] + base_ssh_args + command_parts[1:]
+    full_command = command_parts[:1] + ssh_base_args() + command_parts[1:]
     # print(f"Preparing to execute (Capture): {' '.join(full_command)}") # Optional: for debugging this func
 
     try:
@@ -320,22 +359,19 @@ def postprocess_generation_for_deployment(
         ] = "0.0.0.0"  # Ensure it listens on all interfaces since it has auth
         config["websocket"]["port"] = backend_ws_internal_port
 
-    with open(config_path, "w", encoding="utf8") as f:
-        yaml.dump(config, f, default_flow_style=False)
+    replace_text_file(config_path, yaml.dump(config, default_flow_style=False))
 
     # Change the frontend env with the correct ip for the backend
     env_path = os.path.join(generation_dir, "frontend", ".env")
-    with open(env_path, "r+", encoding="utf8") as f:
+    with open(env_path, "r", encoding="utf8") as f:
         content = f.read()
-        updated = re.sub(
-            r"^VITE_API_BASE_URL\s*=\s*.*$",
-            f"VITE_API_BASE_URL=https://{VM_MACHINE_DOMAIN}/apps/{uid}/api/",
-            content,
-            flags=re.MULTILINE,
-        )
-        f.seek(0)
-        f.write(updated)
-        f.truncate()
+    updated = re.sub(
+        r"^VITE_API_BASE_URL\s*=\s*.*$",
+        f"VITE_API_BASE_URL=https://{VM_MACHINE_DOMAIN}/apps/{uid}/api/",
+        content,
+        flags=re.MULTILINE,
+    )
+    replace_text_file(env_path, updated)
 
     traefik_port = 80
 
@@ -343,26 +379,21 @@ def postprocess_generation_for_deployment(
     ws_path = os.path.join(
         generation_dir, "frontend", "src", "context", "websocketConfig.json"
     )
-    with open(ws_path, "r+", encoding="utf8") as f:
-        updated_data = {"host": VM_MACHINE_DOMAIN, "port": f"/apps/{uid}/ws/", "secure": "enabled"}
-        updated = json.dumps(updated_data, indent=4)
-        # Write the new content
-        f.seek(0)
-        f.write(updated)
-        f.truncate()
+    updated_data = {"host": VM_MACHINE_DOMAIN, "port": f"/apps/{uid}/ws/", "secure": "enabled"}
+    updated = json.dumps(updated_data, indent=4)
+    # Write the new content
+    replace_text_file(ws_path, updated)
 
     # Change the backend app initialization with the correct path
     main_backend_path = os.path.join(generation_dir, "backend", "main.py")
-    with open(main_backend_path, "r+", encoding="utf8") as f:
+    with open(main_backend_path, "r", encoding="utf8") as f:
         content = f.read()
-        updated = re.sub(
-            r"app = FastAPI\(\)",
-            f'app = FastAPI(root_path="/apps/{uid}/api")',
-            content,
-        )
-        f.seek(0)
-        f.write(updated)
-        f.truncate()
+    updated = re.sub(
+        r"app = FastAPI\(\)",
+        f'app = FastAPI(root_path="/apps/{uid}/api")',
+        content,
+    )
+    replace_text_file(main_backend_path, updated)
 
     # Inject traefik labels into docker-compose.yml
     compose_path = os.path.join(generation_dir, "docker-compose.yml")
@@ -0,0 +1,209 @@
+import asyncio
+import contextlib
+import functools
+import io
+import multiprocessing
+import pickle
+import signal
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import HTTPException
+
+from .config import WORKER_JOB_TIMEOUT, WORKER_PROCESSES, WORKER_QUEUE_LIMIT
+
+# Extra time the API waits for a job beyond its timeout, for a worker that
+# cannot be interrupted (e.g. on a platform without SIGALRM)
+TIMEOUT_GRACE = 5.0
+
+
+class JobTimeout(BaseException):
+    """
+    Raised in a worker when a job runs longer than the job timeout. Like
+    KeyboardInterrupt, it is not caught by the `except Exception` handlers
+    of the job.
+    """
+
+
+class JobError(Exception):
+    """Stands in for an error of a job that cannot be sent back to the API."""
+
+
+class JobHTTPError(Exception):
+    """
+    Carries an HTTPException raised by a job back to the API, which raises it
+    again (see to_http_exception). HTTPException does not promise to survive
+    pickling.
+    """
+
+    def __init__(self, status_code, detail, headers=None):
+        super().__init__(status_code, detail, headers)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+    def to_http_exception(self):
+        return HTTPException(
+            status_code=self.status_code, detail=self.detail, headers=self.headers
+        )
+
+
+def job_timeout_error(timeout):
+    return HTTPException(
+        status_code=504, detail=f"The job did not finish within {timeout:g} seconds"
+    )
+
+
+def _init_worker():
+    # Build the metamodel and load the templates once per worker, so every
+    # job only pays for its own model
+    from web_dsl.language import get_metamodel
+    from web_dsl.templating import TEMPLATE_GROUPS, get_template_env
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_metamodel()
+        for group in TEMPLATE_GROUPS:
+            get_template_env(group)
+
+
+def _raise_timeout(signum, frame):
+    raise JobTimeout()
+
+
+def _run_job(timeout, fn, args):
+    """Runs a job in a worker, interrupting it after timeout seconds."""
+    use_alarm = bool(timeout) and hasattr(signal, "setitimer")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return fn(*args)
+    except HTTPException as e:
+        raise JobHTTPError(e.status_code, e.detail, e.headers) from None
+    except Exception as e:
+        # Errors that reference model objects (e.g. textX errors) cannot be
+        # pickled, and some cannot be unpickled (e.g. when their __init__
+        # takes other arguments), the API only needs their message
+        try:
+            pickle.loads(pickle.dumps(e))
+        except Exception:
+            raise JobError(str(e)) from None
+        raise
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _warm_up():
+    return None
+
+
+class WorkerPool:
+    """
+    Runs the CPU-bound work of the API (validation, generation and
+    transformations) in worker processes, so it never blocks the event loop.
+
+    At most `processes` jobs run at once and at most `queue_limit` more wait
+    for a free worker, further jobs are rejected with 429. A job running
+    longer than `timeout` seconds is interrupted in its worker and answered
+    with 504.
+    """
+
+    def __init__(
+        self,
+        processes=WORKER_PROCESSES,
+        queue_limit=WORKER_QUEUE_LIMIT,
+        timeout=WORKER_JOB_TIMEOUT,
+    ):
+        self.processes = processes
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            # The API process runs threads, so workers are not forked from it
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context("forkserver")
+                context.set_forkserver_preload(["web_dsl.api.workers"])
+            else:
+                context = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=context,
+                initializer=_init_worker,
+            )
+        return self._executor
+
+    def _job_done(self, executor, future):
+        with self._lock:
+            self.pending -= 1
+        if not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+            # A worker died during the job (e.g. killed for its memory), the
+            # next job starts new ones
+            self._discard_executor(executor)
+
+    def _discard_executor(self, executor):
+        with self._lock:
+            if self._executor is not executor:
+                return  # Already replaced
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(*args) on the pool and returns its concurrent future.
+        Raises HTTPException(429) when the queue is full.
+        """
+        with self._lock:
+            if self.pending >= self.processes + self.queue_limit:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many jobs in progress, try again later",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+        try:
+            executor = self._get_executor()
+            try:
+                future = executor.submit(_run_job, self.timeout, fn, args)
+            except RuntimeError:
+                # The pool is broken, as a worker died (e.g. killed for its
+                # memory), or was just discarded for that, start new workers
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(_run_job, self.timeout, fn, args)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        future.add_done_callback(functools.partial(self._job_done, executor))
+        return future
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the pool and returns its result."""
+        future = self.submit(fn, *args)
+        wait_timeout = self.timeout + TIMEOUT_GRACE if self.timeout else None
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), wait_timeout)
+        except (JobTimeout, asyncio.TimeoutError):
+            raise job_timeout_error(self.timeout)
+        except JobHTTPError as e:
+            raise e.to_http_exception() from None
+
+    async def start(self):
+        """Starts every worker, so the first requests do not wait for them."""
+        executor = self._get_executor()
+        futures = [executor.submit(_warm_up) for _ in range(self.processes)]
+        await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+worker_pool = WorkerPool()
@@ -0,0 +1,156 @@
+import errno
+import fnmatch
+import os
+import shutil
+from os.path import dirname, join
+
+THIS_DIR = dirname(__file__)
+BASE_DIR = join(THIS_DIR, "base")
+FRONTEND_BASE_DIR = join(BASE_DIR, "frontend_base")
+BACKEND_BASE_DIR = join(BASE_DIR, "backend_base")
+
+# Set WEBDSL_BASE_COPY to 'hardlink' to hardlink the base project files into
+# the output. Only use it where generated projects are not edited in place
+# (e.g. a generation service that archives the output), since an in-place
+# edit would also change the installed base project.
+BASE_COPY_ENV = "WEBDSL_BASE_COPY"
+COPY_MODES = ("auto", "hardlink", "copy")
+
+# Files and directories of the base projects that are never copied
+IGNORED_PATTERNS = (
+    "node_modules",
+    "dist",
+    "build",
+    "coverage",
+    ".vite",
+    ".cache",
+    ".git",
+    "__pycache__",
+    "*.pyc",
+    ".DS_Store",
+    ".env",
+)
+
+# Linux ioctl that clones a file (reflink) on copy-on-write filesystems
+FICLONE = 0x40049409
+_REFLINK_ERRORS = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL)
+_LINK_ERRORS = (errno.EXDEV, errno.EPERM, errno.EACCES, errno.EMLINK, errno.ENOTSUP)
+
+
+def is_ignored(name):
+    return any(fnmatch.fnmatch(name, pattern) for pattern in IGNORED_PATTERNS)
+
+
+# base_dir -> (directory mtimes, manifest)
+_manifest_cache = {}
+
+
+def _scan_base_project(base_dir):
+    manifest = []
+    dir_mtimes = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs[:] = sorted(d for d in dirs if not is_ignored(d))
+        dir_mtimes.append((root, os.stat(root).st_mtime_ns))
+        rel_root = os.path.relpath(root, base_dir)
+        for name in sorted(files):
+            if not is_ignored(name):
+                manifest.append(os.path.normpath(join(rel_root, name)))
+    return dir_mtimes, manifest
+
+
+def base_project_manifest(base_dir):
+    """
+    Returns the relative paths of the files of a base project, without the
+    ignored files and directories. The manifest is rescanned only when a
+    directory of the base project changed (i.e. files were added or removed).
+    """
+    cached = _manifest_cache.get(base_dir)
+    if cached is not None:
+        dir_mtimes, manifest = cached
+        try:
+            if all(os.stat(d).st_mtime_ns == mtime for d, mtime in dir_mtimes):
+                return manifest
+        except OSError:
+            pass
+    dir_mtimes, manifest = _scan_base_project(base_dir)
+    _manifest_cache[base_dir] = (dir_mtimes, manifest)
+    return manifest
+
+
+class BaseProjectCopier:
+    """
+    Copies files with the cheapest method the filesystems support: hardlinks
+    (only in 'hardlink' mode), then reflinks, then a regular buffered copy.
+    A method that fails once is not tried again by the same copier.
+    """
+
+    def __init__(self, mode=None):
+        mode = mode or os.getenv(BASE_COPY_ENV, "auto")
+        if mode not in COPY_MODES:
+            raise ValueError(
+                f"Unknown base project copy mode '{mode}', "
+                f"expected one of {', '.join(COPY_MODES)}"
+            )
+        self.use_hardlinks = mode == "hardlink"
+        self.use_reflinks = mode != "copy"
+        self._created_dirs = set()
+        try:
+            import fcntl
+
+            self._ioctl = fcntl.ioctl
+        except ImportError:  # Not available on Windows
+            self.use_reflinks = False
+
+    def makedirs(self, path):
+        if path not in self._created_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._created_dirs.add(path)
+
+    def copy_file(self, src, dst):
+        self.makedirs(dirname(dst))
+        # Never write through an existing file, which may be a hardlink into
+        # the base project from an earlier generation
+        try:
+            os.unlink(dst)
+        except FileNotFoundError:
+            pass
+
+        if self.use_hardlinks:
+            try:
+                os.link(src, dst)
+                return
+            except OSError as e:
+                if e.errno not in _LINK_ERRORS:
+                    raise
+                self.use_hardlinks = False
+
+        if self.use_reflinks and self._reflink(src, dst):
+            shutil.copymode(src, dst)
+            return
+
+        shutil.copy(src, dst)
+
+    def _reflink(self, src, dst):
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                self._ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in _REFLINK_ERRORS:
+                raise
+            self.use_reflinks = False
+            os.unlink(dst)
+            return False
+
+
+def copy_base_project(base_dir, output_dir, skip=(), copier=None):
+    """
+    Copies the files of a base project into output_dir, through copier (a
+    BaseProjectCopier or an output sink). Relative paths in skip (e.g. files
+    that are rendered from templates afterwards) are not copied.
+    """
+    copier = copier or BaseProjectCopier()
+    skip = {os.path.normpath(p) for p in skip}
+    for rel_path in base_project_manifest(base_dir):
+        if rel_path not in skip:
+            copier.copy_file(join(base_dir, rel_path), join(output_dir, rel_path))
@@ -0,0 +1,83 @@
+import contextlib
+import glob
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ValidationResult:
+    """Outcome of validating a single model file."""
+
+    def __init__(self, model_path, error=None, seconds=0.0):
+        self.model_path = model_path
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def expand_model_paths(patterns):
+    """
+    Expands file paths and glob patterns (`**` matches nested directories)
+    into a list of unique model files, keeping the order they were given in.
+    Raises FileNotFoundError for a path or pattern that matches no file.
+    """
+    model_paths = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(
+                p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p)
+            )
+        else:
+            matches = [pattern] if os.path.isfile(pattern) else []
+        if not matches:
+            raise FileNotFoundError(f"No model files match '{pattern}'")
+        for model_path in matches:
+            key = os.path.abspath(model_path)
+            if key not in seen:
+                seen.add(key)
+                model_paths.append(model_path)
+    return model_paths
+
+
+def _init_worker():
+    # Build the metamodel once per worker so every file only pays for parsing
+    from .language import get_metamodel
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        get_metamodel()
+
+
+def validate_file(model_path, use_cache=None):
+    """Builds (and so validates) a model, capturing its output and errors."""
+    from .language import build_model
+
+    start = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            build_model(model_path, use_cache=use_cache)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+    return ValidationResult(model_path, error, time.perf_counter() - start)
+
+
+def validate_files(model_paths, jobs=None, use_cache=None):
+    """
+    Validates model files in a pool of worker processes, each of which keeps
+    its metamodel between files. Yields a ValidationResult per file in the
+    order of model_paths. With jobs=1 the files are validated in-process.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    jobs = min(jobs, len(model_paths))
+    if jobs <= 1:
+        for model_path in model_paths:
+            yield validate_file(model_path, use_cache)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker) as pool:
+        yield from pool.map(validate_file, model_paths, [use_cache] * len(model_paths))
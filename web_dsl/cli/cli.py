@@ -1,15 +1,15 @@
 import os
+import time
 import click
+from contextlib import nullcontext
 from rich.console import Console
-from rich import pretty
 
-from web_dsl.language import build_model
-from web_dsl.generate import generate
-from web_dsl.m2m.openapi_to_webdsl import transform_openapi_to_webdsl
-from web_dsl.m2m.goaldsl_to_webdsl import transform_goaldsl_to_webdsl
-from web_dsl.m2m.asyncapi_to_webdsl import transform_asyncapi_to_webdsl
+from web_dsl.profiling import Profiler
+
+# The language, the generator and the transformations are imported by the
+# commands that use them, which keeps `webdsl --help` and `webdsl validate`
+# from loading templates, fastapi, yaml and goal_dsl.
 
-pretty.install()
 console = Console()
 
 ASCII_HEADER = r"""
@@ -24,6 +24,31 @@ ASCII_HEADER = r"""
 """
 
 
+def profile_options(f):
+    """Adds the --profile and --profile-format options to a command."""
+    f = click.option(
+        "--profile-format",
+        type=click.Choice(["table", "json"]),
+        default="table",
+        show_default=True,
+        help="Output format of the profile.",
+    )(f)
+    f = click.option(
+        "--profile",
+        is_flag=True,
+        default=False,
+        help="Report wall time and peak memory of each phase.",
+    )(f)
+    return f
+
+
+def print_profile(profiler, profile_format):
+    if profile_format == "json":
+        click.echo(profiler.to_json())
+    else:
+        click.echo(profiler.format_table())
+
+
 @click.group(
     help=(
         "webdsl: A CLI for validating your DSL model and\n"
@@ -45,26 +70,87 @@ def cli(ctx):
 
 @cli.command(
     "validate",
-    help="Validate your model file for syntax and semantic errors.",
-    short_help="Validate a .wdsl model",
+    help=(
+        "Validate your model files for syntax and semantic errors.\n\n"
+        "MODEL_PATHS are model files or glob patterns. Several models are "
+        "validated in parallel."
+    ),
+    short_help="Validate .wdsl models",
 )
-@click.argument(
-    "model_path",
-    type=click.Path(exists=True, dir_okay=False, readable=True),
+@click.argument("model_paths", nargs=-1, required=True)
+@click.option(
+    "--cache/--no-cache",
+    default=None,
+    help="Use the on-disk model cache (default: $WEBDSL_MODEL_CACHE).",
 )
-def validate(model_path):
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of worker processes (default: number of CPUs).",
+)
+@profile_options
+def validate(model_paths, cache, jobs, profile, profile_format):
     """
-    Validate a .wdsl model file.
+    Validate .wdsl model files.
 
     Examples:
       webdsl validate examples/entity_test.wdsl
+      webdsl validate --jobs 8 "models/**/*.wdsl"
     """
+    from web_dsl.batch import expand_model_paths
+
+    try:
+        paths = expand_model_paths(model_paths)
+    except FileNotFoundError as e:
+        raise click.BadParameter(str(e), param_hint="MODEL_PATHS")
+
+    if len(paths) > 1:
+        if profile:
+            raise click.UsageError("--profile can only be used with a single model.")
+        validate_many(paths, cache, jobs)
+        return
+
+    from web_dsl.language import build_model
+
+    profiler = Profiler() if profile else None
     try:
-        build_model(model_path)
+        with profiler or nullcontext():
+            build_model(paths[0], use_cache=cache)
         console.print("✔ Model is valid.", style="green")
     except Exception as e:
         console.print(f"✖ Validation failed:\n{e}", style="bold red")
         raise SystemExit(1)
+    finally:
+        if profiler is not None:
+            print_profile(profiler, profile_format)
+
+
+def validate_many(model_paths, cache, jobs):
+    """Validates several models in parallel and prints a per-file report."""
+    from web_dsl.batch import validate_files
+
+    start = time.perf_counter()
+    failed = 0
+    for result in validate_files(model_paths, jobs=jobs, use_cache=cache):
+        timing = f"{result.seconds * 1e3:8.1f} ms"
+        if result.ok:
+            console.print(f"✔ {timing}  {result.model_path}", style="green")
+        else:
+            failed += 1
+            console.print(f"✖ {timing}  {result.model_path}", style="bold red")
+            console.print(f"    {result.error}", style="red", highlight=False)
+    elapsed = time.perf_counter() - start
+
+    summary = (
+        f"{len(model_paths) - failed} valid, {failed} failed "
+        f"({len(model_paths)} models in {elapsed:.2f} s)"
+    )
+    if failed:
+        console.print(f"✖ {summary}", style="bold red")
+        raise SystemExit(1)
+    console.print(f"✔ {summary}", style="green")
 
 
 @cli.command(
@@ -82,7 +168,27 @@ def validate(model_path):
     default="generated",
     type=click.Path(file_okay=False, writable=True),
 )
-def generate_command(model_path, output_dir):
+@click.option(
+    "--cache/--no-cache",
+    default=None,
+    help="Use the on-disk model cache (default: $WEBDSL_MODEL_CACHE).",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Number of processes rendering screens (default: number of CPUs).",
+)
+@click.option(
+    "--watch",
+    is_flag=True,
+    help="Regenerate whenever a file of the model (or its imports) changes.",
+)
+@profile_options
+def generate_command(
+    model_path, output_dir, cache, jobs, watch, profile, profile_format
+):
     """
     Generate web application boilerplate from your .wdsl model.
 
@@ -91,7 +197,17 @@ def generate_command(model_path, output_dir):
     Examples:
       webdsl generate examples/my_model.wdsl
       webdsl generate examples/my_model.wdsl ./my_output_folder
+      webdsl generate --watch examples/my_model.wdsl ./my_output_folder
     """
+    from web_dsl.generate import generate
+
+    if watch:
+        if profile:
+            raise click.UsageError("--profile cannot be used with --watch.")
+        watch_generate(model_path, output_dir, cache, jobs)
+        return
+
+    profiler = Profiler() if profile else None
     try:
         output = os.path.abspath(output_dir)
 
@@ -104,7 +220,8 @@ def generate_command(model_path, output_dir):
         os.makedirs(output, exist_ok=True)
 
         console.print(f"Generating from model: {model_path}", style="yellow")
-        generate(model_path, output)
+        with profiler or nullcontext():
+            generate(model_path, output, use_cache=cache, jobs=jobs)
 
         console.print(
             f"✔ Generation complete. Files created at: {output}", style="green"
@@ -113,6 +230,30 @@ def generate_command(model_path, output_dir):
     except Exception as e:
         console.print(f"✖ Generation error:\n{e}", style="bold red")
         raise SystemExit(1)
+    finally:
+        if profiler is not None:
+            print_profile(profiler, profile_format)
+
+
+def watch_generate(model_path, output_dir, cache, jobs):
+    from web_dsl.watch import watch_and_generate
+
+    output = os.path.abspath(output_dir)
+    if os.path.exists(output) and not os.path.isdir(output):
+        raise click.ClickException(
+            f"Output path '{output}' exists and is not a directory."
+        )
+
+    def report(message, ok):
+        style = {True: "green", False: "bold red", None: "cyan"}[ok]
+        console.print(message, style=style)
+
+    try:
+        watch_and_generate(
+            model_path, output, use_cache=cache, jobs=jobs, report=report
+        )
+    except KeyboardInterrupt:
+        console.print("Stopped watching.", style="yellow")
 
 
 @cli.group(help="Transform specifications into WebDSL models.")
@@ -141,6 +282,8 @@ def openapi_command(openapi_path, output_file):
       webdsl openapi examples/openapi_spec.yaml
       webdsl openapi examples/openapi_spec.yaml ./my_model.wdsl
     """
+    from web_dsl.m2m.openapi_to_webdsl import transform_openapi_to_webdsl
+
     try:
         output = os.path.abspath(output_file)
 
@@ -183,6 +326,8 @@ def goaldsl_command(goaldsl_path, output_file):
       webdsl goaldsl examples/goaldsl_spec.gdsl
       webdsl goaldsl examples/goaldsl_spec.gdsl ./my_output_folder
     """
+    from web_dsl.m2m.goaldsl_to_webdsl import transform_goaldsl_to_webdsl
+
     try:
         output = os.path.abspath(output_file)
 
@@ -225,6 +370,8 @@ def openapi_command(asyncapi_path, output_file):
       webdsl asyncapi examples/asyncapi_spec.yaml
       webdsl asyncapi examples/asyncapi_spec.yaml ./my_model.wdsl
     """
+    from web_dsl.m2m.asyncapi_to_webdsl import transform_asyncapi_to_webdsl
+
     try:
         output = os.path.abspath(output_file)
 
@@ -246,5 +393,40 @@ def openapi_command(asyncapi_path, output_file):
         raise SystemExit(1)
 
 
+@cli.group(help="Manage the precompiled Jinja2 templates.")
+def templates():
+    pass
+
+
+@templates.command("compile", help="Precompile the templates for faster startup.")
+@click.option(
+    "--target",
+    default=None,
+    type=click.Path(file_okay=False, writable=True),
+    help="Output directory (default: the installed package).",
+)
+def templates_compile(target):
+    from web_dsl.templating import COMPILED_TEMPLATES_PATH, compile_templates
+
+    compile_templates(target or COMPILED_TEMPLATES_PATH)
+
+
+@templates.command(
+    "check", help="Check that the precompiled templates match their sources."
+)
+def templates_check():
+    from web_dsl.templating import TEMPLATE_GROUPS, is_bundle_fresh
+
+    stale = [group for group in TEMPLATE_GROUPS if not is_bundle_fresh(group)]
+    for group in stale:
+        console.print(
+            f"✖ Precompiled '{group}' templates are missing or out of date.",
+            style="bold red",
+        )
+    if stale:
+        raise SystemExit(1)
+    console.print("✔ Precompiled templates are up to date.", style="green")
+
+
 def main():
     cli(prog_name="webdsl")
@@ -1,12 +1,17 @@
 import os
 import secrets
 import base64
-import subprocess
-from jinja2 import Environment, FileSystemLoader, TemplateError
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from .language import build_model
+from .base_project import FRONTEND_BASE_DIR, BACKEND_BASE_DIR, copy_base_project
+from .output import DirectoryOutput
+from .model_index import ModelIndex
+from .profiling import profile_phase
+from .templating import get_template_env
 from textx.model import get_children_of_type
 import traceback
-from web_dsl.definitions import TEMPLATES_PATH
 from textx import generator
 
 
@@ -15,171 +20,355 @@ def generate_api_key(length=32):
     return base64.urlsafe_b64encode(key).rstrip(b"=").decode("utf-8")
 
 
-# Set up the Jinja2 environment and load templates
-frontend_env = Environment(
-    loader=FileSystemLoader(f"{TEMPLATES_PATH}/frontend"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    extensions=["jinja2.ext.loopcontrols"],
+def render_template(template, **context):
+    with profile_phase(f"render {template.name}"):
+        return template.render(**context)
+
+
+def read_generated_keys(gen_path):
+    """
+    Returns the API and secret key of a previously generated backend, so
+    that regenerating a project does not rotate them.
+    """
+    keys = {}
+    try:
+        with open(os.path.join(gen_path, "backend", ".env"), encoding="utf-8") as f:
+            for line in f:
+                name, sep, value = line.strip().partition("=")
+                if sep:
+                    keys[name] = value
+    except OSError:
+        return None
+    if keys.get("API_KEY") and keys.get("SECRET_KEY"):
+        return keys["API_KEY"], keys["SECRET_KEY"]
+    return None
+
+
+# Below this number of screens, starting worker processes costs more than
+# rendering the screens sequentially
+PARALLEL_SCREENS_THRESHOLD = 8
+
+# Files of the base projects that generate() renders from templates
+FRONTEND_RENDERED_FILES = (
+    ".env",
+    "index.html",
+    "src/App.jsx",
+    "src/context/websocketConfig.json",
 )
-backend_env = Environment(
-    loader=FileSystemLoader(f"{TEMPLATES_PATH}/backend"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    extensions=["jinja2.ext.loopcontrols"],
+BACKEND_RENDERED_FILES = (
+    ".env",
+    "Dockerfile",
+    "config.yaml",
+    "db_config.yaml",
+    "endpoint_config.yaml",
+    "user_roles.yaml",
 )
 
-frontend_base_dir = os.path.join(os.path.dirname(__file__), "base", "frontend_base")
-backend_base_dir = os.path.join(os.path.dirname(__file__), "base", "backend_base")
+# Module in frontend/src/components of every component type
+COMPONENT_MODULES = {
+    "Gauge": "Gauge",
+    "LineChart": "CustomLineChart",
+    "BarChart": "CustomBarChart",
+    "PieChart": "CustomPieChart",
+    "LiveTable": "LiveTable",
+    "JsonViewer": "JsonViewer",
+    "Alive": "Alive",
+    "Publish": "Publish",
+    "Notification": "LiveNotification",
+    "Image": "CustomImage",
+    "Text": "Text",
+    "Logs": "Logs",
+    "Table": "Table",
+    "Form": "CustomForm",
+    "ProgressBar": "ProgressBar",
+}
+
+
+def get_screen_components(screen):
+    """
+    Returns the component modules a screen renders, so that the screen only
+    imports those. Follows the same elements as the screen template and
+    component_macros.render_element.
+    """
+    modules = set()
+
+    def visit(element):
+        if element is None:
+            return
+        kind = element.__class__.__name__
+        if kind in ("Row", "Column"):
+            for child in element.elements:
+                visit(child)
+        elif kind == "ComponentRef":
+            visit(element.ref)
+        elif getattr(element, "isComponent", False):
+            component_type = getattr(element, "type", None) or element
+            if component_type.name in COMPONENT_MODULES:
+                modules.add(COMPONENT_MODULES[component_type.name])
+        elif kind == "Condition":
+            modules.add("Condition")
+            for item in element.component + getattr(element, "componentElse", []):
+                visit(item)
+        elif kind == "Repetition":
+            modules.add("Repetition")
+            visit(element.component)
+            visit(getattr(element, "componentElse", None))
+        if getattr(element, "allowed_roles", None):
+            modules.add("ProtectedComponent")
+
+    for element in screen.elements:
+        if element.__class__.__name__ in ("ComponentRef", "Component", "Row", "Column"):
+            visit(element)
+    return sorted(modules)
+
+
+def get_screen_entities(screen):
+    """Returns the entities used by the components, conditions and loops of a screen."""
+    index = ModelIndex([screen])
+
+    # Components of the screen and the components it references with 'use'
+    all_components = index.of_type("Component")
+    for component_ref in index.of_type("ComponentRef"):
+        all_components.append(component_ref.ref)
+
+    entities = set()
+    for component in all_components:
+        if getattr(component, "entity", None) is not None:
+            entities.add(component.entity)
+
+    for condition in index.of_type("Condition"):
+        if getattr(condition, "entities", None) is not None:
+            entities.update(condition.entities)
+
+    for repetition in index.of_type("Repetition"):
+        if getattr(repetition, "entities_list", None) is not None:
+            entities.update(repetition.entities)
+
+    # Sorted so that regenerating an unchanged screen renders the same file
+    return sorted(entities, key=lambda entity: entity.name)
+
+
+def render_screen(screen_template, screen):
+    """
+    Renders a single screen. Returns the rendered content and None, or None
+    and the formatted error if rendering failed.
+    """
+    from jinja2 import TemplateError
 
-screen_template = frontend_env.get_template("screen_template.jinja")
-app_template = frontend_env.get_template("app_template.jinja")
-index_html_template = frontend_env.get_template("index_html_template.jinja")
-websocket_context_config_template = frontend_env.get_template(
-    "websocket_context_config.jinja"
-)
-dot_env_frontend_template = frontend_env.get_template("dot_env_template.jinja")
-dot_env_backend_template = backend_env.get_template("dot_env_template.jinja")
+    print(f"Generating screen: {screen.name}")
+    try:
+        entities = get_screen_entities(screen)
+        components = get_screen_components(screen)
+        content = render_template(
+            screen_template, screen=screen, entities=entities, components=components
+        )
+        return content, None
+    except TemplateError:
+        return None, traceback.format_exc()
 
-config_template = backend_env.get_template("config_template.jinja")
-endpoint_config_template = backend_env.get_template("endpoint_config.jinja")
-db_config_template = backend_env.get_template("db_config.jinja")
-dockerfile_template = backend_env.get_template("dockerfile_template.jinja")
-user_roles_template = backend_env.get_template("user_roles_template.jinja")
 
-docker_compose_template = backend_env.get_template("docker_compose_template.jinja")
+# Screens to render, inherited by forked worker processes
+_screen_jobs = None
 
 
-def generate(model_path, gen_path):
+def _render_screen_job(i):
+    screen_template, screens = _screen_jobs
+    return render_screen(screen_template, screens[i])
+
+
+def can_fork_workers():
+    """
+    Screens are rendered in forked processes, which inherit the model
+    instead of pickling it. Forking is only safe in a single-threaded process.
+    """
+    return (
+        "fork" in multiprocessing.get_all_start_methods()
+        and threading.active_count() == 1
+    )
+
+
+def render_screens(screen_template, screens, jobs=None):
+    """
+    Renders screens across a pool of worker processes.
+    Yields (screen, content, error) in the order of screens. jobs=None uses
+    every CPU once there are at least PARALLEL_SCREENS_THRESHOLD screens,
+    jobs=1 renders in-process.
+    """
+    global _screen_jobs
+
+    if jobs is None:
+        jobs = os.cpu_count() if len(screens) >= PARALLEL_SCREENS_THRESHOLD else 1
+    jobs = min(jobs or 1, len(screens))
+    if jobs <= 1 or not can_fork_workers():
+        for screen in screens:
+            yield (screen, *render_screen(screen_template, screen))
+        return
+
+    _screen_jobs = (screen_template, screens)
+    try:
+        context = multiprocessing.get_context("fork")
+        chunksize = max(1, len(screens) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as pool:
+            results = pool.map(
+                _render_screen_job, range(len(screens)), chunksize=chunksize
+            )
+            for screen, result in zip(screens, results):
+                yield (screen, *result)
+    finally:
+        _screen_jobs = None
+
+
+def generate(model_path, gen_path, use_cache=None, jobs=None, output=None, files=None):
+    """
+    Generates the project of a model into gen_path. The files go to output,
+    an output sink rooted at gen_path (see web_dsl.output), by default a
+    DirectoryOutput that writes them into gen_path incrementally. With
+    files, the model is built from memory (see build_model).
+    """
     # Read and parse the DSL model
     print(f"Reading model from: {model_path}")
-    model = build_model(model_path)
+    with profile_phase("build model"):
+        model = build_model(model_path, use_cache=use_cache, files=files)
+    return generate_from_model(model, gen_path, jobs=jobs, output=output)
+
+
+def generate_from_model(model, gen_path, jobs=None, output=None):
+    """Generates the project of an already built model, see generate()."""
+    if output is None:
+        output = DirectoryOutput(gen_path)
+    elif os.path.normpath(output.root) != os.path.normpath(gen_path):
+        raise ValueError(f"Output sink is rooted at {output.root}, not {gen_path}")
+
+    # Templates are compiled on first use and cached by the environments
+    frontend_env = get_template_env("frontend")
+    backend_env = get_template_env("backend")
+    screen_template = frontend_env.get_template("screen_template.jinja")
+    app_template = frontend_env.get_template("app_template.jinja")
+    index_html_template = frontend_env.get_template("index_html_template.jinja")
+    websocket_context_config_template = frontend_env.get_template(
+        "websocket_context_config.jinja"
+    )
+    dot_env_frontend_template = frontend_env.get_template("dot_env_template.jinja")
+    dot_env_backend_template = backend_env.get_template("dot_env_template.jinja")
+
+    config_template = backend_env.get_template("config_template.jinja")
+    endpoint_config_template = backend_env.get_template("endpoint_config.jinja")
+    db_config_template = backend_env.get_template("db_config.jinja")
+    dockerfile_template = backend_env.get_template("dockerfile_template.jinja")
+    user_roles_template = backend_env.get_template("user_roles_template.jinja")
+
+    docker_compose_template = backend_env.get_template("docker_compose_template.jinja")
+
     # Create the output directory with frontend and backend subdirectories
     print(f"Creating output directory: {gen_path}")
-    os.makedirs(gen_path, exist_ok=True)
-    os.makedirs(os.path.join(gen_path, "frontend"), exist_ok=True)
-    os.makedirs(os.path.join(gen_path, "backend"), exist_ok=True)
+    output.makedirs(os.path.join(gen_path, "frontend"))
+    output.makedirs(os.path.join(gen_path, "backend"))
 
-    # Copy the base frontend project contents to the output directory
+    # Copy the base frontend project contents to the output directory,
+    # except for the files that are rendered below
     print(f"Copying frontend base contents to: {gen_path}")
-    subprocess.run(
-        ["cp", "-r", f"{frontend_base_dir}/.", os.path.join(gen_path, "frontend")]
-    )
+    screen_files = [
+        f"src/screens/{screen.name}.jsx" for screen in model.aggregated_screens
+    ]
+    with profile_phase("copy base project"):
+        copy_base_project(
+            FRONTEND_BASE_DIR,
+            os.path.join(gen_path, "frontend"),
+            skip=FRONTEND_RENDERED_FILES + tuple(screen_files),
+            copier=output,
+        )
 
     # Copy the base backend project contents to the output directory
     print(f"Copying backend base contents to: {gen_path}")
-    subprocess.run(
-        ["cp", "-r", f"{backend_base_dir}/.", os.path.join(gen_path, "backend")]
-    )
+    with profile_phase("copy base project"):
+        copy_base_project(
+            BACKEND_BASE_DIR,
+            os.path.join(gen_path, "backend"),
+            skip=BACKEND_RENDERED_FILES,
+            copier=output,
+        )
 
     # ========= Generate frontend files============
     # Prepare the output directories
     screens_dir = os.path.join(gen_path, "frontend", "src", "screens")
-    if not os.path.exists(screens_dir):
-        os.makedirs(screens_dir, exist_ok=True)
+    output.makedirs(screens_dir)
 
     # Generate the screen components
-    for screen in model.aggregated_screens:
-
-        # Get all entities used in this screen
-        all_components = get_children_of_type("Component", screen)
-
-        # Get all component references
-        all_component_references = get_children_of_type("ComponentRef", screen)
-
-        # Augument the components with the references
-        for component_ref in all_component_references:
-            all_components.append(component_ref.ref)
-
-        # Get all entities used in this screen
-        entities = set()
-        for component in all_components:
-            if getattr(component, "entity", None) is not None:
-                entities.add(component.entity)
-
-        # Get all conditions used in this screen
-        all_conditions = get_children_of_type("Condition", screen)
-        for condition in all_conditions:
-            if getattr(condition, "entities", None) is not None:
-                entities_list = list(condition.entities)
-                for entity in entities_list:
-                    entities.add(entity)
-
-        # Get all repetitions used in this screen
-        all_repetitions = get_children_of_type("Repetition", screen)
-        for repetition in all_repetitions:
-            if getattr(repetition, "entities_list", None) is not None:
-                entities_list = list(repetition.entities)
-                for entity in entities_list:
-                    entities.add(entity)
-
-        # Transform the entities into a list
-        entities = list(entities)
-        print(f"Generating screen: {screen.name}")
-        try:
-            html_content = screen_template.render(screen=screen, entities=entities)
-        except TemplateError as e:
-            print("Jinja2 Template Error:", e)
-            traceback.print_exc()
-        output_file = os.path.join(screens_dir, f"{screen.name}.jsx")
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(html_content)
-        print(f"Generated: {output_file}")
+    screens = model.aggregated_screens
+    errors = []
+    with profile_phase("screens"):
+        rendered_screens = render_screens(screen_template, screens, jobs=jobs)
+        for screen, html_content, error in rendered_screens:
+            if error is not None:
+                print(f"Jinja2 Template Error in screen {screen.name}:\n{error}")
+                errors.append(f"{screen.name}: {error.splitlines()[-1]}")
+                continue
+            output_file = os.path.join(screens_dir, f"{screen.name}.jsx")
+            output.write_file(output_file, html_content)
+            print(f"Generated: {output_file}")
+    if errors:
+        error_text = "\n".join(f" - {e}" for e in errors)
+        raise Exception(f"Failed to render {len(errors)} screens:\n{error_text}")
 
     # Generate additional files like App.jsx and index.html
-    app_content = app_template.render(
-        webpage=model.processed_webpage, screens=model.aggregated_screens
+    app_content = render_template(
+        app_template, webpage=model.processed_webpage, screens=model.aggregated_screens
     )
     app_output_file = os.path.join(gen_path, "frontend", "src", "App.jsx")
-    with open(app_output_file, "w", encoding="utf-8") as f:
-        f.write(app_content)
+    output.write_file(app_output_file, app_content)
     print(f"Generated: {app_output_file}")
 
-    index_html_content = index_html_template.render(webpage=model.processed_webpage)
+    index_html_content = render_template(
+        index_html_template, webpage=model.processed_webpage
+    )
     index_html_output_file = os.path.join(gen_path, "frontend", "index.html")
-    with open(index_html_output_file, "w", encoding="utf-8") as f:
-        f.write(index_html_content)
+    output.write_file(index_html_output_file, index_html_content)
     print(f"Generated: {index_html_output_file}")
 
     # Generate websocket context config file
-    websocket_context_config_content = websocket_context_config_template.render(
-        websocket=model.processed_websocket
+    websocket_context_config_content = render_template(
+        websocket_context_config_template, websocket=model.processed_websocket
     )
     websocket_context_config_output_file = os.path.join(
         gen_path, "frontend", "src", "context", "websocketConfig.json"
     )
-    with open(websocket_context_config_output_file, "w", encoding="utf-8") as f:
-        f.write(websocket_context_config_content)
+    output.write_file(
+        websocket_context_config_output_file, websocket_context_config_content
+    )
     print(f"Generated: {websocket_context_config_output_file}")
 
     # Generate .env frontend file
-    api_key = generate_api_key()
-    secret_key = generate_api_key()
-    env_frontend_content = dot_env_frontend_template.render(
-        api=model.processed_api, api_key=api_key, secret_key=secret_key
+    keys = output.has_previous_generation and read_generated_keys(gen_path)
+    if keys:
+        api_key, secret_key = keys
+    else:
+        api_key = generate_api_key()
+        secret_key = generate_api_key()
+    env_frontend_content = render_template(
+        dot_env_frontend_template,
+        api=model.processed_api,
+        api_key=api_key,
+        secret_key=secret_key,
     )
     env_frontend_output_file = os.path.join(gen_path, "frontend", ".env")
-    with open(env_frontend_output_file, "w", encoding="utf-8") as f:
-        f.write(env_frontend_content)
+    output.write_file(env_frontend_output_file, env_frontend_content)
     print(f"Generated {env_frontend_output_file}")
 
     # ========= Generate backend files============
 
     # Generate .env backend file
-    env_backend_content = dot_env_backend_template.render(
-        api_key=api_key, secret_key=secret_key
+    env_backend_content = render_template(
+        dot_env_backend_template, api_key=api_key, secret_key=secret_key
     )
     env_backend_output_file = os.path.join(gen_path, "backend", ".env")
-    with open(env_backend_output_file, "w", encoding="utf-8") as f:
-        f.write(env_backend_content)
+    output.write_file(env_backend_output_file, env_backend_content)
     print(f"Generated {env_backend_output_file}")
 
     # Generate users roles config file
     users = model.aggregated_users
     user_roles_config_file = os.path.join(gen_path, "backend", "user_roles.yaml")
-    user_roles_config_content = user_roles_template.render(users=users)
-    with open(user_roles_config_file, "w", encoding="utf-8") as f:
-        f.write(user_roles_config_content)
+    user_roles_config_content = render_template(user_roles_template, users=users)
+    output.write_file(user_roles_config_file, user_roles_config_content)
     print(f"Generated: {user_roles_config_file}")
 
     # # Collect all components from the model to get what attributes of entities are actually used
@@ -230,17 +419,17 @@ def generate(model_path, gen_path):
     all_brokers = set()
     for broker in model.aggregated_brokers:
         all_brokers.add(broker)
-    all_brokers = list(all_brokers)
+    all_brokers = sorted(all_brokers, key=lambda broker: broker.name)
     config_dir = os.path.join(gen_path, "backend")
     config_output_file = os.path.join(config_dir, "config.yaml")
-    config_content = config_template.render(
+    config_content = render_template(
+        config_template,
         brokers=all_brokers,
         websocket=model.processed_websocket,
         api=model.processed_api,
         topic_configs=topic_configs,
     )
-    with open(config_output_file, "w", encoding="utf-8") as f:
-        f.write(config_content)
+    output.write_file(config_output_file, config_content)
     print(f"Generated: {config_output_file}")
 
     # Generate rest api config file
@@ -250,12 +439,12 @@ def generate(model_path, gen_path):
     endpoint_config_output_file = os.path.join(
         endpoint_config_dir, "endpoint_config.yaml"
     )
-    endpoint_config_content = endpoint_config_template.render(
+    endpoint_config_content = render_template(
+        endpoint_config_template,
         all_rest_apis=model.aggregated_restapis,
         all_rest_endpoints=model.aggregated_endpoints,
     )
-    with open(endpoint_config_output_file, "w", encoding="utf-8") as f:
-        f.write(endpoint_config_content)
+    output.write_file(endpoint_config_output_file, endpoint_config_content)
     print(f"Generated: {endpoint_config_output_file}")
 
     # Generate Database config
@@ -270,31 +459,42 @@ def generate(model_path, gen_path):
 
     db_config_dir = os.path.join(gen_path, "backend")
     db_config_output_file = os.path.join(db_config_dir, "db_config.yaml")
-    db_config_content = db_config_template.render(
-        mysql_databases=mysql_databases_list, mongo_databases=mongo_databases_list
+    db_config_content = render_template(
+        db_config_template,
+        mysql_databases=mysql_databases_list,
+        mongo_databases=mongo_databases_list,
     )
-    with open(db_config_output_file, "w", encoding="utf-8") as f:
-        f.write(db_config_content)
+    output.write_file(db_config_output_file, db_config_content)
     print(f"Generated: {db_config_output_file}")
 
     # Generate dockerfile
     dockerfile_output_file = os.path.join(gen_path, "backend", "Dockerfile")
-    dockerfile_content = dockerfile_template.render(
-        websocket=model.processed_websocket, api=model.processed_api
+    dockerfile_content = render_template(
+        dockerfile_template,
+        websocket=model.processed_websocket,
+        api=model.processed_api,
     )
-    with open(dockerfile_output_file, "w", encoding="utf-8") as f:
-        f.write(dockerfile_content)
+    output.write_file(dockerfile_output_file, dockerfile_content)
     print(f"Generated: {dockerfile_output_file}")
 
     # ========= Generate docker-compose file============
     docker_compose_output_file = os.path.join(gen_path, "docker-compose.yml")
-    docker_compose_content = docker_compose_template.render(
-        websocket=model.processed_websocket, api=model.processed_api
+    docker_compose_content = render_template(
+        docker_compose_template,
+        websocket=model.processed_websocket,
+        api=model.processed_api,
     )
-    with open(docker_compose_output_file, "w", encoding="utf-8") as f:
-        f.write(docker_compose_content)
+    output.write_file(docker_compose_output_file, docker_compose_content)
     print(f"Generated: {docker_compose_output_file}")
 
+    # Remove the files of screens that no longer exist and save the manifest
+    for removed_file in output.finalize():
+        print(f"Removed: {os.path.join(gen_path, removed_file)}")
+    print(
+        f"Wrote {len(output.written)} files, "
+        f"{len(output.files) - len(output.written)} unchanged"
+    )
+
     return gen_path
 
 
@@ -1,8 +1,15 @@
 # --- Imports ---
 from textx import metamodel_from_file, TextXSemanticError, get_metamodel, language
-from textx.model import get_children_of_type
+from textx.const import MULT_ONE, MULT_OPTIONAL
+from textx.scoping import GlobalModelRepository
 from textx.scoping.providers import FQNImportURI
-from os.path import join, dirname
+from os import listdir, stat, strerror, sep
+from os.path import join, dirname, abspath
+from fnmatch import fnmatchcase
+from contextlib import contextmanager
+import contextvars
+import errno
+import threading
 from .lib.component import (
     Component,
     ComponentType,
@@ -30,6 +37,9 @@ from .lib.repetition import Repetition
 from .lib.entity import Entity
 from .lib.computed import ComputedAttribute, Atom
 from .validate import validate_model
+from .model_index import ModelIndex
+from .model_cache import ModelCache, cache_enabled_from_env
+from .profiling import get_profiler, profile_phase
 
 # Map grammar rules to Python classes
 custom_classes = [
@@ -62,6 +72,55 @@ custom_classes = [
 
 
 THIS_DIR = dirname(__file__)
+GRAMMAR_DIR = join(THIS_DIR, "grammar")
+
+# Metamodels are expensive to build, so they are constructed once per process
+# and per configuration. The key also carries a fingerprint of the grammar
+# files so that editing a .tx file invalidates the cached metamodel.
+_metamodel_cache = {}
+_metamodel_cache_lock = threading.Lock()
+
+# Models built from memory (see build_model) get their files from this
+# mapping of absolute path to text while they are parsed. The names of the
+# files are relative to VIRTUAL_ROOT, which is never read.
+VIRTUAL_ROOT = abspath(join(sep, "webdsl"))
+_virtual_files = contextvars.ContextVar("webdsl_virtual_files", default=None)
+
+# Repository of the models loaded by the build in progress (see
+# fresh_model_repository). The metamodel is shared between builds, so its
+# repository looks the models up here instead of keeping them itself.
+_build_repository = contextvars.ContextVar("webdsl_build_repository", default=None)
+
+
+class BuildModelRepository(GlobalModelRepository):
+    """
+    Global model repository of the shared metamodel. It holds no models, but
+    stands for the repository of the build in progress in the current
+    context, so concurrent builds (in threads of one process) never see or
+    replace each other's models. Outside of a build it uses its own.
+    """
+
+    def __init__(self):
+        self._default = GlobalModelRepository()
+
+    def _current(self):
+        return _build_repository.get() or self._default
+
+    @property
+    def all_models(self):
+        return self._current().all_models
+
+    @all_models.setter
+    def all_models(self, value):
+        self._current().all_models = value
+
+    @property
+    def local_models(self):
+        return self._current().local_models
+
+    @local_models.setter
+    def local_models(self, value):
+        self._current().local_models = value
 
 
 def component_entity_attributes_scope(obj, attr, attr_ref):
@@ -92,16 +151,126 @@ def component_entity_attributes_scope(obj, attr, attr_ref):
         raise TextXSemanticError("Component has no entity defined")
 
 
+class ProfiledFQNImportURI(FQNImportURI):
+    """
+    FQNImportURI that reports import loading and reference resolution as
+    separate phases when a profiler is active, and loads the imports of a
+    model only once.
+    """
+
+    def load_models(self, model, encoding="utf-8"):
+        # textX asks every provider instance (one per reference attribute) to
+        # load the imports of a model, and each one walks the whole model to
+        # find them. They all load the same imports, so only the first does.
+        if getattr(model, "_webdsl_imports_loaded", False):
+            return
+        if get_profiler() is None:
+            super().load_models(model, encoding=encoding)
+        else:
+            with profile_phase("imports"):
+                super().load_models(model, encoding=encoding)
+        model._webdsl_imports_loaded = True
+
+    def _load_referenced_models(self, model, encoding):
+        files = _virtual_files.get()
+        if files is None:
+            return super()._load_referenced_models(model, encoding)
+        # The model is built from memory, so are its imports. This provider
+        # does not use importAs, so imported models are always local models.
+        from textx.model import get_children
+
+        repository = model._tx_model_repository
+        repository.update_model_in_repo_based_on_filename(model)
+        for obj in get_children(lambda x: hasattr(x, "importURI"), model):
+            pattern = abspath(
+                join(
+                    dirname(model._tx_filename), self.importURI_converter(obj.importURI)
+                )
+            )
+            filenames = sorted(f for f in files if fnmatchcase(f, pattern))
+            if not filenames:
+                raise OSError(errno.ENOENT, strerror(errno.ENOENT), pattern)
+            obj._tx_loaded_models = [
+                _load_virtual_model(model, filename, files[filename], encoding)
+                for filename in filenames
+            ]
+
+    def __call__(self, obj, attr, obj_ref):
+        if get_profiler() is None:
+            return super().__call__(obj, attr, obj_ref)
+        with profile_phase("scope resolution"):
+            return super().__call__(obj, attr, obj_ref)
+
+
+def _load_virtual_model(model, filename, text, encoding):
+    """Loads a model imported by model from text, like textX loads files."""
+    repository = model._tx_model_repository
+    metamodel = model._tx_metamodel
+    if not repository.all_models.has_model(filename):
+        repository.all_models[filename] = metamodel.internal_model_from_file(
+            filename,
+            model_str=text,
+            pre_ref_resolution_callback=repository.pre_ref_resolution_callback,
+            is_main_model=False,
+            encoding=encoding,
+            model_params=model._tx_model_params,
+        )
+    return repository.load_model(
+        metamodel,
+        filename,
+        False,
+        encoding=encoding,
+        model_params=model._tx_model_params,
+    )
+
+
+def grammar_fingerprint():
+    """Returns a tuple identifying the current state of the grammar files."""
+    fingerprint = []
+    for filename in sorted(listdir(GRAMMAR_DIR)):
+        if not filename.endswith(".tx"):
+            continue
+        st = stat(join(GRAMMAR_DIR, filename))
+        fingerprint.append((filename, st.st_mtime_ns, st.st_size))
+    return tuple(fingerprint)
+
+
 def get_metamodel(debug: bool = False, global_repo: bool = True):
+    """Returns the (cached) textX metamodel for the given configuration."""
+    key = (debug, global_repo, grammar_fingerprint())
+    metamodel = _metamodel_cache.get(key)
+    if metamodel is not None:
+        return metamodel
+
+    with _metamodel_cache_lock:
+        metamodel = _metamodel_cache.get(key)
+        if metamodel is None:
+            # Drop stale metamodels built from an older version of the grammar
+            for cached_key in list(_metamodel_cache):
+                if cached_key[:2] == (debug, global_repo):
+                    del _metamodel_cache[cached_key]
+            with profile_phase("grammar load"):
+                metamodel = _create_metamodel(debug, global_repo)
+            _metamodel_cache[key] = metamodel
+    return metamodel
+
+
+def clear_metamodel_cache():
+    """Drops all cached metamodels, forcing the next call to rebuild them."""
+    with _metamodel_cache_lock:
+        _metamodel_cache.clear()
+
+
+def _create_metamodel(debug: bool, global_repo: bool):
     """Creates and configures the textX metamodel."""
-    grammar_path = join(THIS_DIR, "grammar", "web_dsl.tx")  # Adjust path if needed
+    grammar_path = join(GRAMMAR_DIR, "web_dsl.tx")
     print(f"Loading grammar from: {grammar_path}")
 
     metamodel = metamodel_from_file(
         grammar_path,
         auto_init_attributes=True,
         textx_tools_support=True,
-        global_repository=global_repo,
+        global_repository=BuildModelRepository() if global_repo else False,
         debug=debug,
         classes=custom_classes,
     )
@@ -109,30 +278,30 @@ def get_metamodel(debug: bool = False, global_repo: bool = True):
     metamodel.register_scope_providers(
         {
             # "Gauge.value": component_entity_attributes_scope,
-            "Component.entity": FQNImportURI(),
-            "ComponentRef.ref": FQNImportURI(),
-            "Entity.source": FQNImportURI(),
-            "NestedAccessPathEntity.entity": FQNImportURI(),
-            "Publish.broker": FQNImportURI(),
-            "Publish.endpoint": FQNImportURI(),
-            "Condition.component": FQNImportURI(),
-            "Condition.componentElse": FQNImportURI(),
-            "ElseClause.componentElse": FQNImportURI(),
-            "Repetition.compoonentRef": FQNImportURI(),
-            "Repetition.componentElseRef": FQNImportURI(),
-            "MySQLQuery.connection": FQNImportURI(),
-            "MongoDBQuery.connection": FQNImportURI(),
-            "RESTEndpoint.connection": FQNImportURI(),
-            "BrokerTopic.connection": FQNImportURI(),
-            "Entity.overloads": FQNImportURI(),
-            "WebPage.navbar_screens": FQNImportURI(),
-            "User.role": FQNImportURI(),
-            "Screen.allowed_roles": FQNImportURI(),
-            "Component.allowed_roles": FQNImportURI(),
-            "MySQL.allowed_roles": FQNImportURI(),
-            "MongoDB.allowed_roles": FQNImportURI(),
-            "RestEndpoint.allowed_roles": FQNImportURI(),
-            "BrokerTopic.allowed_roles": FQNImportURI(),
+            "Component.entity": ProfiledFQNImportURI(),
+            "ComponentRef.ref": ProfiledFQNImportURI(),
+            "Entity.source": ProfiledFQNImportURI(),
+            "NestedAccessPathEntity.entity": ProfiledFQNImportURI(),
+            "Publish.broker": ProfiledFQNImportURI(),
+            "Publish.endpoint": ProfiledFQNImportURI(),
+            "Condition.component": ProfiledFQNImportURI(),
+            "Condition.componentElse": ProfiledFQNImportURI(),
+            "ElseClause.componentElse": ProfiledFQNImportURI(),
+            "Repetition.compoonentRef": ProfiledFQNImportURI(),
+            "Repetition.componentElseRef": ProfiledFQNImportURI(),
+            "MySQLQuery.connection": ProfiledFQNImportURI(),
+            "MongoDBQuery.connection": ProfiledFQNImportURI(),
+            "RESTEndpoint.connection": ProfiledFQNImportURI(),
+            "BrokerTopic.connection": ProfiledFQNImportURI(),
+            "Entity.overloads": ProfiledFQNImportURI(),
+            "WebPage.navbar_screens": ProfiledFQNImportURI(),
+            "User.role": ProfiledFQNImportURI(),
+            "Screen.allowed_roles": ProfiledFQNImportURI(),
+            "Component.allowed_roles": ProfiledFQNImportURI(),
+            "MySQL.allowed_roles": ProfiledFQNImportURI(),
+            "MongoDB.allowed_roles": ProfiledFQNImportURI(),
+            "RestEndpoint.allowed_roles": ProfiledFQNImportURI(),
+            "BrokerTopic.allowed_roles": ProfiledFQNImportURI(),
         }
     )
 
@@ -145,189 +314,161 @@ def get_metamodel(debug: bool = False, global_repo: bool = True):
 #     pass
 
 
-def build_model(model_path: str):
-    """Builds a model from a DSL file."""
+def build_model(model_path: str, use_cache: bool = None, files: dict = None):
+    """
+    Builds a model from a DSL file.
+    If use_cache is True (or None and WEBDSL_MODEL_CACHE is set), built models
+    are stored in and served from the on-disk model cache.
+
+    With files, a mapping of file names to their text, the model is built
+    from memory instead: model_path is the name of the main file in files
+    and imports are resolved among the files, nothing is read from disk.
+    Such models are not cached.
+    """
     print(f"Attempting to build model from: {model_path}")
     # Get the metamodel with the model processor registered
     mm = get_metamodel(debug=False)
-    model = mm.model_from_file(model_path)
+
+    if files is not None:
+        use_cache = False
+    elif use_cache is None:
+        use_cache = cache_enabled_from_env()
+    cache = ModelCache() if use_cache else None
+    if cache is not None:
+        with profile_phase("cache lookup"):
+            model = cache.get(model_path, mm)
+        if model is not None:
+            print(f"Loaded model from cache: {model_path}")
+            return model
+
+    with profile_phase("parse"), fresh_model_repository():
+        if files is None:
+            model = mm.model_from_file(model_path)
+        else:
+            model = model_from_memory(mm, model_path, files)
 
     # set_defaults(model)  # Set default values for the model
-    validate_model(model, model_path)  # Validate
+    with profile_phase("validate"):
+        validate_model(model, model_path)  # Validate
+
+    if cache is not None:
+        with profile_phase("cache store"):
+            cache.put(model_path, model, mm)
 
     return model  # Return the built model
 
 
-def get_model_webpage(model):
-    webpage = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            webpage += get_children_of_type("WebPage", m)
-    else:
-        webpage = get_children_of_type("WebPage", model)
-    return webpage[0] if webpage else None
+def virtual_path(filename):
+    """Returns the absolute path of a file of a model built from memory."""
+    return abspath(join(VIRTUAL_ROOT, filename))
 
 
-def get_model_entities(model):
-    entities = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            entities += get_children_of_type("Entity", m)
-    else:
-        entities = get_children_of_type("Entity", model)
-    return entities
+def model_from_memory(metamodel, model_path, files):
+    files = {virtual_path(name): text for name, text in files.items()}
+    main_path = virtual_path(model_path)
+    if main_path not in files:
+        raise OSError(errno.ENOENT, strerror(errno.ENOENT), model_path)
+    token = _virtual_files.set(files)
+    try:
+        return metamodel.model_from_str(files[main_path], file_name=main_path)
+    finally:
+        _virtual_files.reset(token)
+
 
+@contextmanager
+def fresh_model_repository():
+    """
+    Gives the builds in the block an empty global model repository of their
+    own. The metamodel is shared between builds, so without this the models
+    loaded by a previous build would be served from the repository (even if
+    their files changed) and leak into the aggregated elements of the next
+    model, and concurrent builds would mix their models.
+    """
+    token = _build_repository.set(GlobalModelRepository())
+    try:
+        yield
+    finally:
+        _build_repository.reset(token)
 
-def get_model_components(model):
-    components = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
 
-            components += get_children_of_type("Component", m)
-    else:
-        components = get_children_of_type("Component", model)
+def get_model_webpage(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.first_of_type("WebPage")
 
-    return components
 
+def get_model_entities(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("Entity")
 
-def get_model_screens(model):
-    screens = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
 
-        for m in model._tx_model_repository.all_models:
-            screens += get_children_of_type("Screen", m)
-    else:
-        screens = get_children_of_type("Screen", model)
-    for screen in screens:
-        for role in screen.allowed_roles:
-            print(role.name)
-    return screens
-
-
-def get_model_brokers(model):
-    brokers = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            brokers += get_children_of_type("MQTTBroker", m)
-            brokers += get_children_of_type("AMQPBroker", m)
-            brokers += get_children_of_type("RedisBroker", m)
-    else:
-        brokers += get_children_of_type("MQTTBroker", model)
-        brokers += get_children_of_type("AMQPBroker", model)
-        brokers += get_children_of_type("RedisBroker", model)
-    return brokers
+def get_model_components(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("Component")
 
 
-def get_model_brokertopics(model):
-    brokertopics = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            brokertopics += get_children_of_type("BrokerTopic", m)
-    else:
-        brokertopics = get_children_of_type("BrokerTopic", model)
-    return brokertopics
+def get_model_screens(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("Screen")
 
 
-def get_model_databases(model):
-    databases = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            databases += get_children_of_type("MySQL", m)
-            databases += get_children_of_type("MongoDB", m)
-    else:
-        databases += get_children_of_type("MySQL", model)
-        databases += get_children_of_type("MongoDB", model)
-    return databases
+def get_model_brokers(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("MQTTBroker", "AMQPBroker", "RedisBroker")
 
 
-def get_model_mysqlqueries(model):
-    dbqueries = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            dbqueries += get_children_of_type("MySQLQuery", m)
-    else:
-        dbqueries += get_children_of_type("MySQLQuery", model)
-    return dbqueries
+def get_model_brokertopics(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("BrokerTopic")
 
 
-def get_model_mongodbqueries(model):
-    dbqueries = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            dbqueries += get_children_of_type("MongoDBQuery", m)
-    else:
-        dbqueries += get_children_of_type("MongoDBQuery", model)
-    return dbqueries
+def get_model_databases(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("MySQL", "MongoDB")
 
 
-def get_model_restapis(model):
-    restapis = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            restapis += get_children_of_type("RESTApi", m)
-    else:
-        restapis = get_children_of_type("RESTApi", model)
-    return restapis
+def get_model_mysqlqueries(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("MySQLQuery")
 
 
-def get_model_endpoints(model):
-    endpoints = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            endpoints += get_children_of_type("RESTEndpoint", m)
-    else:
-        endpoints = get_children_of_type("RESTEndpoint", model)
-    return endpoints
+def get_model_mongodbqueries(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("MongoDBQuery")
 
 
-def get_model_api(model):
-    api = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            api += get_children_of_type("API", m)
-    else:
-        api = get_children_of_type("API", model)
-    return api[0] if api else None
+def get_model_restapis(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("RESTApi")
 
 
-def get_model_websocket(model):
-    websocket = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            websocket += get_children_of_type("Websocket", m)
-    else:
-        websocket = get_children_of_type("Websocket", model)
-    return websocket[0] if websocket else None
+def get_model_endpoints(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("RESTEndpoint")
 
 
-def get_model_repetitions(model):
-    repetitions = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            repetitions += get_children_of_type("Repetition", m)
-    else:
-        repetitions = get_children_of_type("Repetition", model)
-    return repetitions
+def get_model_api(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.first_of_type("API")
 
 
-def get_model_conditions(model):
-    conditions = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            conditions += get_children_of_type("Condition", m)
-    else:
-        conditions = get_children_of_type("Condition", model)
-    return conditions
+def get_model_websocket(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.first_of_type("Websocket")
 
 
-def get_model_users(model):
-    users = []
-    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
-        for m in model._tx_model_repository.all_models:
-            users += get_children_of_type("User", m)
-    else:
-        users = get_children_of_type("User", model)
-    return users
+def get_model_repetitions(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("Repetition")
+
+
+def get_model_conditions(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("Condition")
+
+
+def get_model_users(model, index=None):
+    index = index or ModelIndex.from_model(model)
+    return index.of_type("User")
 
 
 def model_proc(model, metamodel):
@@ -337,103 +478,118 @@ def model_proc(model, metamodel):
     'model' is the instance of the root rule (e.g., 'Model') for the main file.
     """
     print("Running model processor...")
-
-    # Use your existing get_model_X functions which correctly iterate
-    # through model._tx_model_repository.all_models
-    model.aggregated_screens = get_model_screens(model)
-    model.aggregated_entities = get_model_entities(model)
-    model.aggregated_reusable_components = get_model_components(model)
-    model.aggregated_brokers = get_model_brokers(model)
-    model.aggregated_databases = get_model_databases(model)
-    model.aggregated_restapis = get_model_restapis(model)
-    model.aggregated_endpoints = get_model_endpoints(model)
-    model.aggregated_mysqlqueries = get_model_mysqlqueries(model)
-    model.aggregated_mongodbqueries = get_model_mongodbqueries(model)
-    model.aggregated_brokertopics = get_model_brokertopics(model)
-    model.processed_webpage = get_model_webpage(model)
-    model.processed_api = get_model_api(model)
-    model.processed_websocket = get_model_websocket(model)
-    model.aggregated_users = get_model_users(model)
+    with profile_phase("model_proc"):
+        _model_proc(model, metamodel)
+
+
+def _model_proc(model, metamodel):
+    # Index the main model and all imported models with a single traversal
+    # and serve every aggregated_* attribute from that index
+    with profile_phase("index"):
+        index = ModelIndex.from_model(model)
+    model.model_index = index
+
+    with profile_phase("aggregate"):
+        model.aggregated_screens = get_model_screens(model, index)
+        model.aggregated_entities = get_model_entities(model, index)
+        model.aggregated_reusable_components = get_model_components(model, index)
+        model.aggregated_brokers = get_model_brokers(model, index)
+        model.aggregated_databases = get_model_databases(model, index)
+        model.aggregated_restapis = get_model_restapis(model, index)
+        model.aggregated_endpoints = get_model_endpoints(model, index)
+        model.aggregated_mysqlqueries = get_model_mysqlqueries(model, index)
+        model.aggregated_mongodbqueries = get_model_mongodbqueries(model, index)
+        model.aggregated_brokertopics = get_model_brokertopics(model, index)
+        model.processed_webpage = get_model_webpage(model, index)
+        model.processed_api = get_model_api(model, index)
+        model.processed_websocket = get_model_websocket(model, index)
+        model.aggregated_users = get_model_users(model, index)
 
     # Resolve overloads
-    resolve_entity_overloads(model)
+    with profile_phase("overloads"):
+        resolve_entity_overloads(model, metamodel, index)
 
     # Finilize all repetitions with the new entities
     # This is needed due to the need for formatted paths
     # with base being the entity name
-    all_repetitions = get_model_repetitions(model)
-    for rep in all_repetitions:
-        try:
-            finalize_repetition(rep)
-        except Exception as e:
-            print(f"Error finalizing repetition: {e}")
+    with profile_phase("finalize repetitions"):
+        all_repetitions = get_model_repetitions(model, index)
+        for rep in all_repetitions:
+            try:
+                finalize_repetition(rep)
+            except Exception as e:
+                print(f"Error finalizing repetition: {e}")
 
     # Finilize all conditions with the new entities
     # This is needed due to the need for formatted paths
     # with base being the entity name
-    all_conditions = get_model_conditions(model)
-    for cond in all_conditions:
-        try:
-            finalize_condition(cond)
-        except Exception as e:
-            print(f"Error finalizing condition: {e}")
+    with profile_phase("finalize conditions"):
+        all_conditions = get_model_conditions(model, index)
+        for cond in all_conditions:
+            try:
+                finalize_condition(cond)
+            except Exception as e:
+                print(f"Error finalizing condition: {e}")
 
 
-def resolve_entity_overloads(model):
+def get_entity_reference_attrs(metamodel):
+    """
+    Returns (class name, attribute name, is_single) for every attribute of the
+    metamodel that references an Entity.
+    """
+    attrs = getattr(metamodel, "entity_reference_attrs", None)
+    if attrs is None:
+        attrs = []
+        for cls in metamodel:
+            for attr_name, attr in cls._tx_attrs.items():
+                if not attr.ref or attr.cont or attr.cls.__name__ != "Entity":
+                    continue
+                # The overloads reference itself must keep pointing to the
+                # entity being overloaded
+                if cls.__name__ == "Entity" and attr_name == "overloads":
+                    continue
+                attrs.append(
+                    (cls.__name__, attr_name, attr.mult in (MULT_ONE, MULT_OPTIONAL))
+                )
+        metamodel.entity_reference_attrs = attrs
+    return attrs
+
+
+def resolve_entity_overloads(model, metamodel, index):
     overload_map = {}
-    all_entities = get_model_entities(model)
-    for entity in all_entities:
-        if hasattr(entity, "overloads") and entity.overloads:
+    for entity in index.of_type("Entity"):
+        if entity.overloads:
             overload_map[entity.overloads] = entity
 
-    print("Overload map:")
-    for k, v in overload_map.items():
-        print(f"{k.name} -> {v.name}")
-
-    print("Patching references...")
-    patch_references(model, overload_map)
-
-
-def patch_references(obj, overload_map, visited=None):
-    if visited is None:
-        visited = set()
-
-    obj_id = id(obj)
-    if obj_id in visited:
+    if not overload_map:
         return
-    visited.add(obj_id)
-
-    if isinstance(obj, list):
-        for i, item in enumerate(obj):
-            try:
-                if item in overload_map:
-                    obj[i] = overload_map[item]
-                    print(f"Patched reference: {obj[i]} -> {overload_map[item].name}")
-                else:
-                    patch_references(item, overload_map, visited)
-            except TypeError:
-                patch_references(item, overload_map, visited)
-
-    elif hasattr(obj, "__dict__"):
-        for attr in dir(obj):
-            if attr.startswith("_"):
-                continue
-            try:
-                value = getattr(obj, attr)
-            except Exception:
-                continue  # Skip inaccessible attributes
 
-            if isinstance(value, (str, int, float, bool, type(None))):
+    # Follow chains of overloads (C overloads B overloads A) to the last entity
+    for overloaded, entity in overload_map.items():
+        seen = {overloaded}
+        while entity in overload_map and entity not in seen:
+            seen.add(entity)
+            entity = overload_map[entity]
+        overload_map[overloaded] = entity
+
+    # Patch only the attributes that the metamodel declares as Entity references
+    for type_name, attr_name, is_single in get_entity_reference_attrs(metamodel):
+        for obj in index.objects_by_type.get(type_name, []):
+            value = getattr(obj, attr_name, None)
+            if value is None:
                 continue
-
-            try:
-                if value in overload_map and value is not overload_map[value]:
-                    print(f"Patched reference: {obj} -> {overload_map[value]}")
-                    setattr(obj, attr, overload_map[value])
-                else:
-                    patch_references(value, overload_map, visited)
-            except TypeError:
-                patch_references(value, overload_map, visited)
+            if is_single:
+                if value in overload_map:
+                    setattr(obj, attr_name, overload_map[value])
+            else:
+                for i, item in enumerate(value):
+                    if item in overload_map:
+                        value[i] = overload_map[item]
+
+    # Overloaded entities are replaced by the entities overloading them
+    model.aggregated_entities = [
+        e for e in model.aggregated_entities if e not in overload_map
+    ]
 
 
 def finalize_repetition(rep):
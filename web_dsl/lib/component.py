@@ -49,6 +49,11 @@ class Component:
 
 
 class ComponentType:
+    # Attributes holding a formatted attribute path (e.g. [0, "value"])
+    path_fields = ()
+    # Attributes holding a list of formatted attribute paths
+    path_list_fields = ()
+
     def __init__(self, parent=None, name=None):
         self.parent = parent
         self.name = name
@@ -56,6 +61,19 @@ class ComponentType:
     def __str__(self):
         return self.name
 
+    def attribute_paths(self):
+        """Returns every formatted attribute path used by this component type."""
+        paths = []
+        for field in self.path_fields:
+            path = getattr(self, field, None)
+            if isinstance(path, list):
+                paths.append(path)
+        for field in self.path_list_fields:
+            field_paths = getattr(self, field, None)
+            if isinstance(field_paths, list):
+                paths.extend(p for p in field_paths if isinstance(p, list))
+        return paths
+
     def format_attribute_path(self, path):
         """
         This method formats the attribute path for the component.
@@ -74,6 +92,8 @@ class ComponentType:
 
 
 class Gauge(ComponentType):
+    path_fields = ("value",)
+
     def __init__(
         self, parent=None, name="Gauge", value=None, value_static=None, description=None
     ):
@@ -86,6 +106,8 @@ class Gauge(ComponentType):
 
 
 class Notification(ComponentType):
+    path_fields = ("message",)
+
     def __init__(self, parent=None, name="Notification", type="info", message=None):
         super().__init__(parent, name)
         self.type = type
@@ -94,6 +116,8 @@ class Notification(ComponentType):
 
 
 class Image(ComponentType):
+    path_fields = ("source",)
+
     def __init__(
         self,
         parent=None,
@@ -120,6 +144,9 @@ class Alive(ComponentType):
 
 
 class LineChart(ComponentType):
+    path_fields = ("xValue",)
+    path_list_fields = ("yValues",)
+
     def __init__(
         self,
         parent=None,
@@ -147,6 +174,9 @@ class LineChart(ComponentType):
 
 
 class BarChart(ComponentType):
+    path_fields = ("xValue",)
+    path_list_fields = ("yValues",)
+
     def __init__(
         self,
         parent=None,
@@ -174,6 +204,8 @@ class BarChart(ComponentType):
 
 
 class PieChart(ComponentType):
+    path_fields = ("dataName", "value")
+
     def __init__(
         self,
         parent=None,
@@ -216,6 +248,8 @@ class Publish(ComponentType):
 
 
 class LiveTable(ComponentType):
+    path_list_fields = ("columns",)
+
     def __init__(self, parent=None, name="LiveTable", columns=None):
         super().__init__(parent, name)
         if columns is not None:
@@ -223,6 +257,8 @@ class LiveTable(ComponentType):
 
 
 class JsonViewer(ComponentType):
+    path_list_fields = ("attributes",)
+
     def __init__(self, parent=None, name="JsonViewer", attributes=None):
         super().__init__(parent, name)
         if attributes is not None:
@@ -232,6 +268,8 @@ class JsonViewer(ComponentType):
 
 
 class Text(ComponentType):
+    path_fields = ("content",)
+
     def __init__(
         self,
         parent=None,
@@ -255,6 +293,8 @@ class Text(ComponentType):
 
 
 class Logs(ComponentType):
+    path_list_fields = ("attributes",)
+
     def __init__(self, parent=None, name="Logs", attributes=None):
         super().__init__(parent, name)
         if attributes is not None:
@@ -264,6 +304,8 @@ class Logs(ComponentType):
 
 
 class Table(ComponentType):
+    path_list_fields = ("attributes",)
+
     def __init__(
         self,
         parent=None,
@@ -339,6 +381,8 @@ class Form(ComponentType):
 
 
 class ProgressBar(ComponentType):
+    path_fields = ("value", "max")
+
     def __init__(
         self,
         parent=None,
@@ -1,23 +1,17 @@
 import re
 import yaml
-import os
 
 from typing import Dict, Any, Optional, Tuple
-from jinja2 import Environment, FileSystemLoader
 from fastapi import HTTPException
 
 from .openapi_to_webdsl import parse_component_annotations
-from web_dsl.definitions import TEMPLATES_PATH
+from web_dsl.templating import get_template_env
 
 
 # ======== Template Setup ========
-env = Environment(
-    loader=FileSystemLoader(os.path.join(TEMPLATES_PATH, "transformations")),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    extensions=["jinja2.ext.loopcontrols"],
+template = get_template_env("transformations").get_template(
+    "asyncapi_to_webdsl.jinja"
 )
-template = env.get_template("asyncapi_to_webdsl.jinja")
 
 protocol_to_dsl_type_map = {
     "mqtt": "MQTT",
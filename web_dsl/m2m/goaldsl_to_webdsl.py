@@ -2,18 +2,13 @@ from goal_dsl.language import (
     build_model as goal_build_model,
     get_model_entities as goal_get_model_entities,
 )
-from jinja2 import Environment, FileSystemLoader
 from textx.model import get_children_of_type
-from web_dsl.definitions import TEMPLATES_PATH
+from web_dsl.templating import get_template_env
 
 
-env = Environment(
-    loader=FileSystemLoader(f"{TEMPLATES_PATH}/transformations"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    extensions=["jinja2.ext.loopcontrols"],
+template = get_template_env("transformations").get_template(
+    "goaldsl_to_webdsl.jinja"
 )
-template = env.get_template("goaldsl_to_webdsl.jinja")
 
 attribute_class_name_to_webdsl = {
     "FloatAttribute": "float",
@@ -1,19 +1,12 @@
 import re
 from typing import List, Dict, Any
 from urllib.parse import urlparse, urlunparse
-from jinja2 import Environment, FileSystemLoader
-from web_dsl.definitions import TEMPLATES_PATH
+from web_dsl.templating import get_template_env
 import yaml
 from fastapi import HTTPException
 
 # ======== Template Setup ========
-env = Environment(
-    loader=FileSystemLoader(f"{TEMPLATES_PATH}/transformations"),
-    trim_blocks=True,
-    lstrip_blocks=True,
-    extensions=["jinja2.ext.loopcontrols"],
-)
-template = env.get_template("openapi_to_webdsl.jinja")
+template = get_template_env("transformations").get_template("openapi_to_webdsl.jinja")
 
 
 # ====== Help Classes ===========
@@ -0,0 +1,239 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import sys
+from os.path import abspath, dirname, expanduser, join
+
+# Set WEBDSL_MODEL_CACHE=1 to enable the on-disk model cache
+MODEL_CACHE_ENV = "WEBDSL_MODEL_CACHE"
+MODEL_CACHE_DIR_ENV = "WEBDSL_MODEL_CACHE_DIR"
+MODEL_CACHE_MAX_MB_ENV = "WEBDSL_MODEL_CACHE_MAX_MB"
+
+DEFAULT_CACHE_DIR = join(
+    os.getenv("XDG_CACHE_HOME", expanduser("~/.cache")), "webdsl", "models"
+)
+DEFAULT_MAX_MB = 256
+
+THIS_DIR = dirname(__file__)
+# Python sources whose behaviour ends up baked into a processed model
+_CODE_FILES = ["language.py", "validate.py", "model_index.py"] + [
+    join("lib", f)
+    for f in sorted(os.listdir(join(THIS_DIR, "lib")))
+    if f.endswith(".py")
+]
+
+
+def cache_enabled_from_env():
+    return os.getenv(MODEL_CACHE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+def hash_file(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _import_patterns(models):
+    """
+    Returns the absolute glob patterns the models import their files by. The
+    files they match can change without any loaded file changing.
+    """
+    from textx.model import get_children
+
+    patterns = set()
+    for model in models:
+        for obj in get_children(lambda x: hasattr(x, "importURI"), model):
+            if glob.has_magic(obj.importURI):
+                patterns.add(abspath(join(dirname(model._tx_filename), obj.importURI)))
+    return patterns
+
+
+def _listing_hash(pattern):
+    listing = "\0".join(sorted(glob.glob(pattern)))
+    return hashlib.sha256(listing.encode()).hexdigest()
+
+
+def _code_fingerprint():
+    from .language import grammar_fingerprint
+
+    fingerprint = [sys.version_info[:2], grammar_fingerprint()]
+    for filename in _CODE_FILES:
+        st = os.stat(join(THIS_DIR, filename))
+        fingerprint.append((filename, st.st_mtime_ns, st.st_size))
+    return hashlib.sha256(repr(fingerprint).encode()).hexdigest()
+
+
+def _metamodel_class(name):
+    """Looks up a class generated by textX by its fully qualified rule name."""
+    from .language import get_metamodel
+
+    return get_metamodel()[name]
+
+
+class _ModelPickler(pickle.Pickler):
+    """
+    Pickles textX models. The metamodel and the parser are not stored. They
+    are restored from the current (cached) metamodel on load. Classes that
+    textX generates for grammar rules are stored by their qualified rule name.
+    """
+
+    def __init__(self, file, metamodel):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.metamodel = metamodel
+
+    def persistent_id(self, obj):
+        if obj is self.metamodel:
+            return "metamodel"
+        if obj.__class__.__name__ == "TextXModelParser":
+            return "parser"
+        return None
+
+    def reducer_override(self, obj):
+        if isinstance(obj, type) and obj.__module__ == "textx.metamodel":
+            return _metamodel_class, (obj._tx_fqn,)
+        return NotImplemented
+
+
+class _ModelUnpickler(pickle.Unpickler):
+    def __init__(self, file, metamodel):
+        super().__init__(file)
+        self.metamodel = metamodel
+
+    def persistent_load(self, pid):
+        if pid == "metamodel":
+            return self.metamodel
+        if pid == "parser":
+            return None
+        raise pickle.UnpicklingError(f"Unknown persistent id: {pid}")
+
+
+class ModelCache:
+    """
+    Content-addressed on-disk cache of built (processed and validated) models.
+
+    Every main file has a small dependency record: the files loaded while
+    building it (the main file plus all imports) and their content hashes,
+    and the glob patterns of its imports with a hash of the files they
+    matched, so that adding or removing a matching file is a miss too.
+    The model itself is stored under a key derived from all of these hashes.
+    A lookup only hashes the recorded files, so the textX parser is not
+    invoked on a hit. Entries are evicted oldest-access-first once the cache
+    grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.getenv(MODEL_CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.getenv(MODEL_CACHE_MAX_MB_ENV, DEFAULT_MAX_MB)) << 20
+        self.max_bytes = max_bytes
+
+    def _deps_path(self, model_path):
+        name = hashlib.sha256(abspath(model_path).encode()).hexdigest()
+        return join(self.cache_dir, f"{name}.deps.json")
+
+    def _model_key(self, file_hashes):
+        digest = hashlib.sha256(_code_fingerprint().encode())
+        for filename, file_hash in sorted(file_hashes.items()):
+            digest.update(f"{filename}\0{file_hash}\0".encode())
+        return digest.hexdigest()
+
+    def get(self, model_path, metamodel):
+        """Returns the cached model for model_path or None on a miss."""
+        try:
+            with open(self._deps_path(model_path), "r", encoding="utf-8") as f:
+                deps = json.load(f)
+            recorded_hashes = deps["files"]
+            recorded_globs = deps["globs"]
+            current_hashes = {
+                filename: hash_file(filename) for filename in recorded_hashes
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if current_hashes != recorded_hashes:
+            return None
+        if any(_listing_hash(p) != h for p, h in recorded_globs.items()):
+            return None
+
+        entry_path = join(self.cache_dir, f"{self._model_key(current_hashes)}.pickle")
+        try:
+            with open(entry_path, "rb") as f:
+                model = _ModelUnpickler(f, metamodel).load()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Discarding unreadable model cache entry {entry_path}: {e}")
+            self._remove(entry_path)
+            return None
+        # Record the access for the eviction order
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass  # Evicted meanwhile, or the cache is read-only
+        return model
+
+    def put(self, model_path, model, metamodel):
+        """Stores a built model under the hashes of all files it was built from."""
+        from .model_index import get_all_models
+
+        models = [m for m in get_all_models(model) if m._tx_filename]
+        filenames = {abspath(model_path)}
+        filenames.update(m._tx_filename for m in models)
+        file_hashes = {filename: hash_file(filename) for filename in filenames}
+        glob_hashes = {
+            pattern: _listing_hash(pattern) for pattern in _import_patterns(models)
+        }
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry_path = join(self.cache_dir, f"{self._model_key(file_hashes)}.pickle")
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        # Models are deeply nested object graphs
+        recursion_limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursion_limit, 20000))
+        try:
+            with open(tmp_path, "wb") as f:
+                _ModelPickler(f, metamodel).dump(model)
+            os.replace(tmp_path, entry_path)
+        except Exception as e:
+            print(f"Could not cache model {model_path}: {e}")
+            self._remove(tmp_path)
+            return
+        finally:
+            sys.setrecursionlimit(recursion_limit)
+
+        deps_path = self._deps_path(model_path)
+        with open(f"{deps_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"files": file_hashes, "globs": glob_hashes}, f)
+        os.replace(f"{deps_path}.tmp", deps_path)
+
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith(".pickle"):
+                continue
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for entry in os.scandir(self.cache_dir):
+            self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
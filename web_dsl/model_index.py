@@ -0,0 +1,87 @@
+from collections import defaultdict
+from textx.const import MULT_ONE, MULT_OPTIONAL
+
+# Per-class list of (attribute name, is_single) for containment attributes.
+# Classes come from the (cached) metamodel, so this stays small.
+_containment_attrs = {}
+
+
+def _get_containment_attrs(cls):
+    attrs = _containment_attrs.get(cls)
+    if attrs is None:
+        attrs = [
+            (attr_name, attr.mult in (MULT_ONE, MULT_OPTIONAL))
+            for attr_name, attr in cls._tx_attrs.items()
+            if attr.cont
+        ]
+        _containment_attrs[cls] = attrs
+    return attrs
+
+
+def get_all_models(model):
+    """
+    Returns the main model together with every model loaded through imports.
+    """
+    if model._tx_model_repository is not None and model._tx_model_repository.all_models:
+        return list(model._tx_model_repository.all_models)
+    return [model]
+
+
+class ModelIndex:
+    """
+    Buckets every model object by its class name.
+    The index is built with a single traversal over the containment tree of
+    each model and follows the same rules as textX's get_children_of_type
+    (containment links only, parents before children).
+    """
+
+    def __init__(self, roots=None):
+        self.objects_by_type = defaultdict(list)
+        self._visited = set()
+        for root in roots or []:
+            self.add(root)
+
+    @classmethod
+    def from_model(cls, model):
+        """Indexes the main model and all of its imported models."""
+        return cls(get_all_models(model))
+
+    def add(self, root):
+        """Indexes every object contained in root (including root)."""
+        visited = self._visited
+        objects_by_type = self.objects_by_type
+        stack = [root]
+        while stack:
+            obj = stack.pop()
+            cls = obj.__class__
+            if not hasattr(cls, "_tx_attrs") or id(obj) in visited:
+                continue
+            visited.add(id(obj))
+            objects_by_type[cls.__name__].append(obj)
+
+            children = []
+            for attr_name, is_single in _get_containment_attrs(cls):
+                value = getattr(obj, attr_name, None)
+                if is_single:
+                    if value is not None:
+                        children.append(value)
+                elif value:
+                    children.extend(value)
+            # Reverse so that children are visited in declaration order
+            stack.extend(reversed(children))
+
+    def of_type(self, *type_names):
+        """Returns all objects whose class name is one of type_names."""
+        if len(type_names) == 1:
+            return list(self.objects_by_type.get(type_names[0], []))
+        objects = []
+        for type_name in type_names:
+            objects += self.objects_by_type.get(type_name, [])
+        return objects
+
+    def first_of_type(self, type_name):
+        objects = self.objects_by_type.get(type_name)
+        return objects[0] if objects else None
+
+    def __len__(self):
+        return len(self._visited)
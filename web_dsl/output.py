@@ -0,0 +1,310 @@
+import gzip
+import hashlib
+from abc import ABC, abstractmethod
+import io
+import json
+import os
+import tarfile
+
+from .base_project import BaseProjectCopier
+from .profiling import profile_phase
+
+# Written next to every generated project, as .<project dir>.webdsl-manifest.json,
+# so that it is not part of the project. Older versions kept it in the root.
+MANIFEST_FILENAME = ".webdsl-manifest.json"
+MANIFEST_VERSION = 1
+
+# Timestamp of the members of generated archives, fixed so that identical
+# projects give byte-identical archives
+ARCHIVE_MTIME = int(os.getenv("SOURCE_DATE_EPOCH", "0"))
+
+# (path, size, mtime_ns) -> sha256 of the base project files
+_source_hashes = {}
+
+
+def hash_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _source_hash(path):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = _source_hashes.get(key)
+    if digest is None:
+        with open(path, "rb") as f:
+            digest = _source_hashes[key] = hash_bytes(f.read())
+    return digest
+
+
+class OutputSink(ABC):
+    """
+    Destination of the files of a generated project. generate() passes the
+    sink paths under its root (the gen_path of the generation), which are
+    stored relative to it. This base class only keeps track of the files, the
+    subclasses decide where their content goes.
+    """
+
+    has_previous_generation = False
+
+    def __init__(self, root):
+        self.root = root
+        self.files = {}
+        self.written = []
+
+    def _relpath(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def makedirs(self, path):
+        """Creates a directory of the project, if the sink has directories."""
+
+    def write_file(self, path, content):
+        """Adds a file with rendered content to the project."""
+        with profile_phase("write files"):
+            rel_path = self._relpath(path)
+            self._add(rel_path, content.encode("utf-8"), 0o644)
+            self.written.append(rel_path)
+            return True
+
+    def copy_file(self, src, dst):
+        """Adds a copy of a base project file to the project."""
+        rel_path = self._relpath(dst)
+        with open(src, "rb") as f:
+            data = f.read()
+        self._add(rel_path, data, os.stat(src).st_mode & 0o777)
+        self.written.append(rel_path)
+        return True
+
+    @abstractmethod
+    def _add(self, rel_path, data, mode):
+        """Stores the content of a file of the project."""
+
+    def finalize(self):
+        """Completes the output, returns the removed files of a previous generation."""
+        return []
+
+
+class MemoryOutput(OutputSink):
+    """Keeps the generated project in memory, as relative path -> bytes."""
+
+    def __init__(self, root="."):
+        super().__init__(root)
+
+    def _add(self, rel_path, data, mode):
+        self.files[rel_path] = data
+
+
+class TarOutput(OutputSink):
+    """
+    Writes the generated project as a tar archive into fileobj while it is
+    generated. The archive is written in stream mode, so fileobj only needs a
+    write() method (e.g. a socket or a pipe), and its members are stored
+    under arcname (by default the basename of root). Members get the
+    ARCHIVE_MTIME timestamp and no owner, so the archive of a project does not
+    depend on when or by whom it was generated. Nothing is written before
+    the first file, so a generation that fails earlier (e.g. on an invalid
+    model) leaves fileobj untouched.
+    """
+
+    def __init__(self, root, fileobj, arcname=None, compression="gz"):
+        super().__init__(root)
+        self.arcname = arcname or os.path.basename(os.path.normpath(root))
+        self.mtime = ARCHIVE_MTIME
+        self.fileobj = fileobj
+        self.compression = compression
+        self.gzip = None
+        self._tar = None
+
+    @property
+    def tar(self):
+        if self._tar is None:
+            fileobj, compression = self.fileobj, self.compression
+            if compression == "gz":
+                # The gzip stream of tarfile stamps the current time and the
+                # file name into its header
+                self.gzip = gzip.GzipFile(
+                    filename="", mode="wb", fileobj=fileobj, mtime=self.mtime
+                )
+                fileobj, compression = self.gzip, ""
+            self._tar = tarfile.open(fileobj=fileobj, mode=f"w|{compression}")
+        return self._tar
+
+    def _add(self, rel_path, data, mode):
+        info = tarfile.TarInfo(f"{self.arcname}/{rel_path}")
+        info.size = len(data)
+        info.mode = mode
+        info.mtime = self.mtime
+        self.tar.addfile(info, io.BytesIO(data))
+        self.files[rel_path] = len(data)
+
+    def copy_file(self, src, dst):
+        rel_path = self._relpath(dst)
+        info = self.tar.gettarinfo(src, f"{self.arcname}/{rel_path}")
+        info.mtime = self.mtime
+        info.uid = info.gid = 0
+        info.uname = info.gname = ""
+        with open(src, "rb") as f:
+            self.tar.addfile(info, f)
+        self.files[rel_path] = info.size
+        self.written.append(rel_path)
+        return True
+
+    def finalize(self):
+        # Writes the end of archive marker and flushes the compressor, the
+        # file object itself is left open
+        self.tar.close()
+        if self.gzip:
+            self.gzip.close()
+        return []
+
+
+class DirectoryOutput(OutputSink):
+    """
+    Writes the files of a generated project into gen_path.
+
+    A manifest next to the output directory keeps the content hash, size
+    and mtime of every file written by the previous generation. A file whose
+    new content has the same hash is not rewritten (so its mtime is
+    preserved), as long as it was not modified since. Files of the previous
+    generation that are not produced again (e.g. of removed screens) are
+    deleted when the output is finalized. A non-incremental output (e.g.
+    into a fresh directory) neither reads nor writes the manifest.
+    """
+
+    def __init__(self, gen_path, copier=None, incremental=True):
+        super().__init__(gen_path)
+        self.copier = copier or BaseProjectCopier()
+        self.incremental = incremental
+        self.previous = self._load_manifest() if incremental else {}
+
+    @property
+    def gen_path(self):
+        return self.root
+
+    @property
+    def manifest_path(self):
+        parent, name = os.path.split(os.path.abspath(self.gen_path))
+        return os.path.join(parent, f".{name}{MANIFEST_FILENAME}")
+
+    @property
+    def legacy_manifest_path(self):
+        return os.path.join(self.gen_path, MANIFEST_FILENAME)
+
+    @property
+    def has_previous_generation(self):
+        return bool(self.previous)
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            try:
+                with open(self.legacy_manifest_path, "r", encoding="utf-8") as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                return {}
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest.get("files", {})
+
+    def makedirs(self, path):
+        self.copier.makedirs(path)
+
+    def _is_current(self, rel_path, path, digest):
+        """Whether path still holds exactly what the previous generation wrote."""
+        entry = self.previous.get(rel_path)
+        if entry is None or entry["hash"] != digest:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]
+
+    def _record(self, rel_path, path, digest):
+        st = os.stat(path)
+        self.files[rel_path] = {
+            "hash": digest,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+        }
+
+    def write_file(self, path, content):
+        """Writes rendered content to path unless it is unchanged."""
+        with profile_phase("write files"):
+            rel_path = self._relpath(path)
+            digest = hash_bytes(content.encode("utf-8"))
+            if self._is_current(rel_path, path, digest):
+                self.files[rel_path] = self.previous[rel_path]
+                return False
+            self._add(rel_path, content.encode("utf-8"), 0o644)
+            self._record(rel_path, path, digest)
+            self.written.append(rel_path)
+            return True
+
+    def _add(self, rel_path, data, mode):
+        path = os.path.join(self.gen_path, *rel_path.split("/"))
+        # Replace rather than truncate, the file may be a hardlink into the
+        # base project (see WEBDSL_BASE_COPY)
+        if os.path.isfile(path):
+            os.unlink(path)
+        else:
+            self.copier.makedirs(os.path.dirname(path))
+        with open(path, "wb") as f:
+            f.write(data)
+        os.chmod(path, mode)
+
+    def copy_file(self, src, dst):
+        """Copies a base project file to dst unless dst is up to date."""
+        rel_path = self._relpath(dst)
+        digest = _source_hash(src)
+        if self._is_current(rel_path, dst, digest):
+            self.files[rel_path] = self.previous[rel_path]
+            return False
+        self.copier.copy_file(src, dst)
+        self._record(rel_path, dst, digest)
+        self.written.append(rel_path)
+        return True
+
+    def remove_stale_files(self):
+        """Deletes files of the previous generation that were not generated now."""
+        removed = []
+        for rel_path in self.previous.keys() - self.files.keys():
+            path = os.path.join(self.gen_path, *rel_path.split("/"))
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed.append(rel_path)
+            self._remove_empty_dirs(os.path.dirname(path))
+        return sorted(removed)
+
+    def _remove_empty_dirs(self, directory):
+        root = os.path.abspath(self.gen_path)
+        directory = os.path.abspath(directory)
+        while directory != root and directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+    def finalize(self):
+        """Removes stale files and writes the manifest of this generation."""
+        removed = self.remove_stale_files()
+        if not self.incremental:
+            return removed
+        if os.path.exists(self.legacy_manifest_path):
+            os.remove(self.legacy_manifest_path)
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": MANIFEST_VERSION, "files": self.files},
+                f,
+                indent=1,
+                sort_keys=True,
+            )
+        os.replace(tmp_path, self.manifest_path)
+        return removed
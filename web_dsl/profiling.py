@@ -0,0 +1,187 @@
+import contextvars
+import json
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+# The profiler of the current CLI command / API request (if profiling)
+_active_profiler = contextvars.ContextVar("webdsl_profiler", default=None)
+
+# Profilers tracing memory in this process, and whether tracing was started
+# by them (rather than by e.g. python -X tracemalloc)
+_tracing_lock = threading.Lock()
+_tracing_profilers = 0
+_started_tracing = False
+
+
+def get_profiler():
+    return _active_profiler.get()
+
+
+def _start_tracing():
+    global _tracing_profilers, _started_tracing
+    with _tracing_lock:
+        if _tracing_profilers == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _tracing_profilers += 1
+
+
+def _stop_tracing():
+    global _tracing_profilers, _started_tracing
+    with _tracing_lock:
+        _tracing_profilers -= 1
+        if _tracing_profilers == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def profile_phase(name):
+    """
+    Returns a context manager that records `name` as a phase of the active
+    profiler, or a no-op context manager when nothing is being profiled.
+    """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        return nullcontext()
+    return profiler.phase(name)
+
+
+class PhaseStats:
+    """Accumulated wall time and peak traced memory of a (nested) phase."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.peak = 0
+        self.children = {}
+
+    def child(self, name):
+        stats = self.children.get(name)
+        if stats is None:
+            stats = self.children[name] = PhaseStats(name)
+        return stats
+
+    @property
+    def self_wall(self):
+        return max(self.wall - sum(c.wall for c in self.children.values()), 0.0)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "calls": self.calls,
+            "wall_ms": round(self.wall * 1e3, 3),
+            "self_ms": round(self.self_wall * 1e3, 3),
+            "peak_mb": round(self.peak / 2**20, 3),
+            "children": [c.to_dict() for c in self.children.values()],
+        }
+
+
+class Profiler:
+    """
+    Collects wall time and peak memory for the phases of a validation or
+    generation run. Phases with the same name under the same parent are
+    merged (e.g. every screen render adds to one 'render' phase).
+
+    tracemalloc traces the whole process, so the peak memory of a phase
+    includes what other threads allocated meanwhile. Profilers running at
+    the same time in one process (e.g. threads of the API) share the
+    tracing, and the peak of each also resets the peak of the others, so
+    their memory figures are only meaningful for one run at a time, as in
+    the CLI and the worker processes of the API.
+
+    Usage:
+        with Profiler() as profiler:
+            generate(model_path, gen_path)
+        print(profiler.format_table())
+    """
+
+    def __init__(self, name="total", trace_memory=True):
+        self.root = PhaseStats(name)
+        self.trace_memory = trace_memory
+        self._stack = []
+        self._token = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            _start_tracing()
+        self._token = _active_profiler.set(self)
+        self._root_phase = self.phase(self.root.name)
+        self._root_phase.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._root_phase.__exit__(exc_type, exc, tb)
+        _active_profiler.reset(self._token)
+        if self.trace_memory:
+            _stop_tracing()
+        return False
+
+    def _update_peak(self, stats):
+        if tracemalloc.is_tracing():
+            stats.peak = max(stats.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+    @contextmanager
+    def phase(self, name):
+        if self._stack:
+            stats = self._stack[-1].child(name)
+            # Close the parent's peak window before the child starts its own
+            self._update_peak(self._stack[-1])
+        else:
+            stats = self.root
+        self._stack.append(stats)
+        start = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            stats.wall += time.perf_counter() - start
+            stats.calls += 1
+            self._update_peak(stats)
+            self._stack.pop()
+            if self._stack:
+                parent = self._stack[-1]
+                parent.peak = max(parent.peak, stats.peak)
+
+    def to_dict(self):
+        return self.root.to_dict()
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def format_table(self):
+        rows = []
+
+        def collect(stats, depth):
+            rows.append(
+                (
+                    "  " * depth + stats.name,
+                    str(stats.calls),
+                    f"{stats.wall * 1e3:.1f}",
+                    f"{stats.self_wall * 1e3:.1f}",
+                    f"{stats.peak / 2**20:.2f}",
+                )
+            )
+            for child in stats.children.values():
+                collect(child, depth + 1)
+
+        collect(self.root, 0)
+        header = ("phase", "calls", "wall ms", "self ms", "peak MB")
+        widths = [max(len(r[i]) for r in rows + [header]) for i in range(len(header))]
+        lines = [
+            "  ".join(
+                h.ljust(w) if i == 0 else h.rjust(w)
+                for i, (h, w) in enumerate(zip(header, widths))
+            )
+        ]
+        lines.append("  ".join("-" * w for w in widths))
+        for row in rows:
+            lines.append(
+                "  ".join(
+                    c.ljust(w) if i == 0 else c.rjust(w)
+                    for i, (c, w) in enumerate(zip(row, widths))
+                )
+            )
+        return "\n".join(lines)
@@ -0,0 +1,104 @@
+import compileall
+import hashlib
+import json
+import os
+import shutil
+from functools import lru_cache
+from os.path import join
+
+from .definitions import TEMPLATES_PATH
+
+TEMPLATE_GROUPS = ("frontend", "backend", "transformations")
+COMPILED_TEMPLATES_PATH = join(TEMPLATES_PATH, "compiled")
+SOURCES_FILENAME = "sources.json"
+TEMPLATES_VERIFY_ENV = "WEBDSL_TEMPLATES_VERIFY"
+
+# The options affect the compiled code, so they are shared by all environments
+ENV_OPTIONS = {
+    "trim_blocks": True,
+    "lstrip_blocks": True,
+    "extensions": ["jinja2.ext.loopcontrols"],
+}
+
+
+def _verify_from_env():
+    return os.getenv(TEMPLATES_VERIFY_ENV, "1").lower() not in ("0", "false", "no")
+
+
+def source_fingerprint(group):
+    """Hashes of the template sources of a group and the Jinja2 version."""
+    import jinja2
+
+    source_dir = join(TEMPLATES_PATH, group)
+    sources = {}
+    for name in sorted(os.listdir(source_dir)):
+        if name.endswith(".jinja"):
+            with open(join(source_dir, name), "rb") as f:
+                sources[name] = hashlib.sha256(f.read()).hexdigest()
+    return {"jinja2": jinja2.__version__, "sources": sources}
+
+
+def is_bundle_fresh(group, compiled_path=COMPILED_TEMPLATES_PATH):
+    """Whether the precompiled bundle of a group matches its template sources."""
+    try:
+        with open(join(compiled_path, group, SOURCES_FILENAME), "r") as f:
+            compiled_fingerprint = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return compiled_fingerprint == source_fingerprint(group)
+
+
+def has_bundle(group, compiled_path=COMPILED_TEMPLATES_PATH):
+    return os.path.isfile(join(compiled_path, group, SOURCES_FILENAME))
+
+
+@lru_cache(maxsize=None)
+def get_template_env(group, verify=None):
+    """
+    Returns the Jinja2 environment of a template group ('frontend',
+    'backend' or 'transformations'). The environment is created once per
+    process and is shared by the generator and the transformations.
+
+    Templates precompiled with compile_templates() are loaded instead of
+    being compiled from source. Unless verify is False (or
+    WEBDSL_TEMPLATES_VERIFY=0), they are only used if they were compiled from
+    the current sources with the installed Jinja2 version.
+    """
+    from jinja2 import Environment, FileSystemLoader, ModuleLoader
+
+    if verify is None:
+        verify = _verify_from_env()
+    if has_bundle(group):
+        if not verify or is_bundle_fresh(group):
+            loader = ModuleLoader(join(COMPILED_TEMPLATES_PATH, group))
+            return Environment(loader=loader, **ENV_OPTIONS)
+        print(
+            f"Precompiled '{group}' templates are out of date, compiling from "
+            "source (run `webdsl templates compile`)"
+        )
+    loader = FileSystemLoader(join(TEMPLATES_PATH, group))
+    return Environment(loader=loader, **ENV_OPTIONS)
+
+
+def compile_templates(compiled_path=COMPILED_TEMPLATES_PATH, groups=TEMPLATE_GROUPS):
+    """Precompiles the templates of every group into Python modules and bytecode."""
+    from jinja2 import Environment, FileSystemLoader
+
+    for group in groups:
+        target = join(compiled_path, group)
+        shutil.rmtree(target, ignore_errors=True)
+        os.makedirs(target)
+        env = Environment(
+            loader=FileSystemLoader(join(TEMPLATES_PATH, group)), **ENV_OPTIONS
+        )
+        env.compile_templates(
+            target,
+            zip=None,
+            filter_func=lambda name: name.endswith(".jinja"),
+            ignore_errors=False,
+        )
+        compileall.compile_dir(target, quiet=1)
+        # Written last, so an interrupted compilation is never used
+        with open(join(target, SOURCES_FILENAME), "w") as f:
+            json.dump(source_fingerprint(group), f, indent=1)
+        print(f"Compiled '{group}' templates into {target}")
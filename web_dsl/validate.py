@@ -1,67 +1,88 @@
-from textx import get_children_of_type, TextXSemanticError
+from textx import TextXSemanticError
+from .model_index import ModelIndex, get_all_models
+from .profiling import profile_phase
+
+
+def get_main_model_index(model):
+    """
+    Returns an index of the objects contained in the main model file.
+    The index built by the model processor is reused unless it also covers
+    imported models.
+    """
+    index = getattr(model, "model_index", None)
+    if index is None or get_all_models(model) != [model]:
+        index = ModelIndex([model])
+    return index
 
 
 def validate_model(model, main_file):
     """Validates the model."""
 
-    validate_webpage(model, main_file)
+    with profile_phase("webpage"):
+        validate_webpage(model, main_file)
 
-    all_entities = get_children_of_type("Entity", model)
-    strict_entities = strict_entities = [e for e in all_entities if e.strict]
+    index = get_main_model_index(model)
+    all_entities = index.of_type("Entity")
+    strict_entities = {e for e in all_entities if e.strict}
 
-    all_components = get_children_of_type("Component", model)
-    components_referencing_strict_entities = [
-        c for c in all_components if c.entity and c.entity in strict_entities
-    ]
+    with profile_phase("strict components"):
+        all_components = index.of_type("Component")
+        components_referencing_strict_entities = [
+            c for c in all_components if c.entity and c.entity in strict_entities
+        ]
 
-    # Validate components with strict entities
-    errors = validate_components_with_strict_entities(
-        components_referencing_strict_entities
-    )
+        # Validate components with strict entities
+        errors = validate_components_with_strict_entities(
+            components_referencing_strict_entities
+        )
 
     # # Validate repetitions with strict entities
-    all_repetitions = get_children_of_type("Repetition", model)
-    for repetition in all_repetitions:
-        for entity in repetition.entities_list:
-            if entity and entity in strict_entities:
-                strict_entity_attributes = entity.attributes
-                strict_entity_attributes_names = [
-                    a.name for a in strict_entity_attributes
-                ]
-                # The first item is the entity name, the second is the attribute name
-                attribute_root = repetition.item[1]
-                if attribute_root not in strict_entity_attributes_names:
-                    errors.append(
-                        f"Repetition uses attribute '{attribute_root}' not allowed by strict entity '{entity.name}'"
-                    )
+    with profile_phase("strict repetitions"):
+        all_repetitions = index.of_type("Repetition")
+        for repetition in all_repetitions:
+            for entity in repetition.entities_list:
+                if entity and entity in strict_entities:
+                    strict_entity_attributes = entity.attributes
+                    strict_entity_attributes_names = [
+                        a.name for a in strict_entity_attributes
+                    ]
+                    # The first item is the entity name, the second is the attribute name
+                    attribute_root = repetition.item[1]
+                    if attribute_root not in strict_entity_attributes_names:
+                        errors.append(
+                            f"Repetition uses attribute '{attribute_root}' not allowed by strict entity '{entity.name}'"
+                        )
 
     # Validate conditions with strict entities
-    all_conditions = get_children_of_type("Condition", model)
-    for condition in all_conditions:
-        for entity in condition.entities_list:
-            if entity and entity in strict_entities:
-                strict_entity_attributes = entity.attributes
-                strict_entity_attributes_names = [
-                    a.name for a in strict_entity_attributes
-                ]
-                # Get the condition arrays that contain the name of the entity as the first item
-                condition_arrays = find_flat_primitive_lists(condition.condition)
-                for condition_array in condition_arrays:
-                    if condition_array and condition_array[0] == entity.name:
-                        # The first item is the entity name, the second is the attribute name
-                        attribute_root = condition_array[1]
-                        print(attribute_root)
-                        if attribute_root not in strict_entity_attributes_names:
-                            errors.append(
-                                f"Condition uses attribute '{attribute_root}' not allowed by strict entity '{entity.name}'"
-                            )
+    with profile_phase("strict conditions"):
+        all_conditions = index.of_type("Condition")
+        for condition in all_conditions:
+            for entity in condition.entities_list:
+                if entity and entity in strict_entities:
+                    strict_entity_attributes = entity.attributes
+                    strict_entity_attributes_names = [
+                        a.name for a in strict_entity_attributes
+                    ]
+                    # Get the condition arrays that contain the name of the entity as the first item
+                    condition_arrays = find_flat_primitive_lists(condition.condition)
+                    for condition_array in condition_arrays:
+                        if condition_array and condition_array[0] == entity.name:
+                            # The first item is the entity name, the second is the attribute name
+                            attribute_root = condition_array[1]
+                            print(attribute_root)
+                            if attribute_root not in strict_entity_attributes_names:
+                                errors.append(
+                                    f"Condition uses attribute '{attribute_root}' not allowed by strict entity '{entity.name}'"
+                                )
 
     # Validate CRUD table
-    all_crud_tables = get_children_of_type("CrudTable", model)
-    validate_crud_table(all_crud_tables, errors)
+    with profile_phase("crud tables"):
+        all_crud_tables = index.of_type("CrudTable")
+        validate_crud_table(all_crud_tables, errors)
 
     # Validate entities
-    errors = validate_entities(all_entities, errors)
+    with profile_phase("entities"):
+        errors = validate_entities(all_entities, errors)
     if errors:
         error_text = "\n".join(f" - {e}" for e in errors)
         raise TextXSemanticError(
@@ -107,25 +128,11 @@ def validate_components_with_strict_entities(components):
         if not getattr(component.entity, "strict", False):
             continue
 
-        # Collect all formatted attribute paths from the component type
-        attribute_paths = []
-
-        # Find all attributes that look like formatted paths (lists of mixed str/int)
-        for attr_name in dir(component.type):
-            if attr_name.startswith("_"):
-                continue
-            attr = getattr(component.type, attr_name)
-            if isinstance(attr, list) and all(isinstance(p, (int, str)) for p in attr):
-                attribute_paths.append(attr)
-            elif isinstance(attr, list) and all(
-                isinstance(p, list) and all(isinstance(e, (int, str)) for e in p)
-                for p in attr
-            ):
-                # This handles lists of paths, like yValues = [[0, 'temp'], [0, 'pressure']]
-                attribute_paths.extend(attr)
+        # Component types declare which of their attributes hold paths
+        attribute_paths = component.type.attribute_paths()
 
         strict_entity_attributes = component.entity.attributes
-        strict_entity_attributes_names = [a.name for a in strict_entity_attributes]
+        strict_entity_attributes_names = {a.name for a in strict_entity_attributes}
 
         for attribute in attribute_paths:
             if not attribute:  # skip empty lists
@@ -0,0 +1,136 @@
+import hashlib
+import os
+import time
+
+from .model_index import get_all_models
+
+# Seconds between two polls of the watched files
+WATCH_INTERVAL = 0.25
+
+
+def import_closure(model):
+    """Returns the files of a model and of every model it imports."""
+    return sorted(
+        os.path.abspath(m._tx_filename)
+        for m in get_all_models(model)
+        if getattr(m, "_tx_filename", None)
+    )
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _content_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class ModelWatcher:
+    """
+    Polls the files of a model's import closure. A file counts as changed
+    when its content changed, so saving a file without editing it (or
+    touching it) does not trigger a regeneration.
+    """
+
+    def __init__(self, files, interval=WATCH_INTERVAL):
+        self.interval = interval
+        self.stats = {}
+        self.hashes = {}
+        self.watch(files)
+
+    def watch(self, files):
+        """
+        Sets the watched files (e.g. after the imports of the model changed),
+        files that were already watched keep their last seen state.
+        """
+        stats, hashes = {}, {}
+        for path in files:
+            if path in self.stats:
+                stats[path], hashes[path] = self.stats[path], self.hashes[path]
+            else:
+                stats[path], hashes[path] = _stat(path), _content_hash(path)
+        self.stats, self.hashes = stats, hashes
+
+    def changed_files(self):
+        """Returns the watched files whose content changed since the last call."""
+        changed = []
+        for path, old_stat in self.stats.items():
+            new_stat = _stat(path)
+            if new_stat == old_stat:
+                continue
+            self.stats[path] = new_stat
+            digest = _content_hash(path)
+            if digest != self.hashes[path]:
+                self.hashes[path] = digest
+                changed.append(path)
+        return changed
+
+    def wait_for_changes(self):
+        """Blocks until files changed and stopped changing, returns them."""
+        while True:
+            time.sleep(self.interval)
+            changed = self.changed_files()
+            if changed:
+                break
+        # Editors often save in several writes, wait until they are done
+        while True:
+            time.sleep(self.interval)
+            more = self.changed_files()
+            if not more:
+                return changed
+            changed += [path for path in more if path not in changed]
+
+
+def _print_status(message, ok=None):
+    print(message)
+
+
+def watch_and_generate(
+    model_path, gen_path, use_cache=None, jobs=None, report=_print_status
+):
+    """
+    Generates the project of a model, then regenerates it whenever a file of
+    the model's import closure changes, until interrupted. report(message,
+    ok) is called after every run, with ok None for informational messages.
+
+    The process keeps the metamodel, the template environments and the base
+    project manifests between runs, so a regeneration only re-parses the
+    model and rewrites the output files whose content changed (see
+    web_dsl.output.DirectoryOutput).
+    """
+    from .generate import generate_from_model
+    from .language import build_model
+
+    model_path = os.path.abspath(model_path)
+    watcher = ModelWatcher([model_path])
+    changed = None
+    while True:
+        start = time.perf_counter()
+        try:
+            model = build_model(model_path, use_cache=use_cache)
+            # Files added to or removed from the imports are picked up here
+            watcher.watch(import_closure(model))
+            generate_from_model(model, gen_path, jobs=jobs)
+        except Exception as e:
+            # The files that were already watched stay watched, so fixing the
+            # error triggers the next run
+            report(f"✖ Generation error:\n{e}", False)
+        else:
+            elapsed = (time.perf_counter() - start) * 1e3
+            if changed is None:
+                report(f"✔ Generated in {elapsed:.0f} ms", True)
+            else:
+                names = ", ".join(os.path.basename(path) for path in changed)
+                report(
+                    f"✔ Regenerated after changes to {names} ({elapsed:.0f} ms)", True
+                )
+        report(f"Watching {len(watcher.stats)} files for changes...", None)
+        changed = watcher.wait_for_changes()